@@ -0,0 +1,136 @@
+"""
+Archivos estáticos con nombre por contenido. `python build_assets.py` copia
+cada archivo de STATIC_DIR a ASSETS_DIR como `nombre.<hash>.ext`, guarda al
+lado sus versiones .gz y .br y escribe manifest.json. Como el nombre cambia
+con el contenido, GET /assets/... se sirve con caché inmutable; las
+plantillas obtienen la URL con `asset_url("css/style.css")`.
+
+Sin build (desarrollo) `asset_url` devuelve la ruta bajo /static.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import urllib.request
+from typing import Optional
+
+import compression
+
+STATIC_DIR = "static"
+ASSETS_DIR = os.getenv("ASSETS_DIR", "dist")
+MANIFEST = "manifest.json"
+
+# Librerías de terceros que se sirven desde STATIC_DIR/vendor, nunca desde un CDN.
+# El build las descarga si faltan (vendor/ no se versiona) y falla si no puede.
+VENDOR = {
+    "vendor/chart.umd.min.js": "https://cdn.jsdelivr.net/npm/chart.js@4.4.7/dist/chart.umd.min.js",
+}
+
+EXTENSIONES = {"gzip": ".gz", "br": ".br"}
+# Tipos que ya vienen comprimidos (imágenes, fuentes) no se precomprimen
+_TIPOS_COMPRIMIBLES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+# nombre lógico -> {"archivo": nombre con hash, "codificaciones": [...]}
+_manifiesto: Optional[dict] = None
+# nombre con hash -> entrada del manifiesto
+_por_archivo: dict = {}
+
+
+def _comprimible(nombre: str) -> bool:
+    tipo = mimetypes.guess_type(nombre)[0] or ""
+    return tipo.startswith(_TIPOS_COMPRIMIBLES)
+
+
+def descargar_vendor(origen: str = STATIC_DIR) -> list:
+    """
+    Descarga las librerías de VENDOR que todavía no están en `origen`.
+    Devuelve las descargadas; lanza RuntimeError si alguna no se pudo obtener.
+    """
+    descargadas = []
+    for nombre, url in VENDOR.items():
+        ruta = os.path.join(origen, nombre)
+        if os.path.exists(ruta):
+            continue
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        try:
+            with urllib.request.urlopen(url, timeout=30) as respuesta, open(ruta + ".tmp", "wb") as f:
+                shutil.copyfileobj(respuesta, f)
+        except OSError as e:
+            if os.path.exists(ruta + ".tmp"):
+                os.remove(ruta + ".tmp")
+            raise RuntimeError(f"No se pudo descargar {nombre} de {url}: {e}. Cópialo a mano en {ruta}.")
+        os.replace(ruta + ".tmp", ruta)
+        descargadas.append(nombre)
+    return descargadas
+
+
+def construir(origen: str = STATIC_DIR, destino: str = ASSETS_DIR) -> dict:
+    """
+    Genera en `destino` los archivos con hash y sus versiones comprimidas, y
+    escribe el manifiesto. Los archivos de builds anteriores se conservan
+    para las páginas que todavía los referencian durante un despliegue.
+    """
+    manifiesto = {}
+    for carpeta, _, archivos in os.walk(origen):
+        for archivo in sorted(archivos):
+            ruta = os.path.join(carpeta, archivo)
+            nombre = os.path.relpath(ruta, origen).replace(os.sep, "/")
+            with open(ruta, "rb") as f:
+                datos = f.read()
+            base, ext = os.path.splitext(nombre)
+            con_hash = f"{base}.{hashlib.sha256(datos).hexdigest()[:12]}{ext}"
+            salida = os.path.join(destino, con_hash)
+            os.makedirs(os.path.dirname(salida), exist_ok=True)
+            with open(salida, "wb") as f:
+                f.write(datos)
+            versiones = compression.precomprimir(datos) if _comprimible(nombre) else {}
+            for codificacion, comprimido in versiones.items():
+                with open(salida + EXTENSIONES[codificacion], "wb") as f:
+                    f.write(comprimido)
+            manifiesto[nombre] = {"archivo": con_hash, "codificaciones": sorted(versiones)}
+    os.makedirs(destino, exist_ok=True)
+    with open(os.path.join(destino, MANIFEST), "w") as f:
+        json.dump(manifiesto, f, indent=2, sort_keys=True)
+    return manifiesto
+
+
+def cargar(destino: str = ASSETS_DIR) -> dict:
+    """Lee el manifiesto del build (vacío si no se ha ejecutado)."""
+    global _manifiesto, _por_archivo
+    try:
+        with open(os.path.join(destino, MANIFEST)) as f:
+            _manifiesto = json.load(f)
+    except FileNotFoundError:
+        _manifiesto = {}
+    _por_archivo = {entrada["archivo"]: entrada for entrada in _manifiesto.values()}
+    faltan = [n for n in VENDOR if n not in _manifiesto and not os.path.exists(os.path.join(STATIC_DIR, n))]
+    if faltan:
+        print(f"Faltan {', '.join(faltan)} en {STATIC_DIR}/: ejecuta python build_assets.py")
+    return _manifiesto
+
+
+def asset_url(nombre: str) -> str:
+    """URL pública de un archivo de STATIC_DIR (función global de las plantillas)."""
+    if _manifiesto is None:
+        cargar()
+    entrada = _manifiesto.get(nombre)
+    if entrada is not None:
+        return f"/assets/{entrada['archivo']}"
+    return f"/static/{nombre}"
+
+
+def archivo(ruta: str, accept_encoding: Optional[str]) -> Optional[tuple]:
+    """
+    (ruta en disco, content type, codificación o None) de GET /assets/{ruta}
+    según lo que acepta el cliente, o None si `ruta` no está en el manifiesto.
+    """
+    if _manifiesto is None:
+        cargar()
+    entrada = _por_archivo.get(ruta)
+    if entrada is None:
+        return None
+    tipo = mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+    codificacion = compression.elegir(accept_encoding, entrada["codificaciones"])
+    en_disco = os.path.join(ASSETS_DIR, ruta) + (EXTENSIONES[codificacion] if codificacion else "")
+    return en_disco, tipo, codificacion
@@ -0,0 +1,108 @@
+"""
+Mide (y comprueba) las operaciones masivas con más filas de las que caben
+en una sentencia, sobre productos que crea el propio benchmark:
+
+- PATCH /productos/bulk: actualizar_productos_masivo con MAX_PATCHES_MASIVOS patches
+- POST /productos/inventario: importar_inventario con un CSV de varios lotes
+- POST /compras/: registrar_compras con MAX_LINEAS_COMPRA líneas, y una
+  línea de más, que se debe rechazar sin aplicar nada
+
+Al terminar borra los productos, la categoría y las compras que creó.
+
+    python benchmarks/bench_bulk.py --productos 1200
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crud  # noqa: E402
+import database  # noqa: E402
+from models import Categoria, Compras, Producto  # noqa: E402
+from schemas import MAX_PATCHES_MASIVOS  # noqa: E402
+from sqlalchemy import delete, func  # noqa: E402
+from sqlmodel import select  # noqa: E402
+from sqlmodel.ext.asyncio.session import AsyncSession  # noqa: E402
+
+
+async def crear_productos(n: int) -> tuple:
+    """(id de categoría, ids de productos) creados para esta ejecución."""
+    async with AsyncSession(database.async_engine) as session:
+        categoria = Categoria(nombre=f"bench-bulk-{os.getpid()}")
+        session.add(categoria)
+        await session.flush()
+        productos = [Producto(nombre=f"bench-bulk-{i}", precio=10, stock=0, categoria_id=categoria.id) for i in range(n)]
+        session.add_all(productos)
+        await session.flush()
+        ids = [p.id for p in productos]
+        categoria_id = categoria.id
+        await session.commit()
+    return categoria_id, ids
+
+
+async def stock_total(ids: list) -> int:
+    async with AsyncSession(database.async_engine) as session:
+        return (await session.exec(select(func.sum(Producto.stock)).where(crud._id_en_lista(Producto.id, ids)))).one()
+
+
+async def borrar(categoria_id: int, ids: list):
+    async with AsyncSession(database.async_engine) as session:
+        await session.exec(delete(Compras).where(crud._id_en_lista(Compras.producto_id, ids)))
+        await session.exec(delete(Producto).where(Producto.categoria_id == categoria_id))
+        await session.exec(delete(Categoria).where(Categoria.id == categoria_id))
+        await session.commit()
+
+
+def medir(nombre: str, inicio: float, filas: int):
+    segundos = time.perf_counter() - inicio
+    print(f"{nombre:<28} {filas:6d} filas   {segundos * 1000:9.1f} ms   {filas / segundos:9.0f} filas/s", flush=True)
+
+
+async def main(productos: int):
+    database.async_engine.echo = False
+    await database.init_db()
+    categoria_id, ids = await crear_productos(productos)
+    try:
+        patches = [{"id": ids[i % len(ids)], "precio": 11 + i % 7, "stock": 5} for i in range(MAX_PATCHES_MASIVOS)]
+        inicio = time.perf_counter()
+        actualizados = await crud.actualizar_productos_masivo(patches)
+        medir("actualizar_productos_masivo", inicio, len(patches))
+        assert actualizados == len(ids), actualizados
+
+        csv = "producto_id,delta\n" + "".join(f"{ids[i % len(ids)]},1\n" for i in range(3 * len(ids)))
+        inicio = time.perf_counter()
+        modo, filas = crud.leer_csv_inventario(io.StringIO(csv))
+        reporte = await crud.importar_inventario(filas, modo)
+        medir("importar_inventario", inicio, 3 * len(ids))
+        assert await stock_total(ids) == 8 * len(ids), reporte
+
+        lineas = [{"producto_id": ids[i % len(ids)], "cantidad": 1} for i in range(crud.MAX_LINEAS_COMPRA)]
+        inicio = time.perf_counter()
+        reporte = await crud.registrar_compras(iter(lineas))
+        medir("registrar_compras", inicio, len(lineas))
+        assert reporte["lineas"] == len(lineas), reporte
+        assert await stock_total(ids) == 8 * len(ids) + len(lineas)
+
+        try:
+            await crud.registrar_compras(iter(lineas + lineas[:1]))
+            raise AssertionError("Se aceptaron más de MAX_LINEAS_COMPRA líneas")
+        except ValueError:
+            pass
+        assert await stock_total(ids) == 8 * len(ids) + len(lineas), "El lote rechazado dejó cambios"
+        print("comprobaciones ok", flush=True)
+    finally:
+        await borrar(categoria_id, ids)
+        await database.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Operaciones masivas contra DATABASE_URL.")
+    parser.add_argument("--productos", type=int, default=1200, help="Productos de prueba que se crean")
+    args = parser.parse_args()
+
+    print(f"Base de datos: {database.DATABASE_URL_ASYNC.split('://', 1)[0]}")
+    asyncio.run(main(args.productos))
@@ -0,0 +1,101 @@
+"""
+Compara el CPU que cuesta cada nivel de gzip y brotli con los bytes que
+ahorra, sobre respuestas típicas de la API (no necesita base de datos):
+
+- html: una página de /ventas/read con N ventas (ventas/_venta.html)
+- json: el listado de GET /productos/ con N productos
+- css: static/css/style.css
+
+Para cada nivel se mide la compresión de una vez (respuestas normales) y
+por bloques de 16 KB con flush (respuestas por partes, como /ventas/read).
+
+    python benchmarks/bench_compression.py --ventas 200 --productos 1000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jinja2  # noqa: E402
+
+import compression  # noqa: E402
+from schemas import VentaResponse  # noqa: E402
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NIVELES = {"gzip": (1, 4, 6, 9), "br": (1, 3, 4, 5, 6, 9, 11)}
+TAMANO_BLOQUE = 16 * 1024
+
+
+def html_ventas(n: int) -> bytes:
+    plantilla = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(os.path.join(RAIZ, "templates")), autoescape=True
+    ).get_template("ventas/_venta.html")
+    rnd = random.Random(1)
+    partes = []
+    for i in range(n):
+        venta = VentaResponse.model_validate({
+            "id": i + 1, "cliente_id": rnd.randint(1, 50), "total": round(rnd.uniform(5, 900), 2),
+            "canal_venta": rnd.choice(["presencial", "virtual"]),
+            "fecha_venta": datetime(2024, 1, 1) + timedelta(minutes=rnd.randint(0, 500000)),
+            "cliente": {"id": 1, "nombre": f"Cliente {rnd.randint(1, 50)}", "ciudad": rnd.choice(["Bogotá", "Cali", "Medellín"]), "canal": "web"},
+            "detalles": [
+                {"venta_id": i + 1, "producto_id": p, "cantidad": rnd.randint(1, 9), "precio_unitario": round(rnd.uniform(1, 200), 2),
+                 "producto": {"id": p, "nombre": f"Producto {p}", "precio": 10, "categoria_id": 1}}
+                for p in rnd.sample(range(1, 500), rnd.randint(1, 5))
+            ],
+        })
+        partes.append(plantilla.render(venta=venta))
+    return "".join(partes).encode()
+
+
+def json_productos(n: int) -> bytes:
+    rnd = random.Random(2)
+    return json.dumps([
+        {"id": i, "nombre": f"Producto {i}", "descripcion": rnd.choice([None, "Repuesto original", "Kit de mantenimiento"]),
+         "precio": round(rnd.uniform(1, 500), 2), "stock": rnd.randint(0, 1000), "activo": True,
+         "categoria_id": rnd.randint(1, 20), "media_thumb": None, "media_placeholder": None}
+        for i in range(1, n + 1)
+    ]).encode()
+
+
+def medir(funcion, repeticiones: int) -> tuple:
+    """(bytes del resultado, ms de CPU por llamada)."""
+    inicio = time.process_time()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return len(resultado), (time.process_time() - inicio) * 1000 / repeticiones
+
+
+def por_bloques(datos: bytes, codificacion: str, nivel: int) -> bytes:
+    compresor = compression.Compresor(codificacion, nivel)
+    partes = [compresor.comprimir(datos[i:i + TAMANO_BLOQUE]) for i in range(0, len(datos), TAMANO_BLOQUE)]
+    return b"".join(partes) + compresor.terminar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CPU contra bytes de gzip y brotli por nivel.")
+    parser.add_argument("--ventas", type=int, default=200, help="Ventas en la página HTML")
+    parser.add_argument("--productos", type=int, default=1000, help="Productos en el listado JSON")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(os.path.join(RAIZ, "static", "css", "style.css"), "rb") as f:
+        css = f.read()
+    cargas = {"html": html_ventas(args.ventas), "json": json_productos(args.productos), "css": css}
+
+    print(f"{'carga':<6}{'cod':<6}{'nivel':>6}{'bytes':>10}{'%':>7}{'ms CPU':>9}{'MB/s':>8}"
+          f"{'bytes bloques':>15}{'ms bloques':>12}")
+    for nombre, datos in cargas.items():
+        print(f"{nombre:<6}{'-':<6}{'-':>6}{len(datos):>10}{100:>7}{0:>9}{'-':>8}")
+        for codificacion in compression.disponibles():
+            for nivel in NIVELES[codificacion]:
+                tamano, ms = medir(lambda: compression.comprimir(datos, codificacion, nivel), args.repeticiones)
+                tamano_bloques, ms_bloques = medir(lambda: por_bloques(datos, codificacion, nivel), args.repeticiones)
+                mb_s = len(datos) / 1e6 / (ms / 1000) if ms else float("inf")
+                print(f"{nombre:<6}{codificacion:<6}{nivel:>6}{tamano:>10}{100 * tamano / len(datos):>7.1f}"
+                      f"{ms:>9.2f}{mb_s:>8.1f}{tamano_bloques:>15}{ms_bloques:>12.2f}", flush=True)
@@ -0,0 +1,126 @@
+"""
+Mide lecturas y escrituras concurrentes a través de crud:
+
+- lecturas: listado de productos y lectura de un producto
+- escrituras: restar_stock
+- mixto: las mismas lecturas mientras otras tareas escriben (con SQLite
+  muestra que las lecturas no esperan al escritor gracias a WAL)
+
+Usa la base de datos de DATABASE_URL, pero solo lee y escribe productos
+que crea el propio benchmark y que borra al terminar: el stock de los
+productos existentes no se toca.
+
+    python benchmarks/bench_db.py --concurrencia 20 --operaciones 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crud  # noqa: E402
+import database  # noqa: E402
+from models import Categoria, Producto  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+from sqlmodel.ext.asyncio.session import AsyncSession  # noqa: E402
+
+PRODUCTOS_PRUEBA = 200
+
+
+async def preparar() -> tuple:
+    """Crea la categoría y los productos de prueba. Devuelve (id de categoría, ids de productos)."""
+    await database.init_db()
+    async with AsyncSession(database.async_engine) as session:
+        categoria = Categoria(nombre=f"bench-{os.getpid()}")
+        session.add(categoria)
+        await session.flush()
+        productos = [
+            Producto(nombre=f"bench-{i}", precio=10 + i, stock=10 ** 9, categoria_id=categoria.id)
+            for i in range(PRODUCTOS_PRUEBA)
+        ]
+        session.add_all(productos)
+        await session.flush()
+        ids = [p.id for p in productos]
+        categoria_id = categoria.id
+        await session.commit()
+        return categoria_id, ids
+
+
+async def limpiar(categoria_id: int):
+    """Borra los productos y la categoría de prueba."""
+    async with AsyncSession(database.async_engine) as session:
+        await session.exec(delete(Producto).where(Producto.categoria_id == categoria_id))
+        await session.exec(delete(Categoria).where(Categoria.id == categoria_id))
+        await session.commit()
+
+
+async def leer(ids: list):
+    if random.random() < 0.5:
+        await crud.obtener_productos(campos=["id", "nombre", "precio", "stock"])
+    else:
+        await crud.obtener_producto(random.choice(ids))
+
+
+async def escribir(ids: list):
+    # `ids` son siempre productos creados por preparar()
+    await crud.restar_stock(random.choice(ids), 1)
+
+
+async def correr(operacion, ids: list, concurrencia: int, total: int) -> tuple:
+    """Ejecuta `total` operaciones con `concurrencia` tareas. Devuelve (segundos, latencias)."""
+    latencias = []
+    restantes = iter(range(total))
+
+    async def tarea():
+        for _ in restantes:
+            inicio = time.perf_counter()
+            await operacion(ids)
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(tarea() for _ in range(concurrencia)))
+    return time.perf_counter() - inicio, latencias
+
+
+def resumen(nombre: str, segundos: float, latencias: list):
+    latencias = sorted(latencias)
+    p99 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))]
+    print(f"{nombre:<22} {len(latencias) / segundos:9.0f} op/s   "
+          f"p50 {statistics.median(latencias) * 1000:7.2f} ms   p99 {p99 * 1000:7.2f} ms")
+
+
+async def main(concurrencia: int, operaciones: int):
+    database.async_engine.echo = False
+    categoria_id = None
+    try:
+        categoria_id, ids = await preparar()
+
+        resumen("lecturas", *await correr(leer, ids, concurrencia, operaciones))
+        resumen("escrituras", *await correr(escribir, ids, concurrencia, operaciones))
+
+        # Mitad de las tareas escriben mientras la otra mitad lee
+        mitad = max(1, concurrencia // 2)
+        (seg_l, lat_l), (seg_e, lat_e) = await asyncio.gather(
+            correr(leer, ids, mitad, operaciones),
+            correr(escribir, ids, mitad, operaciones // 4),
+        )
+        resumen("mixto: lecturas", seg_l, lat_l)
+        resumen("mixto: escrituras", seg_e, lat_e)
+    finally:
+        if categoria_id is not None:
+            await limpiar(categoria_id)
+        await database.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lecturas y escrituras concurrentes contra DATABASE_URL.")
+    parser.add_argument("--concurrencia", type=int, default=20, help="Tareas simultáneas")
+    parser.add_argument("--operaciones", type=int, default=2000, help="Operaciones por escenario")
+    args = parser.parse_args()
+
+    print(f"Base de datos: {database.DATABASE_URL_ASYNC.split('://', 1)[0]}")
+    asyncio.run(main(args.concurrencia, args.operaciones))
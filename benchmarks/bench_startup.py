@@ -0,0 +1,63 @@
+"""
+Mide el costo de arrancar un worker:
+
+- importar `main` en un intérprete nuevo (mediana de --runs procesos)
+- init_db revisando el catálogo (forzar=True) frente a init_db con la
+  huella del esquema ya guardada
+
+Usa la base de datos de DATABASE_URL. Se ejecuta desde la raíz del repo:
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def medir_import(runs: int) -> list:
+    tiempos = []
+    codigo = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    for _ in range(runs):
+        salida = subprocess.run(
+            [sys.executable, "-c", codigo], cwd=RAIZ, check=True, capture_output=True, text=True
+        )
+        tiempos.append(float(salida.stdout.strip().splitlines()[-1]))
+    return tiempos
+
+
+async def medir_init_db(runs: int) -> dict:
+    import database
+
+    database.async_engine.echo = False
+    resultados = {"completo": [], "con_huella": []}
+    for _ in range(runs):
+        for nombre, forzar in (("completo", True), ("con_huella", False)):
+            inicio = time.perf_counter()
+            await database.init_db(forzar=forzar)
+            resultados[nombre].append(time.perf_counter() - inicio)
+    await database.async_engine.dispose()
+    return resultados
+
+
+def resumen(nombre: str, tiempos: list):
+    print(f"{nombre:<24} mediana {statistics.median(tiempos) * 1000:8.1f} ms   "
+          f"min {min(tiempos) * 1000:8.1f} ms   max {max(tiempos) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiempo de arranque de la aplicación.")
+    parser.add_argument("--runs", type=int, default=5, help="Repeticiones de cada medición")
+    args = parser.parse_args()
+
+    print(f"Base de datos: {os.getenv('DATABASE_URL', '').split('://', 1)[0]}")
+    resumen("import main", medir_import(args.runs))
+    tiempos = asyncio.run(medir_init_db(args.runs))
+    resumen("init_db (catálogo)", tiempos["completo"])
+    resumen("init_db (huella)", tiempos["con_huella"])
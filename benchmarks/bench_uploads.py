@@ -0,0 +1,105 @@
+"""
+Mide el retraso del event loop mientras se suben imágenes en paralelo con
+supabase_utils.put_object. El almacenamiento se simula con un transporte
+de httpx que tarda --latencia segundos por subida: no usa la red ni
+necesita credenciales.
+
+Una tarea sonda duerme 10 ms en bucle y anota cuánto se pasa de ese tiempo.
+Se compara con la misma carga hecha de forma bloqueante (como hacía el
+cliente síncrono de supabase-py) para que se vea que la sonda detecta los
+bloqueos. Termina con código 1 si el p99 con subidas asíncronas supera
+--max-retraso-ms.
+
+    python benchmarks/bench_uploads.py --subidas 32 --tamano-kb 512
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://storage.invalid")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+import httpx  # noqa: E402
+
+import supabase_utils  # noqa: E402
+
+INTERVALO_SONDA = 0.01
+
+
+def cliente_simulado(latencia: float) -> httpx.AsyncClient:
+    async def responder(request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        await asyncio.sleep(latencia)
+        return httpx.Response(200, json={"Key": request.url.path})
+
+    return httpx.AsyncClient(base_url=f"{supabase_utils.SUPABASE_URL}/storage/v1", transport=httpx.MockTransport(responder))
+
+
+async def sonda(retrasos: list, fin: asyncio.Event):
+    """Anota cuánto tarda el loop en despertar después de cada espera de INTERVALO_SONDA."""
+    while not fin.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(INTERVALO_SONDA)
+        retrasos.append(time.perf_counter() - inicio - INTERVALO_SONDA)
+
+
+async def trozos(datos: bytes):
+    for i in range(0, len(datos), supabase_utils.UPLOAD_CHUNK_SIZE):
+        yield datos[i:i + supabase_utils.UPLOAD_CHUNK_SIZE]
+
+
+async def subir_async(n: int, datos: bytes, latencia: float):
+    await asyncio.gather(*(supabase_utils.put_object(f"bench/{i}.jpg", trozos(datos), "image/jpeg") for i in range(n)))
+
+
+async def subir_bloqueante(n: int, datos: bytes, latencia: float):
+    # Subidas secuenciales que bloquean el loop durante toda la petición
+    for _ in range(n):
+        time.sleep(latencia)
+
+
+async def escenario(nombre: str, subir, n: int, datos: bytes, latencia: float) -> float:
+    retrasos, fin = [], asyncio.Event()
+    tarea = asyncio.create_task(sonda(retrasos, fin))
+    await asyncio.sleep(INTERVALO_SONDA * 2)
+    inicio = time.perf_counter()
+    await subir(n, datos, latencia)
+    segundos = time.perf_counter() - inicio
+    fin.set()
+    await tarea
+    retrasos = sorted(retrasos) or [0.0]
+    p99 = retrasos[min(len(retrasos) - 1, int(len(retrasos) * 0.99))]
+    print(f"{nombre:<12} {n} subidas en {segundos * 1000:8.1f} ms   retraso del loop: "
+          f"p50 {statistics.median(retrasos) * 1000:6.2f} ms   p99 {p99 * 1000:7.2f} ms   "
+          f"máx {retrasos[-1] * 1000:7.2f} ms", flush=True)
+    return p99
+
+
+async def main(subidas: int, tamano_kb: int, latencia: float, max_retraso_ms: float) -> int:
+    supabase_utils._http_client = cliente_simulado(latencia)
+    datos = os.urandom(tamano_kb * 1024)
+    try:
+        p99 = await escenario("asíncrono", subir_async, subidas, datos, latencia)
+        await escenario("bloqueante", subir_bloqueante, min(subidas, 8), datos, latencia)
+    finally:
+        await supabase_utils.close_http_client()
+    if p99 * 1000 > max_retraso_ms:
+        print(f"El retraso p99 con subidas asíncronas supera {max_retraso_ms:g} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retraso del event loop durante subidas concurrentes.")
+    parser.add_argument("--subidas", type=int, default=32, help="Subidas simultáneas")
+    parser.add_argument("--tamano-kb", type=int, default=512, help="Tamaño de cada imagen")
+    parser.add_argument("--latencia", type=float, default=0.2, help="Segundos que tarda el almacenamiento simulado")
+    parser.add_argument("--max-retraso-ms", type=float, default=50, help="p99 máximo aceptado")
+    args = parser.parse_args()
+
+    print(f"MAX_CONCURRENT_UPLOADS={supabase_utils.MAX_CONCURRENT_UPLOADS}")
+    sys.exit(asyncio.run(main(args.subidas, args.tamano_kb, args.latencia, args.max_retraso_ms)))
@@ -0,0 +1,48 @@
+"""
+Ejecuta todos los benchmarks contra cada backend indicado. Por defecto solo
+usa una base SQLite temporal; DATABASE_URL no se usa nunca a menos que se
+pase explícitamente con --database-url:
+
+    python benchmarks/run_all.py
+    python benchmarks/run_all.py --database-url postgresql://... --database-url sqlite:///bench.db
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(DIRECTORIO)
+BENCHMARKS = ("bench_startup.py", "bench_db.py", "bench_bulk.py")
+# No usan la base de datos: se ejecutan una sola vez
+BENCHMARKS_SIN_BASE = ("bench_compression.py", "bench_uploads.py")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks contra uno o varios backends.")
+    parser.add_argument("--database-url", action="append", dest="urls",
+                        help="URL de base de datos (se puede repetir)")
+    args = parser.parse_args()
+
+    urls = args.urls
+    temporal = None
+    if not urls:
+        temporal = tempfile.TemporaryDirectory()
+        urls = [f"sqlite:///{os.path.join(temporal.name, 'bench.db')}"]
+
+    fallos = 0
+    for script in BENCHMARKS_SIN_BASE:
+        print(f"\n== {script} ==", flush=True)
+        fallos += subprocess.run([sys.executable, os.path.join(DIRECTORIO, script)], cwd=RAIZ).returncode != 0
+    for url in urls:
+        for script in BENCHMARKS:
+            print(f"\n== {script} ({url.split('://', 1)[0]}) ==", flush=True)
+            resultado = subprocess.run(
+                [sys.executable, os.path.join(DIRECTORIO, script)],
+                cwd=RAIZ, env={**os.environ, "DATABASE_URL": url},
+            )
+            fallos += resultado.returncode != 0
+    if temporal is not None:
+        temporal.cleanup()
+    sys.exit(1 if fallos else 0)
@@ -0,0 +1,13 @@
+import sys
+
+import assets
+
+if __name__ == "__main__":
+    try:
+        for nombre in assets.descargar_vendor():
+            print(f"Descargado {nombre}")
+    except RuntimeError as e:
+        # Sin las librerías de terceros el build no sirve: las páginas apuntarían a archivos inexistentes
+        sys.exit(f"Error: {e}")
+    manifiesto = assets.construir()
+    print(f"{len(manifiesto)} archivos en {assets.ASSETS_DIR}/ ({assets.MANIFEST}).")
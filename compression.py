@@ -0,0 +1,101 @@
+"""
+Compresión gzip/brotli de respuestas y negociación de Accept-Encoding.
+Las respuestas dinámicas se comprimen en compression_middleware.py.
+
+brotli es opcional: sin el paquete solo se ofrece gzip.
+"""
+import gzip
+import zlib
+from typing import Iterable, Optional
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli es opcional
+    brotli = None
+
+# Niveles para contenido que se comprime una sola vez (páginas y estáticos)
+GZIP_LEVEL_MAX = 9
+BROTLI_QUALITY_MAX = 11
+
+# Orden de preferencia cuando el cliente acepta varias
+CODIFICACIONES = ("br", "gzip")
+
+
+def disponibles() -> tuple:
+    """Codificaciones que este proceso puede producir."""
+    return CODIFICACIONES if brotli is not None else ("gzip",)
+
+
+def comprimir(datos: bytes, codificacion: str, nivel: Optional[int] = None) -> bytes:
+    """Comprime `datos` en una sola pasada (por defecto al nivel máximo)."""
+    if codificacion == "br":
+        return brotli.compress(datos, quality=BROTLI_QUALITY_MAX if nivel is None else nivel)
+    # mtime=0: la misma entrada produce siempre los mismos bytes
+    return gzip.compress(datos, GZIP_LEVEL_MAX if nivel is None else nivel, mtime=0)
+
+
+def precomprimir(datos: bytes) -> dict:
+    """
+    Devuelve {codificacion: bytes} con las versiones comprimidas de `datos`
+    que resultan más pequeñas que el original.
+    """
+    versiones = {}
+    for codificacion in disponibles():
+        comprimido = comprimir(datos, codificacion)
+        if len(comprimido) < len(datos):
+            versiones[codificacion] = comprimido
+    return versiones
+
+
+class Compresor:
+    """
+    Compresión por partes para respuestas que se envían por bloques: cada
+    bloque sale comprimido y vaciado (sync flush), así el cliente puede
+    descomprimirlo y mostrarlo sin esperar al final.
+    """
+
+    def __init__(self, codificacion: str, nivel: int):
+        self.codificacion = codificacion
+        if codificacion == "br":
+            self._compresor = brotli.Compressor(quality=nivel)
+        else:
+            # wbits 16+: cabecera y cola gzip en lugar de zlib
+            self._compresor = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def comprimir(self, datos: bytes) -> bytes:
+        if self.codificacion == "br":
+            return self._compresor.process(datos) + self._compresor.flush()
+        return self._compresor.compress(datos) + self._compresor.flush(zlib.Z_SYNC_FLUSH)
+
+    def terminar(self) -> bytes:
+        if self.codificacion == "br":
+            return self._compresor.finish()
+        return self._compresor.flush(zlib.Z_FINISH)
+
+
+def elegir(accept_encoding: Optional[str], ofrecidas: Iterable[str]) -> Optional[str]:
+    """
+    Elige la codificación de `ofrecidas` que prefiere el cliente según
+    Accept-Encoding (respetando q=0). None significa sin comprimir.
+    """
+    if not accept_encoding:
+        return None
+    aceptadas = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        calidad = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                calidad = float(parametros[2:])
+            except ValueError:
+                calidad = 0.0
+        aceptadas[nombre.strip().lower()] = calidad
+    ofrecidas = set(ofrecidas)
+    candidatas = [
+        c for c in CODIFICACIONES
+        if c in ofrecidas and aceptadas.get(c, aceptadas.get("*", 0)) > 0
+    ]
+    if not candidatas:
+        return None
+    return max(candidatas, key=lambda c: aceptadas.get(c, aceptadas.get("*", 0)))
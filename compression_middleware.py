@@ -0,0 +1,162 @@
+"""
+Compresión gzip/brotli de las respuestas dinámicas (middleware ASGI).
+
+- Respuestas de un solo bloque: se comprimen de una vez si miden al menos
+  COMPRESSION_MIN_SIZE bytes y si el resultado es más pequeño.
+- Respuestas por partes (StreamingResponse): cada bloque se comprime y
+  se envía en cuanto llega, sin esperar al final.
+- No se tocan las respuestas que ya traen Content-Encoding (páginas de
+  static_pages, /assets), los tipos ya comprimidos (imágenes, vídeo,
+  archivos comprimidos) ni las que piden Cache-Control: no-transform.
+
+Los niveles por defecto se pueden cambiar por ruta con @niveles(...).
+"""
+import asyncio
+import os
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+import compression
+
+# Respuestas más pequeñas no compensan la cabecera ni el CPU
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Niveles para contenido dinámico: se comprime en cada petición
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+# Cuerpos más grandes se comprimen en un hilo para no bloquear el event loop
+_MINIMO_EN_HILO = 256 * 1024
+
+# Content-Type que ya vienen comprimidos
+_TIPOS_COMPRIMIDOS = (
+    "image/", "video/", "audio/", "font/woff",
+    "application/zip", "application/gzip", "application/x-gzip",
+    "application/x-brotli", "application/octet-stream", "application/pdf",
+)
+
+
+def niveles(gzip: Optional[int] = None, br: Optional[int] = None, comprimir: bool = True):
+    """
+    Decorador de endpoint que cambia los niveles de compresión de esa ruta
+    (o la desactiva con comprimir=False). Va debajo de @app.get(...).
+    """
+    def decorador(endpoint):
+        endpoint.compresion = {"gzip": gzip, "br": br, "comprimir": comprimir}
+        return endpoint
+    return decorador
+
+
+def _comprimible(headers: Headers, status: int) -> bool:
+    if status < 200 or status in (204, 206, 304):
+        return False
+    if "content-encoding" in headers or "no-transform" in headers.get("cache-control", ""):
+        return False
+    tipo = headers.get("content-type", "")
+    if not tipo or tipo.startswith(_TIPOS_COMPRIMIDOS):
+        return tipo.startswith("image/svg")
+    return True
+
+
+class CompresionMiddleware:
+    def __init__(self, app, minimo: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimo = minimo
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        codificacion = compression.elegir(Headers(scope=scope).get("accept-encoding"), compression.disponibles())
+        if codificacion is None:
+            await self.app(scope, receive, send)
+            return
+        await _Respuesta(self, scope, codificacion, send).ejecutar(receive)
+
+
+class _Respuesta:
+    """Estado de la compresión de una respuesta."""
+
+    def __init__(self, middleware: CompresionMiddleware, scope, codificacion: str, send):
+        self.app = middleware.app
+        self.minimo = middleware.minimo
+        self.scope = scope
+        self.codificacion = codificacion
+        self.send = send
+        self.inicio = None
+        self.nivel = None
+        # Se crea con el primer bloque de una respuesta por partes
+        self.compresor = None
+        # True si la respuesta se envía tal cual
+        self.pasar = False
+
+    async def ejecutar(self, receive):
+        await self.app(self.scope, receive, self.enviar)
+
+    def _nivel(self) -> Optional[int]:
+        # El router deja el endpoint en el scope antes de que la respuesta empiece
+        opciones = getattr(self.scope.get("endpoint"), "compresion", None) or {}
+        if opciones.get("comprimir") is False:
+            return None
+        nivel = opciones.get(self.codificacion)
+        if nivel is None:
+            nivel = BROTLI_QUALITY if self.codificacion == "br" else GZIP_LEVEL
+        return nivel
+
+    def _cabeceras(self, longitud: Optional[int] = None) -> dict:
+        """Mensaje http.response.start con las cabeceras de la respuesta comprimida."""
+        self.inicio["headers"] = list(self.inicio["headers"])
+        headers = MutableHeaders(scope=self.inicio)
+        headers["Content-Encoding"] = self.codificacion
+        headers.add_vary_header("Accept-Encoding")
+        if longitud is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(longitud)
+        # La representación comprimida ya no es byte a byte la del ETag original
+        etag = headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+        return self.inicio
+
+    async def enviar(self, mensaje):
+        tipo = mensaje["type"]
+        if tipo == "http.response.start":
+            headers = Headers(raw=mensaje["headers"])
+            self.inicio = mensaje
+            longitud = headers.get("content-length")
+            self.nivel = self._nivel()
+            self.pasar = (
+                self.nivel is None
+                or not _comprimible(headers, mensaje["status"])
+                or (longitud is not None and int(longitud) < self.minimo)
+            )
+            if self.pasar:
+                await self.send(mensaje)
+            return
+        if tipo != "http.response.body" or self.pasar:
+            await self.send(mensaje)
+            return
+
+        cuerpo = mensaje.get("body", b"")
+        mas = mensaje.get("more_body", False)
+        if self.compresor is None:
+            if not mas:
+                # Respuesta de un solo bloque: se decide con el tamaño real
+                comprimido = None
+                if len(cuerpo) >= _MINIMO_EN_HILO:
+                    comprimido = await asyncio.to_thread(compression.comprimir, cuerpo, self.codificacion, self.nivel)
+                elif len(cuerpo) >= self.minimo:
+                    comprimido = compression.comprimir(cuerpo, self.codificacion, self.nivel)
+                if comprimido is None or len(comprimido) >= len(cuerpo):
+                    await self.send(self.inicio)
+                    await self.send(mensaje)
+                    return
+                await self.send(self._cabeceras(len(comprimido)))
+                await self.send({"type": "http.response.body", "body": comprimido})
+                return
+            self.compresor = compression.Compresor(self.codificacion, self.nivel)
+            await self.send(self._cabeceras())
+        datos = self.compresor.comprimir(cuerpo) if cuerpo else b""
+        if not mas:
+            datos += self.compresor.terminar()
+        await self.send({"type": "http.response.body", "body": datos, "more_body": mas})
@@ -1,22 +1,218 @@
+import asyncio
+import base64
+import csv
+import itertools
+import json
 from sqlmodel import select, SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
-from models import Categoria, Producto, Cliente, Venta, DetalleVenta 
-from database import async_engine
+from models import Categoria, Producto, Cliente, Venta, DetalleVenta, Compras, MediaObjeto
+from schemas import CategoriaResponse, ClienteResponse, ProductoEnCategoria, VentaResponse
+from database import async_engine, escritura, sesion_escritura
+from image_variants import VARIANT_WIDTHS
 from datetime import datetime
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import selectinload
-from typing import Optional, List
-from sqlalchemy import and_, or_ 
+from sqlalchemy.orm import selectinload, load_only, make_transient_to_detached
+from sqlalchemy.orm.exc import StaleDataError
+from typing import Any, Callable, Optional, List
+from sqlalchemy import and_, or_, any_, bindparam, ARRAY, Integer, update, insert, values, column, literal, union_all, func, case, null, delete
+from sqlalchemy import select as sa_select
+
+# =======================================================================
+# 🔖 Cursores de paginación
+# =======================================================================
+
+def _codificar_cursor(datos: dict) -> str:
+    """Codifica la posición de una página como un token opaco para el cliente."""
+    return base64.urlsafe_b64encode(json.dumps(datos, default=str).encode()).decode()
+
+def _decodificar_cursor(cursor: Optional[str]) -> dict:
+    """Decodifica un cursor generado por `_codificar_cursor`. Lanza ValueError si es inválido."""
+    if not cursor:
+        return {}
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if not isinstance(datos, dict):
+        raise ValueError("Cursor inválido")
+    return datos
+
+# =======================================================================
+# 🧩 Campos parciales (fields=)
+# =======================================================================
+
+def _columnas(modelo, campos: List[str]):
+    """Atributos de columna de `modelo` que aparecen en `campos` (ignora relaciones)."""
+    return [getattr(modelo, c) for c in campos if c in modelo.model_fields] or [modelo.id]
+
+def _campos_dict(obj, campos: List[str]) -> dict:
+    """Serializa solo las columnas pedidas de un objeto cargado con load_only."""
+    return {c: getattr(obj, c) for c in campos if c in type(obj).model_fields}
+
+# =======================================================================
+# 🖼️ Imágenes: variantes e índice por contenido
+# =======================================================================
+
+# Ancho de la variante que se devuelve como miniatura en los listados
+ANCHO_MINIATURA = min(VARIANT_WIDTHS)
+CAMPOS_MINIATURA = ("media_thumb", "media_placeholder")
+
+def _miniatura(variantes: Optional[dict]) -> dict:
+    """Campos media_thumb y media_placeholder de un listado a partir de media_variantes."""
+    variantes = variantes or {}
+    return {"media_thumb": variantes.get(str(ANCHO_MINIATURA)), "media_placeholder": variantes.get("placeholder")}
+
+def _al_cambiar_media(obj, cambios: dict):
+    """Descarta las variantes de `obj` cuando se reemplaza su imagen."""
+    if "media_url" in cambios and cambios["media_url"] != obj.media_url:
+        obj.media_variantes = None
+        # Una imagen asignada a mano reemplaza a la que se estaba subiendo
+        obj.media_status = None
+
+async def guardar_variantes(modelo, id: int, media_url: str, variantes: dict) -> bool:
+    """
+    Guarda las variantes generadas para `media_url`. No hace nada si el
+    registro ya tiene otra imagen (se subió una nueva mientras se generaban).
+    """
+    stmt = (
+        update(modelo)
+        .where(modelo.id == id, modelo.media_url == media_url)
+        .values(media_variantes=variantes)
+        .execution_options(synchronize_session=False)
+    )
+    async with sesion_escritura() as session:
+        result = await session.exec(stmt)
+        await session.commit()
+        return result.rowcount > 0
+
+async def obtener_media_por_hash(sha256: str) -> Optional[MediaObjeto]:
+    """Objeto ya subido con este contenido, si existe."""
+    async with AsyncSession(async_engine) as session:
+        return await session.get(MediaObjeto, sha256)
+
+async def obtener_media_por_key(key: str) -> Optional[MediaObjeto]:
+    async with AsyncSession(async_engine) as session:
+        result = await session.exec(select(MediaObjeto).where(MediaObjeto.key == key))
+        return result.first()
+
+async def registrar_media(sha256: str, key: str, tamano: int, content_type: Optional[str] = None):
+    """Agrega un objeto al índice; si otra subida del mismo contenido ganó la carrera, no hace nada."""
+    async with sesion_escritura() as session:
+        session.add(MediaObjeto(sha256=sha256, key=key, tamano=tamano, content_type=content_type))
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+
+async def guardar_variantes_media(key: str, variantes: dict):
+    """Recuerda las variantes de un objeto para reutilizarlas si se vuelve a subir."""
+    stmt = (
+        update(MediaObjeto)
+        .where(MediaObjeto.key == key)
+        .values(variantes=variantes)
+        .execution_options(synchronize_session=False)
+    )
+    async with sesion_escritura() as session:
+        await session.exec(stmt)
+        await session.commit()
+
+async def completar_media(modelo, id: int, media_url: str) -> bool:
+    """
+    Asocia la imagen subida en segundo plano. Solo se aplica si el registro
+    sigue esperándola (no se le asignó otra imagen mientras tanto).
+    """
+    stmt = (
+        update(modelo)
+        .where(modelo.id == id, modelo.media_status == "pending")
+        .values(media_url=media_url, media_status=None, media_variantes=None)
+        .execution_options(synchronize_session=False)
+    )
+    async with sesion_escritura() as session:
+        result = await session.exec(stmt)
+        await session.commit()
+        return result.rowcount > 0
+
+async def marcar_media_fallida(modelo, id: int):
+    stmt = (
+        update(modelo)
+        .where(modelo.id == id, modelo.media_status == "pending")
+        .values(media_status="failed")
+        .execution_options(synchronize_session=False)
+    )
+    async with sesion_escritura() as session:
+        await session.exec(stmt)
+        await session.commit()
+
+async def media_referenciadas(urls: List[str], eliminados_desde: datetime) -> set:
+    """
+    URLs de `urls` usadas como media_url por categorías, productos o clientes
+    vigentes, o eliminados (soft delete) después de `eliminados_desde`.
+    """
+    if not urls:
+        return set()
+    encontradas = set()
+    async with AsyncSession(async_engine) as session:
+        for modelo in (Categoria, Producto, Cliente):
+            query = select(modelo.media_url).where(
+                modelo.media_url.in_(urls),
+                or_(modelo.deleted_at == None, modelo.deleted_at >= eliminados_desde),
+            )
+            encontradas.update((await session.exec(query)).all())
+    return encontradas
+
+async def olvidar_media(keys: List[str]):
+    """Quita objetos del índice por contenido (antes de borrarlos del almacenamiento)."""
+    if not keys:
+        return
+    async with sesion_escritura() as session:
+        await session.exec(delete(MediaObjeto).where(MediaObjeto.key.in_(keys)))
+        await session.commit()
+
+def _id_en_lista(columna, ids: List[int]):
+    """
+    Condición `columna IN ids`. En Postgres se envía como un solo parámetro
+    de arreglo (`= ANY(:ids)`), así la sentencia es la misma sin importar
+    cuántos ids lleguen y asyncpg reutiliza el statement preparado.
+    """
+    if async_engine.dialect.name == "postgresql":
+        return columna == any_(bindparam("ids", ids, type_=ARRAY(Integer)))
+    return columna.in_(ids)
+
+# Límites de una sola sentencia: SQLite rechaza un UNION ALL de más de 500
+# SELECT y asyncpg no envía más de 32767 parámetros
+MAX_SELECT_COMPUESTO_SQLITE = 500
+MAX_PARAMETROS = 32000
+
+def _filas_por_sentencia(columnas: int) -> int:
+    """Filas de `columnas` valores que caben en una `_tabla_valores` con el motor actual."""
+    filas = MAX_PARAMETROS // columnas
+    if async_engine.dialect.name != "postgresql":
+        filas = min(filas, MAX_SELECT_COMPUESTO_SQLITE)
+    return filas
+
+def _tabla_valores(nombre: str, columnas: List, filas: List[tuple]):
+    """
+    Tabla en línea con `filas` para usar en UPDATE ... FROM. En Postgres es
+    `(VALUES ...) AS nombre (col, ...)`; otros motores no aceptan alias de
+    columnas sobre VALUES, así que se arma con SELECT ... UNION ALL.
+    """
+    if async_engine.dialect.name == "postgresql":
+        return values(*columnas, name=nombre).data(filas)
+    selects = [
+        sa_select(*[literal(valor, type_=col.type).label(col.name) for col, valor in zip(columnas, fila)])
+        for fila in filas
+    ]
+    return union_all(*selects).subquery(nombre)
 
 # =======================================================================
 # 📦 Funciones CRUD para Categoria
 # =======================================================================
 
-async def crear_categoria(categoria_data):
+async def crear_categoria(categoria_data, media_status: Optional[str] = None):
     try:
         categoria_dict = categoria_data.dict()
-        categoria = Categoria(**categoria_dict)
-        async with AsyncSession(async_engine) as session:
+        categoria = Categoria(**categoria_dict, media_status=media_status)
+        async with sesion_escritura() as session:
             session.add(categoria)
             await session.commit()
             await session.refresh(categoria)
@@ -47,7 +243,7 @@ async def obtener_categoria(id: int):
         return categoria
     
 async def eliminar_categoria(id: int):
-    async with AsyncSession(async_engine) as session:
+    async with sesion_escritura() as session:
         # 1. Cargar la categoría CON sus productos
         result = await session.exec(
             select(Categoria)
@@ -71,46 +267,70 @@ async def eliminar_categoria(id: int):
         
         return False
 
-async def obtener_categoria_con_productos(id: int):
+async def obtener_categoria_con_productos(id: int, cursor: Optional[str] = None, limite: int = 50):
+    """
+    Obtiene una categoría con una página de sus productos no eliminados.
+    El filtro de eliminados se hace en SQL y los productos se paginan por id;
+    la categoría se devuelve una sola vez y no se repite en cada producto.
+    """
+    posicion = _decodificar_cursor(cursor)
+    try:
+        despues_de = int(posicion.get("id", 0))
+    except (TypeError, ValueError):
+        raise ValueError("Cursor inválido")
+
     async with AsyncSession(async_engine) as session:
-        result = await session.exec(select(Categoria).where(Categoria.id == id, Categoria.deleted_at == None).options(selectinload(Categoria.productos)))
+        result = await session.exec(select(Categoria).where(Categoria.id == id, Categoria.deleted_at == None))
         categoria = result.first()
-        if categoria:
-            # Devolver como dict para evitar lazy loading issues
-            return {
-                "id": categoria.id,
-                "nombre": categoria.nombre,
-                "descripcion": categoria.descripcion,
-                "activa": categoria.activa,
-                "media_url": categoria.media_url,
-                "productos": [
-                    {
-                        "id": p.id,
-                        "nombre": p.nombre,
-                        "descripcion": p.descripcion,
-                        "precio": p.precio,
-                        "stock": p.stock,
-                        "activo": p.activo,
-                        "categoria_id": p.categoria_id,
-                        "media_url": p.media_url,
-                        "categoria": {
-                            "id": categoria.id,
-                            "nombre": categoria.nombre,
-                            "descripcion": categoria.descripcion,
-                            "activa": categoria.activa
-                        }
-                    } for p in categoria.productos if p.deleted_at is None
-                ]
-            }
-        return None
+        if not categoria:
+            return None
+
+        query = (
+            select(Producto)
+            .where(Producto.categoria_id == id, Producto.deleted_at == None, Producto.id > despues_de)
+            .order_by(Producto.id)
+            .limit(limite + 1)
+        )
+        result = await session.exec(query)
+        productos = result.all()
+
+    next_cursor = None
+    if len(productos) > limite:
+        productos = productos[:limite]
+        next_cursor = _codificar_cursor({"id": productos[-1].id})
+
+    # Devolver como dict para evitar lazy loading issues
+    return {
+        "id": categoria.id,
+        "nombre": categoria.nombre,
+        "descripcion": categoria.descripcion,
+        "activa": categoria.activa,
+        "media_url": categoria.media_url,
+        "media_variantes": categoria.media_variantes,
+        "productos": [
+            {
+                "id": p.id,
+                "nombre": p.nombre,
+                "descripcion": p.descripcion,
+                "precio": p.precio,
+                "stock": p.stock,
+                "activo": p.activo,
+                "categoria_id": p.categoria_id,
+                "media_url": p.media_url,
+                **_miniatura(p.media_variantes),
+            } for p in productos
+        ],
+        "next_cursor": next_cursor
+    }
     
     
 async def actualizar_categoria(id: int, categoria_update):
-    async with AsyncSession(async_engine) as session:
+    async with sesion_escritura() as session:
         result = await session.exec(select(Categoria).where(Categoria.id == id, Categoria.deleted_at == None))
         categoria = result.first()
         if categoria:
             update_data = categoria_update.dict(exclude_unset=True)
+            _al_cambiar_media(categoria, update_data)
             for key, value in update_data.items():
                 setattr(categoria, key, value)
             await session.commit()
@@ -119,7 +339,7 @@ async def actualizar_categoria(id: int, categoria_update):
         return None
     
 async def desactivar_categoria(id: int):
-    async with AsyncSession(async_engine) as session:
+    async with sesion_escritura() as session:
         result = await session.exec(select(Categoria).where(Categoria.id == id, Categoria.deleted_at == None))
         categoria = result.first()
         if categoria:
@@ -133,10 +353,10 @@ async def desactivar_categoria(id: int):
 # 🏷️ Funciones CRUD para Producto
 # =======================================================================
         
-async def crear_producto(producto_data):
+async def crear_producto(producto_data, media_status: Optional[str] = None):
     try:
-        producto = Producto(**producto_data.dict())
-        async with AsyncSession(async_engine) as session:
+        producto = Producto(**producto_data.dict(), media_status=media_status)
+        async with sesion_escritura() as session:
             session.add(producto)
             await session.commit()
             await session.refresh(producto)
@@ -145,7 +365,7 @@ async def crear_producto(producto_data):
         print(f"Error creando producto: {e}")
         return None
 
-async def obtener_productos(
+def _filtros_producto(
     id: Optional[int] = None,
     nombre: Optional[str] = None,
     precio: Optional[float] = None,
@@ -157,47 +377,242 @@ async def obtener_productos(
     stock_max: Optional[int] = None,
     activo: Optional[bool] = None
 ):
-    async with AsyncSession(async_engine) as session:
-        query = select(Producto, Categoria.nombre.label("categoria_nombre")).join(Categoria).where(Producto.deleted_at == None)
+    """Condiciones WHERE de los filtros de productos (compartidas por listados y operaciones masivas)."""
+    condiciones = []
+    if id is not None:
+        condiciones.append(Producto.id == id)
+    if nombre is not None:
+        condiciones.append(Producto.nombre.ilike(f"%{nombre}%"))
+    if precio is not None:
+        condiciones.append(Producto.precio == precio)
+    elif precio_min is not None or precio_max is not None:
+        if precio_min is not None and precio_max is not None:
+            condiciones.append(and_(Producto.precio >= precio_min, Producto.precio <= precio_max))
+        elif precio_min is not None:
+            condiciones.append(Producto.precio >= precio_min)
+        elif precio_max is not None:
+            condiciones.append(Producto.precio <= precio_max)
+    if categoria_id is not None:
+        condiciones.append(Producto.categoria_id == categoria_id)
+    if stock is not None:
+        condiciones.append(Producto.stock == stock)
+    elif stock_min is not None or stock_max is not None:
+        if stock_min is not None and stock_max is not None:
+            condiciones.append(and_(Producto.stock >= stock_min, Producto.stock <= stock_max))
+        elif stock_min is not None:
+            condiciones.append(Producto.stock >= stock_min)
+        elif stock_max is not None:
+            condiciones.append(Producto.stock <= stock_max)
+    if activo is not None:
+        condiciones.append(Producto.activo == activo)
+    return condiciones
 
-        # Aplicar filtros dinámicos
-        if id is not None:
-            query = query.where(Producto.id == id)
-        if nombre is not None:
-            query = query.where(Producto.nombre.ilike(f"%{nombre}%")) 
-        if precio is not None:
-            query = query.where(Producto.precio == precio)
-        elif precio_min is not None or precio_max is not None:
-            if precio_min is not None and precio_max is not None:
-                query = query.where(and_(Producto.precio >= precio_min, Producto.precio <= precio_max))
-            elif precio_min is not None:
-                query = query.where(Producto.precio >= precio_min)
-            elif precio_max is not None:
-                query = query.where(Producto.precio <= precio_max)
-        if categoria_id is not None:
-            query = query.where(Producto.categoria_id == categoria_id)
-        if stock is not None:
-            query = query.where(Producto.stock == stock)
-        elif stock_min is not None or stock_max is not None:
-            if stock_min is not None and stock_max is not None:
-                query = query.where(and_(Producto.stock >= stock_min, Producto.stock <= stock_max))
-            elif stock_min is not None:
-                query = query.where(Producto.stock >= stock_min)
-            elif stock_max is not None:
-                query = query.where(Producto.stock <= stock_max)
-        if activo is not None:
-            query = query.where(Producto.activo == activo)
+def _consulta_productos(campos: Optional[List[str]] = None, columnas: Optional[List[str]] = None, **filtros):
+    """SELECT del listado de productos (lo usan obtener_productos y el precalentamiento)."""
+    if campos is None:
+        query = select(Producto, Categoria.nombre.label("categoria_nombre")).join(Categoria)
+    elif "categoria" in campos:
+        query = select(Producto, Categoria.nombre.label("categoria_nombre")).join(Categoria)
+        query = query.options(load_only(*_columnas(Producto, columnas)))
+    else:
+        query = select(Producto).options(load_only(*_columnas(Producto, columnas)))
+    query = query.where(Producto.deleted_at == None)
+
+    # Aplicar filtros dinámicos
+    return query.where(*_filtros_producto(**filtros))
 
+async def obtener_productos(
+    id: Optional[int] = None,
+    nombre: Optional[str] = None,
+    precio: Optional[float] = None,
+    precio_min: Optional[float] = None,
+    precio_max: Optional[float] = None,
+    categoria_id: Optional[int] = None,
+    stock: Optional[int] = None,
+    stock_min: Optional[int] = None,
+    stock_max: Optional[int] = None,
+    activo: Optional[bool] = None,
+    campos: Optional[List[str]] = None
+):
+    """
+    Obtiene productos activos con filtros opcionales. Si se indica `campos`,
+    solo se leen esas columnas y la categoría solo se une si se pide.
+    """
+    miniatura = [c for c in campos or [] if c in CAMPOS_MINIATURA]
+    columnas = campos + ["media_variantes"] if miniatura else campos
+    async with AsyncSession(async_engine) as session:
+        query = _consulta_productos(
+            campos, columnas,
+            id=id, nombre=nombre, precio=precio, precio_min=precio_min, precio_max=precio_max,
+            categoria_id=categoria_id, stock=stock, stock_min=stock_min, stock_max=stock_max, activo=activo
+        )
         result = await session.exec(query)
         productos = result.all()
-        # Devolver productos con stock, precio, categoria
+        if campos is not None:
+            def parcial(producto):
+                datos = _campos_dict(producto, campos)
+                if miniatura:
+                    thumb = _miniatura(producto.media_variantes)
+                    datos.update({c: thumb[c] for c in miniatura})
+                return datos
+            if "categoria" not in campos:
+                return [parcial(producto) for producto in productos]
+            return [
+                {**parcial(producto), "categoria": categoria_nombre}
+                for producto, categoria_nombre in productos
+            ]
+        # Devolver productos con stock, precio, categoria y miniatura
         result_list = []
         for producto, categoria_nombre in productos:
             producto_dict = producto.dict()
             producto_dict['categoria'] = categoria_nombre
+            producto_dict.update(_miniatura(producto.media_variantes))
             result_list.append(producto_dict)
         return result_list
 
+async def obtener_productos_por_ids(ids: List[int]):
+    """
+    Obtiene varios productos (no eliminados) en una sola consulta. Devuelve
+    la lista en el mismo orden de `ids`, con None donde no se encontró el
+    producto, y la lista de ids no encontrados.
+    """
+    async with AsyncSession(async_engine) as session:
+        query = (
+            select(Producto, Categoria.nombre.label("categoria_nombre"))
+            .join(Categoria)
+            .where(_id_en_lista(Producto.id, ids), Producto.deleted_at == None)
+        )
+        result = await session.exec(query)
+        encontrados = {}
+        for producto, categoria_nombre in result.all():
+            producto_dict = producto.dict()
+            producto_dict['categoria'] = categoria_nombre
+            producto_dict.update(_miniatura(producto.media_variantes))
+            encontrados[producto.id] = producto_dict
+
+    return {
+        "productos": [encontrados.get(i) for i in ids],
+        "no_encontrados": [i for i in dict.fromkeys(ids) if i not in encontrados]
+    }
+
+# Columnas que se pueden modificar con actualizaciones masivas
+CAMPOS_ACTUALIZACION_MASIVA = ("nombre", "descripcion", "precio", "stock", "activo", "categoria_id", "media_url")
+
+async def _validar_categorias(session, ids: List[int]):
+    """Lanza ValueError si alguna categoría no existe o está eliminada."""
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return
+    result = await session.exec(
+        select(Categoria.id).where(_id_en_lista(Categoria.id, ids), Categoria.deleted_at == None)
+    )
+    validas = set(result.all())
+    invalidas = [i for i in ids if i not in validas]
+    if invalidas:
+        raise ValueError(f"Categorías inexistentes o eliminadas: {', '.join(str(i) for i in invalidas)}")
+
+async def actualizar_productos_masivo(patches: List[dict]) -> int:
+    """
+    Aplica una lista de cambios por id con `UPDATE producto ... FROM (VALUES ...)`,
+    en tantas sentencias como exija el límite de parámetros del motor y en
+    una sola transacción. Los campos en None no se modifican. Lanza
+    ValueError si algún `categoria_id` no es válido. Devuelve la cantidad
+    de filas afectadas.
+    """
+    # Un id repetido se combina; el último valor gana
+    por_id = {}
+    for patch in patches:
+        cambios = {k: v for k, v in patch.items() if v is not None}
+        por_id.setdefault(patch["id"], {}).update(cambios)
+
+    nombres = [c for c in CAMPOS_ACTUALIZACION_MASIVA if any(c in p for p in por_id.values())]
+    if not nombres:
+        return 0
+
+    tabla = Producto.__table__
+    columnas = [column("id", Integer)] + [column(c, tabla.c[c].type) for c in nombres]
+    filas = [(id, *[p.get(c) for c in nombres]) for id, p in por_id.items()]
+    tamano = _filas_por_sentencia(len(columnas))
+
+    async with sesion_escritura() as session:
+        await _validar_categorias(session, [p["categoria_id"] for p in por_id.values() if "categoria_id" in p])
+        actualizados = 0
+        # Un UPDATE por tramo que quepa en una sentencia, todos en la misma transacción
+        for inicio in range(0, len(filas), tamano):
+            v = _tabla_valores("v", columnas, filas[inicio:inicio + tamano])
+            cambios = {c: func.coalesce(v.c[c], getattr(Producto, c)) for c in nombres}
+            if "media_url" in nombres:
+                # Las variantes de una imagen reemplazada ya no sirven
+                cambios["media_variantes"] = case(
+                    (or_(v.c.media_url == None, v.c.media_url == Producto.media_url), Producto.media_variantes),
+                    else_=null(),
+                )
+            stmt = (
+                update(Producto)
+                .where(Producto.id == v.c.id, Producto.deleted_at == None)
+                .values(cambios)
+                .execution_options(synchronize_session=False)
+            )
+            result = await session.exec(stmt)
+            actualizados += result.rowcount
+        await session.commit()
+        return actualizados
+
+def _expresion_numerica(columna, op: str, valor: float):
+    if op == "multiplicar":
+        return columna * valor
+    if isinstance(columna.type, Integer):
+        valor = int(valor)
+    if op == "sumar":
+        return columna + valor
+    return literal(valor, type_=columna.type)
+
+async def actualizar_productos_por_filtro(filtro: dict, cambios: dict) -> int:
+    """
+    Actualiza todos los productos que cumplen `filtro` (mismos filtros que
+    `obtener_productos`) en una sola sentencia UPDATE. `precio` y `stock`
+    aceptan expresiones {"op": "set"|"multiplicar"|"sumar", "valor": x};
+    las filas cuyo resultado quedaría inválido (precio <= 0 o stock < 0) no
+    se modifican. Lanza ValueError si `categoria_id` no es válido. Devuelve
+    la cantidad de filas afectadas.
+    """
+    valores = {}
+    condiciones = [Producto.deleted_at == None, *_filtros_producto(**filtro)]
+    for campo, valor in cambios.items():
+        if valor is None:
+            continue
+        if campo in ("precio", "stock"):
+            expresion = _expresion_numerica(getattr(Producto, campo), valor["op"], valor["valor"])
+            if campo == "stock":
+                # Stock siempre entero, aunque se multiplique por un factor
+                expresion = func.round(expresion).cast(Integer) if valor["op"] == "multiplicar" else expresion
+                condiciones.append(expresion >= 0)
+            else:
+                condiciones.append(expresion > 0)
+            valores[campo] = expresion
+        else:
+            valores[campo] = valor
+
+    if not valores:
+        return 0
+    if "media_url" in valores:
+        valores["media_variantes"] = case(
+            (Producto.media_url == valores["media_url"], Producto.media_variantes), else_=null()
+        )
+
+    stmt = (
+        update(Producto)
+        .where(*condiciones)
+        .values(valores)
+        .execution_options(synchronize_session=False)
+    )
+    async with sesion_escritura() as session:
+        if "categoria_id" in valores:
+            await _validar_categorias(session, [valores["categoria_id"]])
+        result = await session.exec(stmt)
+        await session.commit()
+        return result.rowcount
+
 async def obtener_producto(id: int):
     async with AsyncSession(async_engine) as session:
         result = await session.exec(select(Producto).where(Producto.id == id, Producto.deleted_at == None))
@@ -205,7 +620,7 @@ async def obtener_producto(id: int):
         return producto
 
 async def eliminar_producto(id: int):
-    async with AsyncSession(async_engine) as session:
+    async with sesion_escritura() as session:
         producto = await session.get(Producto, id)
         if producto:
             producto.deleted_at = datetime.now()
@@ -225,11 +640,13 @@ async def obtener_producto_con_categoria(id: int):
         return None
 
 async def actualizar_producto(id: int, producto_update):
-    async with AsyncSession(async_engine) as session:
+    async with sesion_escritura() as session:
         result = await session.exec(select(Producto).where(Producto.id == id, Producto.deleted_at == None))
         producto = result.first()
         if producto:
-            for key, value in producto_update.dict(exclude_unset=True).items():
+            update_data = producto_update.dict(exclude_unset=True)
+            _al_cambiar_media(producto, update_data)
+            for key, value in update_data.items():
                 setattr(producto, key, value)
             await session.commit()
             await session.refresh(producto)
@@ -237,7 +654,7 @@ async def actualizar_producto(id: int, producto_update):
         return None
 
 async def desactivar_producto(id: int):
-    async with AsyncSession(async_engine) as session:
+    async with sesion_escritura() as session:
         result = await session.exec(select(Producto).where(Producto.id == id, Producto.deleted_at == None))
         producto = result.first()
         if producto:
@@ -248,7 +665,7 @@ async def desactivar_producto(id: int):
         return None
 
 async def restar_stock(id: int, cantidad: int):
-    async with AsyncSession(async_engine) as session:
+    async with sesion_escritura() as session:
         result = await session.exec(select(Producto).where(Producto.id == id, Producto.deleted_at == None))
         producto = result.first()
         if producto and producto.stock >= cantidad:
@@ -258,15 +675,154 @@ async def restar_stock(id: int, cantidad: int):
             return producto
         return None
 
+async def _actualizar_seleccion(modelo, condiciones: list, valores: dict) -> List[int]:
+    """Ejecuta un solo UPDATE sobre las filas que cumplen `condiciones` y devuelve sus ids."""
+    stmt = (
+        update(modelo)
+        .where(*condiciones)
+        .values(valores)
+        .returning(modelo.id)
+        .execution_options(synchronize_session=False)
+    )
+    async with sesion_escritura() as session:
+        result = await session.exec(stmt)
+        ids = sorted(result.scalars().all())
+        await session.commit()
+        return ids
+
+def _condiciones_seleccion_producto(ids: Optional[List[int]], filtro: Optional[dict]):
+    if ids is not None:
+        return [_id_en_lista(Producto.id, ids)]
+    return _filtros_producto(**filtro)
+
+async def eliminar_productos_masivo(ids: Optional[List[int]] = None, filtro: Optional[dict] = None) -> List[int]:
+    """Borrado suave de varios productos (por lista de ids o filtro) en un solo UPDATE."""
+    condiciones = [Producto.deleted_at == None, *_condiciones_seleccion_producto(ids, filtro)]
+    return await _actualizar_seleccion(Producto, condiciones, {"deleted_at": datetime.now()})
+
+async def desactivar_productos_masivo(ids: Optional[List[int]] = None, filtro: Optional[dict] = None) -> List[int]:
+    """Desactiva varios productos activos (por lista de ids o filtro) en un solo UPDATE."""
+    condiciones = [Producto.deleted_at == None, Producto.activo == True, *_condiciones_seleccion_producto(ids, filtro)]
+    return await _actualizar_seleccion(Producto, condiciones, {"activo": False})
+
+# =======================================================================
+# 📋 Importación de inventario (conteo físico)
+# =======================================================================
+
+TAMANO_LOTE_INVENTARIO = 1000
+
+def leer_csv_inventario(lineas, modo: Optional[str] = None):
+    """
+    Lee un CSV de inventario con filas `producto_id,stock` (absoluto) o
+    `producto_id,delta` (relativo). La cabecera es opcional; si existe y no
+    se indica `modo`, su segunda columna decide el modo. Devuelve
+    (modo, generador de filas). Lanza ValueError con el número de línea si
+    una fila es inválida.
+    """
+    lector = csv.reader(lineas)
+    primera = next(lector, None)
+    pendiente = None
+    if primera is not None:
+        if primera and primera[0].strip().lstrip("-").isdigit():
+            pendiente = primera
+        elif modo is None and len(primera) > 1:
+            modo = "relativo" if primera[1].strip().lower() == "delta" else "absoluto"
+    modo = modo or "absoluto"
+    if modo not in ("absoluto", "relativo"):
+        raise ValueError("El modo debe ser 'absoluto' o 'relativo'")
+
+    filas = itertools.chain([pendiente], lector) if pendiente is not None else lector
+    inicio = 1 if pendiente is not None or primera is None else 2
+
+    def _filas():
+        for numero, fila in enumerate(filas, start=inicio):
+            if not fila or not "".join(fila).strip():
+                continue
+            try:
+                producto_id, valor = int(fila[0]), int(fila[1])
+            except (ValueError, IndexError):
+                raise ValueError(f"Línea {numero}: se esperaba 'producto_id,{'delta' if modo == 'relativo' else 'stock'}'")
+            if modo == "absoluto" and valor < 0:
+                raise ValueError(f"Línea {numero}: el stock no puede ser negativo")
+            yield producto_id, valor
+
+    return modo, _filas()
+
+async def _aplicar_lote_inventario(session, lote: dict, modo: str, reporte: dict):
+    """Aplica un lote {producto_id: valor} con un solo UPDATE ... FROM (VALUES ...)."""
+    columna_valor = column("valor", Integer)
+    v = _tabla_valores("v", [column("id", Integer), columna_valor], list(lote.items()))
+    condiciones = [Producto.id == v.c.id, Producto.deleted_at == None]
+    if modo == "relativo":
+        nuevo_stock = Producto.stock + v.c.valor
+        condiciones.append(nuevo_stock >= 0)
+    else:
+        nuevo_stock = v.c.valor
+    stmt = (
+        update(Producto)
+        .where(*condiciones)
+        .values(stock=nuevo_stock)
+        .returning(Producto.id)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.exec(stmt)
+    actualizados = set(result.scalars().all())
+    reporte["actualizados"] += len(actualizados)
+
+    pendientes = [i for i in lote if i not in actualizados]
+    if not pendientes:
+        return
+    # Clasificar los ids que no se actualizaron
+    result = await session.exec(
+        select(Producto.id, Producto.deleted_at).where(_id_en_lista(Producto.id, pendientes))
+    )
+    existentes = {id: deleted_at for id, deleted_at in result.all()}
+    for i in pendientes:
+        if i not in existentes:
+            reporte["no_encontrados"].append(i)
+        elif existentes[i] is not None:
+            reporte["eliminados"].append(i)
+        else:
+            reporte["stock_negativo"].append(i)
+
+async def _siguiente_lote(filas, tamano: int) -> list:
+    """
+    Lee hasta `tamano` elementos de `filas` en un hilo: leer y validar un
+    CSV subido no bloquea el event loop.
+    """
+    return await asyncio.to_thread(list, itertools.islice(filas, tamano))
+
+async def importar_inventario(filas, modo: str = "absoluto", tamano_lote: int = TAMANO_LOTE_INVENTARIO):
+    """
+    Ajusta el stock de muchos productos a partir de filas (producto_id, valor).
+    En modo "absoluto" el valor es el nuevo stock; en "relativo" se suma al
+    stock actual. Se aplica un UPDATE por lote dentro de una sola transacción:
+    si una fila es inválida no se aplica nada. El lote nunca supera lo que
+    el motor acepta en una sentencia.
+    """
+    tamano_lote = min(tamano_lote, _filas_por_sentencia(2))
+    reporte = {"modo": modo, "actualizados": 0, "no_encontrados": [], "eliminados": [], "stock_negativo": []}
+    async with sesion_escritura() as session:
+        while filas_lote := await _siguiente_lote(filas, tamano_lote):
+            lote = {}
+            for producto_id, valor in filas_lote:
+                if modo == "relativo":
+                    lote[producto_id] = lote.get(producto_id, 0) + valor
+                else:
+                    lote[producto_id] = valor
+            await _aplicar_lote_inventario(session, lote, modo, reporte)
+        await session.commit()
+    return reporte
+
 # =======================================================================
 # 👤 Funciones CRUD para Cliente
 # =======================================================================
 
-async def crear_cliente(cliente_data):
-    """Crea un nuevo cliente."""
+async def crear_cliente(cliente_data, media_status: Optional[str] = None):
+    """Crea un nuevo cliente. `media_status="pending"` si la imagen se sube en segundo plano."""
     try:
-        cliente = Cliente(**cliente_data.dict())
-        async with AsyncSession(async_engine) as session:
+        cliente = Cliente(**cliente_data.dict(), media_status=media_status)
+        async with sesion_escritura() as session:
             session.add(cliente)
             await session.commit()
             await session.refresh(cliente)
@@ -275,26 +831,53 @@ async def crear_cliente(cliente_data):
         print(f"Error creando cliente: {e}")
         return None
 
+def _filtros_cliente(
+    nombre: Optional[str] = None,
+    ciudad: Optional[str] = None,
+    canal: Optional[str] = None,
+):
+    """Condiciones WHERE de los filtros de clientes."""
+    condiciones = []
+    if nombre is not None:
+        condiciones.append(Cliente.nombre.ilike(f"%{nombre}%"))
+    if ciudad is not None:
+        condiciones.append(Cliente.ciudad.ilike(f"%{ciudad}%"))
+    if canal is not None:
+        condiciones.append(Cliente.canal == canal)
+    return condiciones
+
 async def obtener_clientes(
     nombre: Optional[str] = None,
     ciudad: Optional[str] = None,
     canal: Optional[str] = None,
+    campos: Optional[List[str]] = None
 ):
-    """Obtiene clientes activos, con filtros opcionales."""
+    """Obtiene clientes activos, con filtros opcionales y columnas opcionales."""
     async with AsyncSession(async_engine) as session:
         query = select(Cliente).where(Cliente.deleted_at == None)
-
-        if nombre is not None:
-            query = query.where(Cliente.nombre.ilike(f"%{nombre}%"))
-        if ciudad is not None:
-            query = query.where(Cliente.ciudad.ilike(f"%{ciudad}%"))
-        if canal is not None:
-            query = query.where(Cliente.canal == canal)
+        if campos is not None:
+            query = query.options(load_only(*_columnas(Cliente, campos)))
+        query = query.where(*_filtros_cliente(nombre=nombre, ciudad=ciudad, canal=canal))
 
         result = await session.exec(query)
         clientes = result.all()
+        if campos is not None:
+            return [_campos_dict(cliente, campos) for cliente in clientes]
         return clientes
 
+async def obtener_clientes_por_ids(ids: List[int]):
+    """Obtiene varios clientes activos en una sola consulta, en el orden de `ids`."""
+    async with AsyncSession(async_engine) as session:
+        result = await session.exec(
+            select(Cliente).where(_id_en_lista(Cliente.id, ids), Cliente.deleted_at == None)
+        )
+        encontrados = {cliente.id: cliente for cliente in result.all()}
+
+    return {
+        "clientes": [encontrados.get(i) for i in ids],
+        "no_encontrados": [i for i in dict.fromkeys(ids) if i not in encontrados]
+    }
+
 async def obtener_cliente(id: int):
     """Obtiene un cliente por ID (activo)."""
     async with AsyncSession(async_engine) as session:
@@ -304,10 +887,11 @@ async def obtener_cliente(id: int):
     
 async def actualizar_cliente(id: int, cliente_update):
     """Actualiza los datos de un cliente."""
-    async with AsyncSession(async_engine) as session:
+    async with sesion_escritura() as session:
         cliente = await session.get(Cliente, id)
         if cliente and cliente.deleted_at is None:
             update_data = cliente_update.dict(exclude_unset=True)
+            _al_cambiar_media(cliente, update_data)
             for key, value in update_data.items():
                 setattr(cliente, key, value)
             await session.commit()
@@ -317,7 +901,7 @@ async def actualizar_cliente(id: int, cliente_update):
 
 async def eliminar_cliente(id: int):
     """Realiza un borrado suave (soft delete) de un cliente."""
-    async with AsyncSession(async_engine) as session:
+    async with sesion_escritura() as session:
         cliente = await session.get(Cliente, id)
         if cliente and cliente.deleted_at is None:
             cliente.deleted_at = datetime.now()
@@ -326,6 +910,118 @@ async def eliminar_cliente(id: int):
             return True
         return False
 
+async def eliminar_clientes_masivo(ids: Optional[List[int]] = None, filtro: Optional[dict] = None) -> List[int]:
+    """Borrado suave de varios clientes (por lista de ids o filtro) en un solo UPDATE."""
+    condiciones = [Cliente.deleted_at == None]
+    if ids is not None:
+        condiciones.append(_id_en_lista(Cliente.id, ids))
+    else:
+        condiciones.extend(_filtros_cliente(**filtro))
+    return await _actualizar_seleccion(Cliente, condiciones, {"deleted_at": datetime.now()})
+
+# =======================================================================
+# 📥 Ingesta de Compras (reabastecimiento)
+# =======================================================================
+
+MAX_LINEAS_COMPRA = 10000
+TAMANO_LOTE_COMPRAS = 1000
+
+def leer_csv_compras(lineas):
+    """
+    Lee un CSV de compras con cabecera `producto_id,cantidad,precio_unitario`
+    (y `cliente_id` opcional). Genera un dict por línea sin cargar el archivo
+    completo en memoria. Lanza ValueError con el número de línea si una fila
+    es inválida.
+    """
+    lector = csv.DictReader(lineas)
+    faltantes = {"producto_id", "cantidad"} - set(lector.fieldnames or [])
+    if faltantes:
+        raise ValueError(f"Faltan columnas en la cabecera: {', '.join(sorted(faltantes))}")
+    for numero, fila in enumerate(lector, start=2):
+        if not any((v or "").strip() for v in fila.values()):
+            continue
+        try:
+            linea = {"producto_id": int(fila["producto_id"]), "cantidad": int(fila["cantidad"])}
+            if (fila.get("precio_unitario") or "").strip():
+                linea["precio_unitario"] = float(fila["precio_unitario"])
+            if (fila.get("cliente_id") or "").strip():
+                linea["cliente_id"] = int(fila["cliente_id"])
+        except (TypeError, ValueError):
+            raise ValueError(f"Línea {numero}: valores inválidos")
+        if linea["cantidad"] <= 0:
+            raise ValueError(f"Línea {numero}: la cantidad debe ser mayor que 0")
+        if linea.get("precio_unitario") is not None and linea["precio_unitario"] <= 0:
+            raise ValueError(f"Línea {numero}: el precio unitario debe ser mayor que 0")
+        yield linea
+
+async def _aplicar_lote_compras(session, lote: List[dict], cliente_id: Optional[int], fecha: datetime, reporte: dict):
+    """
+    Aplica un lote de líneas de compra: un UPDATE set-based que suma las
+    cantidades al stock y un INSERT masivo de las filas de Compras.
+    """
+    cantidades = {}
+    for linea in lote:
+        cantidades[linea["producto_id"]] = cantidades.get(linea["producto_id"], 0) + linea["cantidad"]
+
+    v = _tabla_valores("v", [column("id", Integer), column("cantidad", Integer)], list(cantidades.items()))
+    stmt = (
+        update(Producto)
+        .where(Producto.id == v.c.id, Producto.deleted_at == None)
+        .values(stock=Producto.stock + v.c.cantidad)
+        .returning(Producto.id, Producto.precio)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.exec(stmt)
+    precios = {id: precio for id, precio in result.all()}
+
+    invalidos = [i for i in cantidades if i not in precios]
+    if invalidos:
+        raise ValueError(f"Productos inexistentes o eliminados: {', '.join(str(i) for i in invalidos)}")
+
+    filas = []
+    for linea in lote:
+        precio = linea.get("precio_unitario") or precios[linea["producto_id"]]
+        total = round(precio * linea["cantidad"], 2)
+        filas.append({
+            "cliente_id": linea.get("cliente_id", cliente_id),
+            "producto_id": linea["producto_id"],
+            "cantidad": linea["cantidad"],
+            "precio_unitario_aplicado": precio,
+            "total": total,
+            "fecha": fecha,
+        })
+        reporte["total"] += total
+    await session.exec(insert(Compras), params=filas)
+
+    reporte["lineas"] += len(lote)
+    reporte["productos"].update(cantidades)
+
+async def registrar_compras(lineas, cliente_id: Optional[int] = None, fecha: Optional[datetime] = None):
+    """
+    Registra un lote de compras y reabastece el stock en una sola transacción.
+    `lineas` es un iterable de dicts (producto_id, cantidad, precio_unitario
+    opcional, cliente_id opcional) que se consume por lotes en un hilo, así
+    la memoria no depende del tamaño del archivo y leer el CSV no bloquea el
+    event loop. Cada lote cabe en una sentencia del motor actual. Si falta
+    el precio unitario se usa el precio actual del producto. Si alguna línea
+    es inválida no se aplica nada.
+    """
+    fecha = fecha or datetime.now()
+    tamano_lote = min(TAMANO_LOTE_COMPRAS, _filas_por_sentencia(2))
+    reporte = {"lineas": 0, "total": 0.0, "productos": set()}
+    async with sesion_escritura() as session:
+        while lote := await _siguiente_lote(lineas, tamano_lote):
+            if reporte["lineas"] + len(lote) > MAX_LINEAS_COMPRA:
+                raise ValueError(f"Máximo {MAX_LINEAS_COMPRA} líneas por petición")
+            await _aplicar_lote_compras(session, lote, cliente_id, fecha, reporte)
+        await session.commit()
+
+    return {
+        "lineas": reporte["lineas"],
+        "total": round(reporte["total"], 2),
+        "productos_actualizados": len(reporte["productos"]),
+    }
+
 # =======================================================================
 # 🛒 Funciones CRUD para Venta (y DetalleVenta)
 # =======================================================================
@@ -335,7 +1031,7 @@ async def crear_venta(venta_data):
     Crea una nueva venta y sus detalles, y actualiza el stock de los productos.
     Asume que venta_data incluye una lista de 'detalles'.
     """
-    async with AsyncSession(async_engine) as session:
+    async with sesion_escritura() as session:
         try:
             # 1. Validar y restar stock antes de crear la venta
             for detalle in venta_data.detalles:
@@ -361,15 +1057,18 @@ async def crear_venta(venta_data):
                 detalle_dict['venta_id'] = venta.id
                 detalle = DetalleVenta(**detalle_dict)
                 session.add(detalle)
-            
+            await session.flush()
+
+            # 4. Guardar la venta ya armada en la misma transacción (ver _documentos_venta)
+            result = await session.exec(
+                select(Venta).where(Venta.id == venta.id).options(*_opciones_venta())
+                .execution_options(populate_existing=True)
+            )
+            respuesta = VentaResponse.model_validate(result.one())
+            venta.snapshot = respuesta.model_dump(mode="json")
+
             await session.commit()
-            
-            # Refrescar y cargar relaciones para la respuesta
-            await session.refresh(venta, attribute_names=['cliente', 'detalles'])
-            for detalle in venta.detalles:
-                await session.refresh(detalle, attribute_names=['producto'])
-            
-            return venta
+            return respuesta
             
         except ValueError as ve:
             await session.rollback()
@@ -380,102 +1079,361 @@ async def crear_venta(venta_data):
             print(f"Error desconocido creando venta: {e}")
             return None
 
-async def obtener_ventas(
+def _opciones_venta():
+    """Carga completa de una venta: cliente y detalles con producto y categoría."""
+    return [
+        selectinload(Venta.cliente),
+        selectinload(Venta.detalles).selectinload(DetalleVenta.producto).selectinload(Producto.categoria)
+    ]
+
+def _filtros_venta(
     cliente_id: Optional[int] = None,
     canal_venta: Optional[str] = None,
     fecha_inicio: Optional[datetime] = None,
     fecha_fin: Optional[datetime] = None
 ):
-    """Obtiene ventas, con filtros opcionales."""
-    async with AsyncSession(async_engine) as session:
-        # === MODIFICACIÓN para usar carga encadenada más explícita (si la original falla) ===
-        query = select(Venta).options(
-            selectinload(Venta.cliente), 
-            selectinload(Venta.detalles).selectinload(DetalleVenta.producto).selectinload(Producto.categoria)
-        )
-        # =================================================================================
+    """Condiciones WHERE de los filtros de ventas."""
+    condiciones = []
+    if cliente_id is not None:
+        condiciones.append(Venta.cliente_id == cliente_id)
+    if canal_venta is not None:
+        condiciones.append(Venta.canal_venta == canal_venta)
+    if fecha_inicio is not None:
+        condiciones.append(Venta.fecha_venta >= fecha_inicio)
+    if fecha_fin is not None:
+        condiciones.append(Venta.fecha_venta <= fecha_fin)
+    return condiciones
 
-        if cliente_id is not None:
-            query = query.where(Venta.cliente_id == cliente_id)
-        if canal_venta is not None:
-            query = query.where(Venta.canal_venta == canal_venta)
-        if fecha_inicio is not None:
-            query = query.where(Venta.fecha_venta >= fecha_inicio)
-        if fecha_fin is not None:
-            query = query.where(Venta.fecha_venta <= fecha_fin)
+def _recortar_venta(documento: dict, campos: List[str]) -> dict:
+    """Deja en el documento de una venta solo los campos y relaciones pedidos (como `_opciones_venta(campos)`)."""
+    venta_dict = {c: documento[c] for c in campos if c in Venta.model_fields and c in documento}
+    if "cliente" in campos:
+        venta_dict["cliente"] = documento.get("cliente")
+    if any(c.startswith("detalles") for c in campos):
+        detalles = []
+        for detalle in documento.get("detalles", []):
+            detalle_dict = {c: detalle[c] for c in DetalleVenta.model_fields if c in detalle}
+            if "detalles.producto" in campos or "detalles.producto.categoria" in campos:
+                producto = detalle.get("producto")
+                detalle_dict["producto"] = ProductoEnCategoria.model_validate(producto).model_dump() if producto else None
+                if producto and "detalles.producto.categoria" in campos:
+                    detalle_dict["producto"]["categoria"] = producto.get("categoria")
+            detalles.append(detalle_dict)
+        venta_dict["detalles"] = detalles
+    return venta_dict
 
+async def _documentos_venta(session, ventas: List[Venta]) -> List[dict]:
+    """
+    Documento (forma de VentaResponse) de cada venta. Las ventas guardan el
+    suyo en `snapshot` al crearse, así que basta con leer la tabla venta; solo
+    las anteriores a esa columna se arman cargando cliente, detalles,
+    productos y categorías.
+    """
+    sin_snapshot = [venta.id for venta in ventas if venta.snapshot is None]
+    armadas = {}
+    if sin_snapshot:
+        result = await session.exec(
+            select(Venta).where(_id_en_lista(Venta.id, sin_snapshot)).options(*_opciones_venta())
+            .execution_options(populate_existing=True)
+        )
+        armadas = {
+            venta.id: VentaResponse.model_validate(venta).model_dump(mode="json") for venta in result.all()
+        }
+    return [venta.snapshot if venta.snapshot is not None else armadas[venta.id] for venta in ventas]
+
+async def obtener_ventas(
+    cliente_id: Optional[int] = None,
+    canal_venta: Optional[str] = None,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    campos: Optional[List[str]] = None
+):
+    """Obtiene ventas, con filtros opcionales."""
+    async with AsyncSession(async_engine) as session:
+        query = select(Venta).where(*_filtros_venta(cliente_id, canal_venta, fecha_inicio, fecha_fin))
         result = await session.exec(query)
-        ventas = result.all()
-        return ventas
+        documentos = await _documentos_venta(session, result.all())
+        if campos is not None:
+            return [_recortar_venta(documento, campos) for documento in documentos]
+        return [VentaResponse.model_validate(documento) for documento in documentos]
 
-async def obtener_venta(id: int):
+async def obtener_venta(id: int, campos: Optional[List[str]] = None):
     """Obtiene una venta específica por ID."""
     async with AsyncSession(async_engine) as session:
-        # === MODIFICACIÓN para usar carga encadenada más explícita (si la original falla) ===
-        query = select(Venta).where(Venta.id == id).options(
-            selectinload(Venta.cliente),
-            selectinload(Venta.detalles).selectinload(DetalleVenta.producto).selectinload(Producto.categoria)
-        )
-        # =================================================================================
-        result = await session.exec(query)
-        venta = result.first()
-        return venta
+        venta = await session.get(Venta, id)
+        if not venta:
+            return None
+        documento, = await _documentos_venta(session, [venta])
+        if campos is not None:
+            return _recortar_venta(documento, campos)
+        return VentaResponse.model_validate(documento)
+
+async def completar_snapshots_ventas(tamano_lote: int = 200) -> int:
+    """
+    Guarda el snapshot de las ventas creadas antes de que existiera la
+    columna (con los nombres actuales de productos y categorías). Devuelve
+    cuántas ventas se completaron.
+    """
+    completadas = 0
+    while True:
+        async with sesion_escritura() as session:
+            result = await session.exec(
+                select(Venta).where(Venta.snapshot.is_(None)).order_by(Venta.id).limit(tamano_lote)
+            )
+            ventas = result.all()
+            if not ventas:
+                return completadas
+            for venta, documento in zip(ventas, await _documentos_venta(session, ventas)):
+                venta.snapshot = documento
+            await session.commit()
+            completadas += len(ventas)
+
+# Ventas que se cargan por consulta al recorrer una página de /ventas/read
+TAMANO_LOTE_VENTAS = 50
+
+def iterar_ventas(
+    cliente_id: Optional[int] = None,
+    canal_venta: Optional[str] = None,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limite: int = 100,
+    pagina: Optional[dict] = None,
+    en_cache: Optional[Callable[[int], Any]] = None
+):
+    """
+    Iterador asíncrono de hasta `limite` ventas completas, de la más reciente
+    a la más antigua, empezando después de `cursor`. Las ventas se leen por
+    lotes de TAMANO_LOTE_VENTAS con su propia sesión, así que en memoria solo
+    hay un lote a la vez. Cada venta se entrega como VentaResponse; si
+    `en_cache(id)` devuelve algo distinto de None, se entrega ese valor en
+    su lugar y la venta no se lee.
+    Al terminar deja en `pagina["next_cursor"]` el cursor de la página
+    siguiente (None si no hay más). El cursor se valida aquí: lanza
+    ValueError antes de empezar a iterar.
+    """
+    posicion = _decodificar_cursor(cursor)
+    try:
+        despues = (datetime.fromisoformat(posicion["fecha"]), int(posicion["id"])) if posicion else None
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Cursor inválido")
+    condiciones = _filtros_venta(cliente_id, canal_venta, fecha_inicio, fecha_fin)
+    pagina = {} if pagina is None else pagina
+    pagina["next_cursor"] = None
+
+    async def lotes():
+        nonlocal despues
+        restantes = limite
+        while restantes > 0:
+            tamano = min(TAMANO_LOTE_VENTAS, restantes)
+            # Primero solo las claves del lote; después el documento de las que no estén en caché
+            query = select(Venta.id, Venta.fecha_venta).where(*condiciones)
+            if despues:
+                query = query.where(or_(
+                    Venta.fecha_venta < despues[0],
+                    and_(Venta.fecha_venta == despues[0], Venta.id < despues[1])
+                ))
+            # Una fila de más indica si quedan ventas después de este lote
+            query = query.order_by(Venta.fecha_venta.desc(), Venta.id.desc()).limit(tamano + 1)
+            async with AsyncSession(async_engine) as session:
+                claves = (await session.exec(query)).all()
+                lote = claves[:tamano]
+                cacheadas = {}
+                if en_cache is not None:
+                    for id, _ in lote:
+                        valor = en_cache(id)
+                        if valor is not None:
+                            cacheadas[id] = valor
+                faltantes = [id for id, _ in lote if id not in cacheadas]
+                cargadas = {}
+                if faltantes:
+                    result = await session.exec(select(Venta).where(_id_en_lista(Venta.id, faltantes)))
+                    ventas = result.all()
+                    cargadas = {
+                        venta.id: VentaResponse.model_validate(documento)
+                        for venta, documento in zip(ventas, await _documentos_venta(session, ventas))
+                    }
+            for id, _ in lote:
+                yield cacheadas[id] if id in cacheadas else cargadas[id]
+            if len(claves) <= tamano:
+                return
+            ultima_id, ultima_fecha = lote[-1]
+            despues = (ultima_fecha, ultima_id)
+            restantes -= tamano
+        pagina["next_cursor"] = _codificar_cursor({"fecha": despues[0].isoformat(), "id": despues[1]})
+
+    return lotes()
 
 # =======================================================================
 # 🗑️ Funciones de Historial de Eliminados (Soft Delete)
 # =======================================================================
 
+def _categoria_eliminada_dict(cat: Categoria) -> dict:
+    return {
+        "id": cat.id,
+        "nombre": cat.nombre,
+        "descripcion": cat.descripcion,
+        "activa": cat.activa,
+        "media_url": cat.media_url, 
+        "deleted_at": cat.deleted_at
+    }
+
+def _producto_eliminado_dict(prod: Producto) -> dict:
+    return {
+        "id": prod.id,
+        "nombre": prod.nombre,
+        "descripcion": prod.descripcion,
+        "precio": prod.precio,
+        "stock": prod.stock,
+        "activo": prod.activo,
+        "categoria_id": prod.categoria_id,
+        "categoria": None, 
+        "media_url": prod.media_url, 
+        "deleted_at": prod.deleted_at
+    }
+
+def _cliente_eliminado_dict(cli: Cliente) -> dict:
+    return {
+        "id": cli.id,
+        "nombre": cli.nombre,
+        "ciudad": cli.ciudad,
+        "canal": cli.canal,
+        "media_url": cli.media_url,
+        "deleted_at": cli.deleted_at
+    }
+
 async def obtener_categorias_eliminadas():
     """Obtiene la lista de categorías con borrado suave."""
     async with AsyncSession(async_engine) as session:
         result = await session.exec(select(Categoria).where(Categoria.deleted_at != None))
-        categorias = result.all()
-        result_list = []
-        for cat in categorias:
-            result_list.append({
-                "id": cat.id,
-                "nombre": cat.nombre,
-                "descripcion": cat.descripcion,
-                "activa": cat.activa,
-                "media_url": cat.media_url, 
-                "deleted_at": cat.deleted_at
-            })
-        return result_list
+        return [_categoria_eliminada_dict(cat) for cat in result.all()]
 
 async def obtener_productos_eliminados():
     """Obtiene la lista de productos con borrado suave."""
     async with AsyncSession(async_engine) as session:
         result = await session.exec(select(Producto).where(Producto.deleted_at != None))
-        productos = result.all()
-        result_list = []
-        for prod in productos:
-            result_list.append({
-                "id": prod.id,
-                "nombre": prod.nombre,
-                "descripcion": prod.descripcion,
-                "precio": prod.precio,
-                "stock": prod.stock,
-                "activo": prod.activo,
-                "categoria_id": prod.categoria_id,
-                "categoria": None, 
-                "media_url": prod.media_url, 
-                "deleted_at": prod.deleted_at
-            })
-        return result_list
+        return [_producto_eliminado_dict(prod) for prod in result.all()]
 
 async def obtener_clientes_eliminados():
     """Obtiene la lista de clientes con borrado suave."""
     async with AsyncSession(async_engine) as session:
         result = await session.exec(select(Cliente).where(Cliente.deleted_at != None))
-        clientes = result.all()
-        result_list = []
-        for cli in clientes:
-            result_list.append({
-                "id": cli.id,
-                "nombre": cli.nombre,
-                "ciudad": cli.ciudad,
-                "canal": cli.canal,
-                "media_url": cli.media_url,
-                "deleted_at": cli.deleted_at
-            })
-        return result_list
\ No newline at end of file
+        return [_cliente_eliminado_dict(cli) for cli in result.all()]
+
+async def _pagina_eliminados(modelo, serializar, despues: Optional[list], limite: int):
+    """
+    Devuelve una página de filas eliminadas de `modelo` ordenadas por
+    deleted_at DESC, id DESC, empezando después de la posición `despues`
+    ([deleted_at, id]). Retorna (filas, siguiente_posicion); la posición es
+    None cuando no quedan más filas.
+    """
+    async with AsyncSession(async_engine) as session:
+        query = select(modelo).where(modelo.deleted_at != None)
+        if despues:
+            deleted_at = datetime.fromisoformat(despues[0])
+            query = query.where(or_(
+                modelo.deleted_at < deleted_at,
+                and_(modelo.deleted_at == deleted_at, modelo.id < despues[1])
+            ))
+        query = query.order_by(modelo.deleted_at.desc(), modelo.id.desc()).limit(limite + 1)
+        result = await session.exec(query)
+        filas = result.all()
+
+    if len(filas) <= limite:
+        return [serializar(f) for f in filas], None
+    filas = filas[:limite]
+    ultima = filas[-1]
+    return [serializar(f) for f in filas], [ultima.deleted_at.isoformat(), ultima.id]
+
+async def obtener_historial(cursor: Optional[str] = None, limite: int = 50):
+    """
+    Obtiene una página combinada del historial de eliminados (categorías,
+    productos y clientes). Las tres consultas se ejecutan en paralelo, cada
+    una con su propia sesión, y se paginan por deleted_at DESC.
+
+    El cursor guarda la posición de cada sección; una sección agotada se
+    marca con None y ya no se vuelve a consultar.
+    """
+    posiciones = _decodificar_cursor(cursor)
+    secciones = {
+        "categorias": (Categoria, _categoria_eliminada_dict),
+        "productos": (Producto, _producto_eliminado_dict),
+        "clientes": (Cliente, _cliente_eliminado_dict),
+    }
+
+    async def _vacia():
+        return [], None
+
+    tareas = []
+    for nombre, (modelo, serializar) in secciones.items():
+        if nombre in posiciones and posiciones[nombre] is None:
+            tareas.append(_vacia())
+        else:
+            tareas.append(_pagina_eliminados(modelo, serializar, posiciones.get(nombre), limite))
+
+    try:
+        paginas = await asyncio.gather(*tareas)
+    except (TypeError, IndexError, ValueError):
+        raise ValueError("Cursor inválido")
+
+    respuesta = {}
+    siguientes = {}
+    for nombre, (filas, siguiente) in zip(secciones, paginas):
+        respuesta[nombre] = filas
+        siguientes[nombre] = siguiente
+
+    hay_mas = any(pos is not None for pos in siguientes.values())
+    respuesta["next_cursor"] = _codificar_cursor(siguientes) if hay_mas else None
+    return respuesta
+
+# =======================================================================
+# 🔥 Precalentamiento de consultas
+# =======================================================================
+
+async def _precalentar_update(conn, modelo, campo: str, valor):
+    """
+    Ejecuta en `conn` el UPDATE de `campo` que genera el flush del ORM (con su
+    propia caché de sentencias) sobre una fila que no existe (id -1): no
+    modifica ni bloquea ninguna fila.
+    """
+    async with AsyncSession(bind=conn, join_transaction_mode="create_savepoint") as session:
+        fila = modelo(id=-1)
+        make_transient_to_detached(fila)
+        session.add(fila)
+        setattr(fila, campo, valor)
+        try:
+            await session.flush()
+        except StaleDataError:
+            # 0 filas actualizadas: la sentencia ya quedó compilada
+            pass
+
+async def precalentar(conn):
+    """
+    Ejecuta en `conn` las consultas de lectura más usadas (listado de
+    productos, lectura de producto y la venta completa que arma
+    crear_venta) y las UPDATE del alta de venta (stock y snapshot) sobre
+    una fila inexistente, para que SQLAlchemy ya las tenga compiladas y el
+    driver preparadas antes de la primera petición. Todo se deshace al
+    final. Las INSERT de venta y detalle no se precalientan: ejecutarlas,
+    aunque se deshicieran, consumiría valores de la secuencia de venta.
+    """
+    transaccion = await conn.begin()
+    try:
+        async with AsyncSession(bind=conn) as session:
+            # stream + close: compila y ejecuta el listado sin leer las filas
+            resultado = await session.stream(_consulta_productos())
+            await resultado.close()
+
+            producto_id = (await session.exec(select(Producto.id).limit(1))).first()
+            if producto_id is not None:
+                await session.get(Producto, producto_id)
+            venta_id = (await session.exec(select(Venta.id).order_by(Venta.id.desc()).limit(1))).first()
+            if venta_id is not None:
+                await session.exec(select(Venta).where(Venta.id == venta_id).options(*_opciones_venta()))
+
+        # En SQLite una UPDATE toma el bloqueo de escritura aunque no afecte filas
+        async with escritura():
+            await _precalentar_update(conn, Producto, "stock", 0)
+            await _precalentar_update(conn, Venta, "snapshot", {})
+    finally:
+        await transaccion.rollback()
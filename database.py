@@ -1,7 +1,17 @@
 from sqlmodel import SQLModel # Para acceder a los metadatos de las tablas
+from sqlmodel.ext.asyncio.session import AsyncSession as SQLModelAsyncSession
+from sqlalchemy import Column, Integer, String, Table, delete, event, insert, inspect, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateIndex, CreateTable
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from typing import Optional
+import asyncio
+import hashlib
 import os
 
 load_dotenv()
@@ -13,9 +23,42 @@ if not DATABASE_URL:
 # Convertir la URL de conexión estándar a una compatible con asyncpg
 # Esto es necesario para usar el motor asíncrono
 DATABASE_URL_ASYNC = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
+# Igual para SQLite (p. ej. sqlite:///tienda.db), con el driver aiosqlite
+if DATABASE_URL_ASYNC.startswith("sqlite://"):
+    DATABASE_URL_ASYNC = DATABASE_URL_ASYNC.replace("sqlite://", "sqlite+aiosqlite://", 1)
+ES_SQLITE = DATABASE_URL_ASYNC.startswith("sqlite")
+
+# Conexiones que mantiene abiertas cada worker; warmup.py las abre todas al arrancar
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+
+# Ajustes de SQLite (se aplican a cada conexión nueva)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+# Cuánto espera una escritura de otro proceso a que se libere el archivo
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# pool_size solo lo aceptan los pools con cola; SQLite en memoria usa StaticPool (una sola conexión)
+_url = make_url(DATABASE_URL_ASYNC)
+_opciones_pool = {"pool_size": DB_POOL_SIZE} if issubclass(_url.get_dialect().get_pool_class(_url), QueuePool) else {}
 
 # Motor y sesión asíncrona
-async_engine = create_async_engine(DATABASE_URL_ASYNC, echo=True)
+async_engine = create_async_engine(DATABASE_URL_ASYNC, echo=True, **_opciones_pool)
+
+if ES_SQLITE:
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _pragmas_sqlite(dbapi_connection, connection_record):
+        """
+        WAL permite leer mientras otra conexión escribe; con synchronous=NORMAL
+        solo se sincroniza a disco en los checkpoints, no en cada commit.
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        # Negativo: tamaño en KiB en lugar de páginas
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
 
 AsyncSessionLocal = sessionmaker(
     async_engine, expire_on_commit=False, class_=AsyncSession
@@ -26,11 +69,97 @@ async def get_async_db():
     async with AsyncSessionLocal() as session:
         yield session
 
-async def init_db():
+# SQLite admite un solo escritor a la vez: las escrituras de este proceso
+# esperan su turno aquí en lugar de competir por el bloqueo del archivo.
+_turno_escritura = asyncio.Lock() if ES_SQLITE else None
+
+@asynccontextmanager
+async def escritura():
+    """Turno de escritura (con SQLite, uno a la vez por proceso; sin efecto en Postgres)."""
+    if _turno_escritura is None:
+        yield
+        return
+    async with _turno_escritura:
+        yield
+
+@asynccontextmanager
+async def sesion_escritura():
+    """
+    Sesión para operaciones que modifican datos. Las lecturas siguen usando
+    sesiones normales y no esperan a las escrituras.
+    """
+    async with escritura():
+        async with SQLModelAsyncSession(async_engine) as session:
+            yield session
+
+# Huella del esquema aplicado a la base de datos. Si coincide con la de los
+# modelos, init_db no vuelve a revisar el catálogo en cada arranque.
+esquema_version = Table(
+    "esquema_version",
+    SQLModel.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("huella", String(64), nullable=False),
+)
+
+def huella_esquema(dialect) -> str:
+    """SHA-256 del DDL (tablas e índices) que generan los modelos para `dialect`."""
+    ddl = []
+    for tabla in SQLModel.metadata.sorted_tables:
+        ddl.append(str(CreateTable(tabla).compile(dialect=dialect)))
+        for indice in sorted(tabla.indexes, key=lambda i: i.name or ""):
+            ddl.append(str(CreateIndex(indice).compile(dialect=dialect)))
+    return hashlib.sha256("\n".join(ddl).encode()).hexdigest()
+
+async def _huella_guardada() -> Optional[str]:
+    """Huella registrada en la base de datos, o None si todavía no hay ninguna."""
+    try:
+        async with async_engine.connect() as conn:
+            return (await conn.execute(select(esquema_version.c.huella))).scalar()
+    except DBAPIError:
+        # La tabla no existe: base de datos nueva o anterior a la huella
+        return None
+
+def _agregar_columnas_faltantes(conn):
+    """
+    create_all no modifica tablas que ya existen: agrega las columnas nuevas
+    (nullable) de los modelos que todavía no están en la base de datos.
+    """
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    for tabla in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(tabla.name):
+            continue
+        existentes = {c["name"] for c in inspector.get_columns(tabla.name)}
+        for columna in tabla.columns:
+            if columna.name in existentes or not columna.nullable:
+                continue
+            conn.execute(text(
+                f"ALTER TABLE {preparer.format_table(tabla)} "
+                f"ADD COLUMN {preparer.format_column(columna)} {columna.type.compile(dialect=conn.dialect)}"
+            ))
+
+def _crear_indices_faltantes(conn):
+    """create_all tampoco agrega índices nuevos a tablas existentes."""
+    for tabla in SQLModel.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(conn, checkfirst=True)
+
+async def init_db(forzar: bool = False):
     """
     Inicializa la base de datos creando las tablas si no existen,
-    utilizando el motor asíncrono.
+    utilizando el motor asíncrono. Si la huella guardada coincide con la de
+    los modelos no hace nada más que esa consulta; `forzar=True` revisa el
+    catálogo de todos modos (p. ej. si se borró una tabla a mano).
     """
+    import models  # noqa: F401 - registra las tablas en SQLModel.metadata
+
+    huella = huella_esquema(async_engine.dialect)
+    if not forzar and await _huella_guardada() == huella:
+        return
     # Usamos begin() y run_sync para la creación de tablas con SQLModel
     async with async_engine.begin() as conn:
-        await conn.run_sync(SQLModel.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_agregar_columnas_faltantes)
+        await conn.run_sync(_crear_indices_faltantes)
+        await conn.execute(delete(esquema_version))
+        await conn.execute(insert(esquema_version).values(id=1, huella=huella))
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Generación de variantes de imagen (miniaturas WebP y placeholder borroso).
+
+Las funciones de este módulo son puras y se ejecutan en un ProcessPoolExecutor,
+por eso solo dependen de Pillow: el proceso hijo no importa la aplicación.
+Pillow es opcional; sin él `disponible()` devuelve False y no se generan
+variantes. Se importa al usarlo por primera vez, para no sumar su carga al
+arranque de la aplicación.
+"""
+import base64
+import importlib.util
+import io
+import os
+
+# Anchos (px) de las variantes generadas para cada imagen subida
+VARIANT_WIDTHS = tuple(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "150,400,1200").split(","))
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+# Ancho del placeholder borroso que se envía en línea (data URI)
+PLACEHOLDER_WIDTH = 16
+
+
+def disponible() -> bool:
+    """Indica si Pillow está instalado (sin importarlo)."""
+    return importlib.util.find_spec("PIL") is not None
+
+
+def __getattr__(nombre: str):
+    # `image_variants.UnidentifiedImageError` se resuelve al usarlo
+    if nombre == "UnidentifiedImageError":
+        from PIL import UnidentifiedImageError
+        return UnidentifiedImageError
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+def _normalizar(img):
+    """Aplica la orientación EXIF y lleva la imagen a RGB/RGBA."""
+    from PIL import ImageOps
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ("RGB", "RGBA"):
+        return img
+    if img.mode in ("P", "LA", "PA") or "transparency" in img.info:
+        return img.convert("RGBA")
+    return img.convert("RGB")
+
+
+def redimensionar(img, ancho: int, alto: int = 0):
+    """
+    Copia de `img` reducida para caber en ancho x alto (0 = sin límite),
+    conservando la proporción. Nunca agranda la imagen.
+    """
+    from PIL import Image
+    copia = img.copy()
+    copia.thumbnail((ancho or img.width, alto or img.height), Image.LANCZOS)
+    return copia
+
+
+def codificar(img, formato: str = "webp", calidad: int = WEBP_QUALITY) -> bytes:
+    """Codifica `img` en `formato` (webp, jpeg o png)."""
+    salida = io.BytesIO()
+    if formato == "jpeg" and img.mode != "RGB":
+        img = img.convert("RGB")
+    opciones = {"quality": calidad} if formato in ("webp", "jpeg") else {"optimize": True}
+    if formato == "webp":
+        opciones["method"] = 4
+    img.save(salida, format=formato.upper(), **opciones)
+    return salida.getvalue()
+
+
+def placeholder(img) -> str:
+    """Miniatura borrosa de PLACEHOLDER_WIDTH px como data URI (unos cientos de bytes)."""
+    from PIL import ImageFilter
+    pequena = redimensionar(img, PLACEHOLDER_WIDTH).filter(ImageFilter.GaussianBlur(1))
+    datos = codificar(pequena, "webp", calidad=30)
+    return "data:image/webp;base64," + base64.b64encode(datos).decode()
+
+
+def generar(ruta: str, anchos=VARIANT_WIDTHS) -> dict:
+    """
+    Genera las variantes WebP de la imagen en `ruta`. Devuelve
+    {"variantes": {ancho: bytes}, "placeholder": data_uri}. Los anchos
+    mayores que el original se omiten, salvo el primero de ellos, que se
+    genera al tamaño original.
+    """
+    from PIL import Image
+    with Image.open(ruta) as original:
+        img = _normalizar(original)
+        variantes = {}
+        for ancho in sorted(anchos):
+            variantes[ancho] = codificar(redimensionar(img, ancho))
+            if ancho >= img.width:
+                break
+        return {"variantes": variantes, "placeholder": placeholder(img)}
+
+
+def renderizar(ruta: str, ancho: int, alto: int, formato: str) -> bytes:
+    """Reduce la imagen en `ruta` para caber en ancho x alto (0 = sin límite) y la codifica en `formato`."""
+    from PIL import Image
+    with Image.open(ruta) as original:
+        return codificar(redimensionar(_normalizar(original), ancho, alto), formato)
@@ -0,0 +1,23 @@
+import argparse
+import asyncio
+import crud
+
+async def importar(ruta: str, modo: str = None):
+    with open(ruta, encoding="utf-8-sig", newline="") as archivo:
+        modo, filas = crud.leer_csv_inventario(archivo, modo)
+        return await crud.importar_inventario(filas, modo)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa un conteo de inventario desde un CSV.")
+    parser.add_argument("archivo", help="CSV con 'producto_id,stock' o 'producto_id,delta'")
+    parser.add_argument("--modo", choices=["absoluto", "relativo"], default=None,
+                        help="Por defecto se deduce de la cabecera del CSV")
+    args = parser.parse_args()
+
+    reporte = asyncio.run(importar(args.archivo, args.modo))
+    print(f"Modo: {reporte['modo']}")
+    print(f"Productos actualizados: {reporte['actualizados']}")
+    for clave, titulo in (("no_encontrados", "No encontrados"), ("eliminados", "Eliminados"),
+                          ("stock_negativo", "Stock negativo (no aplicados)")):
+        if reporte[clave]:
+            print(f"{titulo}: {', '.join(str(i) for i in reporte[clave])}")
@@ -1,6 +1,18 @@
-from database import init_db
+from database import init_db, async_engine
 import asyncio
+import crud
+
+
+async def main():
+    try:
+        await init_db(forzar=True)
+        completadas = await crud.completar_snapshots_ventas()
+        if completadas:
+            print(f"Snapshot guardado en {completadas} ventas anteriores.")
+    finally:
+        await async_engine.dispose()
+
 
 if __name__ == "__main__":
-    asyncio.run(init_db())
+    asyncio.run(main())
     print("Database initialized.")
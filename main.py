@@ -1,4 +1,6 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from models import Categoria, Producto, Cliente, Venta
@@ -9,18 +11,150 @@ from schemas import (
     CategoriaCreate, ProductoCreate,
     # Nuevos esquemas de Cliente y Venta
     ClienteCreate, ClienteUpdate, ClienteResponse,
-    VentaCreate, VentaResponse
+    VentaCreate, VentaResponse,
+    HistorialResponse, ProductoBatchResponse, ClienteBatchResponse,
+    ProductoBulkUpdate, ResultadoMasivo, ResultadoInventario,
+    ProductoSeleccion, ClienteSeleccion, ResultadoIds,
+    CompraLote, ResultadoCompras,
+    SubidaFirmadaCreate, SubidaFirmadaResponse, SubidaFinalizar, SubidaFinalizada
 )
-from supabase_utils import upload_image_to_supabase
-from typing import Optional, List
+from supabase_utils import close_http_client, UploadTooLargeError, MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE
+import storage
+import resumable_uploads
+import media_cache
+import media_queue
+import media_gc
+import image_variants
+import warmup
+import static_pages
+import compression_middleware
+import assets
+import ventas_cache
+import base64
+from typing import AsyncIterator, Optional, List
+import asyncio
+import io
+import os
+import tempfile
+import jinja2
+from markupsafe import Markup
 from database import init_db
 from datetime import datetime
 
 app = FastAPI(title="API Tienda con SQLModel y Supabase")
+# gzip/brotli de las respuestas dinámicas (las páginas y assets ya van comprimidos)
+app.add_middleware(compression_middleware.CompresionMiddleware)
+
+# Directorio de la caché de bytecode de Jinja: las plantillas compiladas se
+# reutilizan entre reinicios y entre workers
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tienda_jinja_cache"))
+# El bytecode de una plantilla compilada en modo async es distinto: va en su propio directorio
+JINJA_CACHE_DIR_ASYNC = os.path.join(JINJA_CACHE_DIR, "async")
+os.makedirs(JINJA_CACHE_DIR_ASYNC, exist_ok=True)
 
 # Configurar archivos estáticos y templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+templates = Jinja2Templates(env=jinja2.Environment(
+    loader=jinja2.FileSystemLoader("templates"),
+    autoescape=True,
+    bytecode_cache=jinja2.FileSystemBytecodeCache(JINJA_CACHE_DIR),
+))
+# Entorno asíncrono para las páginas que se envían por partes (generate_async)
+templates_async = jinja2.Environment(
+    loader=jinja2.FileSystemLoader("templates"),
+    autoescape=True,
+    enable_async=True,
+    bytecode_cache=jinja2.FileSystemBytecodeCache(JINJA_CACHE_DIR_ASYNC),
+)
+# URLs de CSS/JS/imágenes con el nombre por contenido del build (assets.py)
+for _env in (templates.env, templates_async):
+    _env.globals["asset_url"] = assets.asset_url
+
+def _parsear_campos(fields: Optional[str], permitidos: set) -> Optional[List[str]]:
+    """
+    Convierte el parámetro `fields=a,b,c` en una lista de campos válidos.
+    Devuelve None si no se pidió, y lanza 400 si hay campos desconocidos.
+    """
+    if not fields:
+        return None
+    campos = [c.strip() for c in fields.split(",") if c.strip()]
+    desconocidos = [c for c in campos if c not in permitidos]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Campos no válidos: {', '.join(desconocidos)}")
+    return campos
+
+MAX_IDS_BATCH = 500
+
+def _parsear_ids(ids: str) -> List[int]:
+    """Convierte `ids=1,2,3` en una lista de enteros. Lanza 400 si no es válida."""
+    try:
+        lista = [int(i) for i in ids.split(",") if i.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids debe ser una lista de enteros separados por coma")
+    if not lista:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos un id")
+    if len(lista) > MAX_IDS_BATCH:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_IDS_BATCH} ids por consulta")
+    return lista
+
+# Tareas de variantes en curso; se guarda la referencia para que no se pierdan
+_tareas_variantes: set = set()
+
+def _programar_variantes(modelo, id: int, media_url: Optional[str]):
+    """Genera en segundo plano las miniaturas de la imagen recién asociada a un registro."""
+    if not media_url:
+        return
+
+    async def generar():
+        try:
+            variantes = await storage.generar_variantes(media_url)
+            if variantes:
+                await crud.guardar_variantes(modelo, id, media_url, variantes)
+        except Exception as e:
+            print(f"Error generando variantes de {media_url}: {e}")
+
+    tarea = asyncio.create_task(generar())
+    _tareas_variantes.add(tarea)
+    tarea.add_done_callback(_tareas_variantes.discard)
+
+async def _preparar_imagen(imagen: Optional[UploadFile]):
+    """
+    Sube la imagen de un formulario de alta o, en modo diferido (o con el
+    almacenamiento fallando), la deja en el spool para subirla en segundo
+    plano. Devuelve (media_url, trabajo_id); a lo sumo uno tiene valor.
+    """
+    if not imagen or not imagen.filename:
+        return None, None
+    if media_queue.usar_diferido():
+        return None, await media_queue.guardar_en_spool(imagen)
+    return await storage.upload_image(imagen), None
+
+def _encolar_imagen(trabajo_id: Optional[str], imagen: Optional[UploadFile], entidad: str, registro):
+    """
+    Encola la subida diferida del registro recién creado, o descarta el
+    spool si el alta falló (`registro` None, también cuando lanzó una excepción).
+    """
+    if trabajo_id is None:
+        return
+    if not registro:
+        media_queue.descartar(trabajo_id)
+        return
+    media_queue.encolar(trabajo_id, entidad, registro.id, imagen.filename, imagen.content_type)
+
+CAMPOS_PRODUCTO = set(ProductoListResponse.model_fields)
+CAMPOS_CLIENTE = set(ClienteResponse.model_fields)
+CAMPOS_VENTA = set(VentaResponse.model_fields) | {"detalles.producto", "detalles.producto.categoria"}
+
+@app.exception_handler(UploadTooLargeError)
+async def upload_demasiado_grande(request: Request, exc: UploadTooLargeError):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+@app.exception_handler(storage.StorageUnavailableError)
+async def almacenamiento_no_disponible(request: Request, exc: storage.StorageUnavailableError):
+    return JSONResponse(
+        status_code=503, content={"detail": str(exc)},
+        headers={"Retry-After": str(int(storage.circuito.segundos_para_probar()))},
+    )
 
 @app.on_event("startup")
 async def on_startup():
@@ -29,22 +163,69 @@ async def on_startup():
     al iniciar la aplicación.
     """
     await init_db()
+    # Manifiesto de build_assets.py: las páginas pre-renderizadas ya llevan las URLs con hash
+    assets.cargar()
+    # Páginas sin datos dinámicos: se renderizan y comprimen una sola vez
+    await asyncio.to_thread(static_pages.renderizar_todas, templates)
+    # Workers de subidas diferidas (retoma las que quedaron pendientes)
+    media_queue.iniciar(al_completar=_programar_variantes)
+    # Borrado periódico de imágenes que ya no usa ningún registro
+    media_gc.iniciar()
+    # Pool, consultas y plantillas en caliente; /ready responde 503 mientras tanto
+    warmup.iniciar(templates)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Detiene las subidas diferidas y cierra los pools de HTTP e imágenes."""
+    await warmup.detener()
+    await media_queue.detener()
+    await media_gc.detener()
+    await close_http_client()
+    storage.close_image_executor()
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 cuando el worker terminó de precalentarse, 503 mientras tanto."""
+    return JSONResponse(warmup.estado(), status_code=200 if warmup.listo() else 503)
 
 # -----------------------------------------------------------------------
 #                       ENDPOINTS PARA SERVIR HTML
 # -----------------------------------------------------------------------
 
+def _pagina_estatica(request: Request, nombre: str) -> Response:
+    """Sirve una página pre-renderizada (static_pages) con ETag y compresión."""
+    pagina = static_pages.obtener(templates, nombre)
+    headers = {"ETag": pagina["etag"], "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if _no_modificado(request, pagina["etag"]):
+        return Response(status_code=304, headers=headers)
+    codificacion, cuerpo = static_pages.cuerpo(pagina, request.headers.get("Accept-Encoding"))
+    if codificacion:
+        headers["Content-Encoding"] = codificacion
+    return Response(cuerpo, media_type="text/html", headers=headers)
+
+@app.get("/assets/{ruta:path}")
+async def servir_asset(ruta: str, request: Request):
+    """Archivo del build con hash en el nombre: nunca cambia, se sirve precomprimido e inmutable."""
+    encontrado = assets.archivo(ruta, request.headers.get("Accept-Encoding"))
+    if encontrado is None:
+        raise HTTPException(status_code=404, detail="No encontrado")
+    en_disco, tipo, codificacion = encontrado
+    headers = {"Cache-Control": CACHE_INMUTABLE, "Vary": "Accept-Encoding"}
+    if codificacion:
+        headers["Content-Encoding"] = codificacion
+    return FileResponse(en_disco, media_type=tipo, headers=headers)
+
 @app.get("/")
 async def home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return _pagina_estatica(request, "index.html")
 
 @app.get("/categorias/create")
 async def categorias_create(request: Request):
-    return templates.TemplateResponse("categorias/create.html", {"request": request})
+    return _pagina_estatica(request, "categorias/create.html")
 
 @app.get("/categorias/read")
 async def categorias_read(request: Request):
-    return templates.TemplateResponse("categorias/read.html", {"request": request})
+    return _pagina_estatica(request, "categorias/read.html")
 
 @app.get("/categorias/update")
 async def categorias_update(request: Request):
@@ -68,15 +249,15 @@ async def categorias_update(request: Request):
 
 @app.get("/categorias/delete")
 async def categorias_delete(request: Request):
-    return templates.TemplateResponse("categorias/delete.html", {"request": request})
+    return _pagina_estatica(request, "categorias/delete.html")
 
 @app.get("/productos/create")
 async def productos_create(request: Request):
-    return templates.TemplateResponse("productos/create.html", {"request": request})
+    return _pagina_estatica(request, "productos/create.html")
 
 @app.get("/productos/read")
 async def productos_read(request: Request):
-    return templates.TemplateResponse("productos/read.html", {"request": request})
+    return _pagina_estatica(request, "productos/read.html")
 
 @app.get("/productos/update")
 async def productos_update(request: Request, id: Optional[int] = None):
@@ -97,15 +278,15 @@ async def productos_update(request: Request, id: Optional[int] = None):
 
 @app.get("/productos/delete")
 async def productos_delete(request: Request):
-    return templates.TemplateResponse("productos/delete.html", {"request": request})
+    return _pagina_estatica(request, "productos/delete.html")
 
 @app.get("/clientes/create")
 async def clientes_create(request: Request):
-    return templates.TemplateResponse("clientes/create.html", {"request": request})
+    return _pagina_estatica(request, "clientes/create.html")
 
 @app.get("/clientes/read")
 async def clientes_read(request: Request):
-    return templates.TemplateResponse("clientes/read.html", {"request": request})
+    return _pagina_estatica(request, "clientes/read.html")
 
 @app.get("/clientes/update")
 async def clientes_update(request: Request):
@@ -124,67 +305,154 @@ async def clientes_update(request: Request):
 
 @app.get("/clientes/delete")
 async def clientes_delete(request: Request):
-    return templates.TemplateResponse("clientes/delete.html", {"request": request})
+    return _pagina_estatica(request, "clientes/delete.html")
 
 @app.get("/ventas/create")
 async def ventas_create(request: Request):
-    return templates.TemplateResponse("ventas/create.html", {"request": request})
+    return _pagina_estatica(request, "ventas/create.html")
+
+# Tamaño a partir del cual se envía lo renderizado aunque la plantilla no se haya detenido
+TAMANO_BLOQUE_HTML = 16 * 1024
+
+async def _transmitir_plantilla(nombre: str, contexto: dict):
+    """
+    Renderiza `nombre` con generate_async y envía el HTML por bloques. Lo
+    acumulado se envía al superar TAMANO_BLOQUE_HTML o en cuanto el render se
+    detiene a esperar (p. ej. el siguiente lote de la base de datos), para
+    que el navegador empiece a pintar enseguida. La cola acotada frena el
+    render si el cliente lee más despacio.
+    """
+    cola: asyncio.Queue = asyncio.Queue(maxsize=256)
+    fin = object()
+
+    async def producir():
+        try:
+            async for parte in templates_async.get_template(nombre).generate_async(contexto):
+                await cola.put(parte)
+        except Exception as e:
+            # El error viaja por la cola y se relanza en la respuesta
+            await cola.put(e)
+            return
+        await cola.put(fin)
+
+    tarea = asyncio.create_task(producir())
+    try:
+        bloque, tamano = [], 0
+        while True:
+            if bloque and (cola.empty() or tamano >= TAMANO_BLOQUE_HTML):
+                yield "".join(bloque).encode()
+                bloque, tamano = [], 0
+            parte = await cola.get()
+            if parte is fin:
+                break
+            if isinstance(parte, Exception):
+                raise parte
+            bloque.append(parte)
+            tamano += len(parte)
+        if bloque:
+            yield "".join(bloque).encode()
+    finally:
+        # Si el cliente se desconecta, se deja de renderizar
+        tarea.cancel()
+
+def _venta_html(venta) -> Markup:
+    """
+    Bloque HTML de una venta en /ventas/read (ventas/_venta.html). Recibe la
+    VentaResponse de crud.iterar_ventas, o el HTML que ya estaba en la caché.
+    """
+    if isinstance(venta, bytes):
+        return Markup(venta.decode())
+    html = templates.env.get_template("ventas/_venta.html").render(venta=venta).encode()
+    ventas_cache.guardar("html", venta.id, html)
+    return Markup(html.decode())
 
 @app.get("/ventas/read")
+# Se comprime bloque a bloque: niveles bajos para no retrasar cada envío
+@compression_middleware.niveles(gzip=4, br=3)
 async def ventas_read(
     request: Request,
     cliente_id: Optional[str] = Query(None),
     canal: Optional[str] = Query(None),
     fecha_inicio: Optional[str] = Query(None),
-    fecha_fin: Optional[str] = Query(None)
+    fecha_fin: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="Cursor de la página anterior (enlace 'Ventas anteriores')"),
+    limite: int = Query(100, ge=1, le=500, description="Ventas por página")
 ):
+    """
+    Ventas de la más reciente a la más antigua, paginadas por fecha. La página
+    se envía por partes mientras se leen las ventas por lotes, así que el
+    navegador empieza a pintar enseguida y la memoria del worker no depende
+    del número de ventas.
+    """
     # Convertir parámetros de string a tipos apropiados, manejando strings vacías
     cliente_id_int = int(cliente_id) if cliente_id and cliente_id.isdigit() else None
     canal_str = canal if canal else None
     fecha_inicio_dt = datetime.fromisoformat(fecha_inicio) if fecha_inicio else None
     fecha_fin_dt = datetime.fromisoformat(fecha_fin) if fecha_fin else None
 
-    ventas = await crud.obtener_ventas(
-        cliente_id=cliente_id_int,
-        canal_venta=canal_str,
-        fecha_inicio=fecha_inicio_dt,
-        fecha_fin=fecha_fin_dt
-    )
-
-    return templates.TemplateResponse("ventas/read.html", {
+    pagina = {}
+    try:
+        ventas = crud.iterar_ventas(
+            cliente_id=cliente_id_int,
+            canal_venta=canal_str,
+            fecha_inicio=fecha_inicio_dt,
+            fecha_fin=fecha_fin_dt,
+            cursor=cursor,
+            limite=limite,
+            pagina=pagina,
+            # Las ventas ya renderizadas no se vuelven a cargar de la base de datos
+            en_cache=lambda id: ventas_cache.obtener("html", id)
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    return StreamingResponse(_transmitir_plantilla("ventas/read.html", {
         "request": request,
         "ventas": ventas,
+        "venta_html": _venta_html,
+        "pagina": pagina,
+        "limite": limite,
         "filtros": {
             "cliente_id": cliente_id or "",
             "canal": canal or "",
             "fecha_inicio": fecha_inicio or "",
             "fecha_fin": fecha_fin or ""
         }
-    })
+    }), media_type="text/html")
 
 @app.get("/historial")
 async def historial(request: Request):
-    return templates.TemplateResponse("historial.html", {"request": request})
+    return _pagina_estatica(request, "historial.html")
+
+@app.get("/historial/data", response_model=HistorialResponse)
+async def obtener_historial(
+    cursor: Optional[str] = Query(None, description="Cursor devuelto por la página anterior"),
+    limite: int = Query(50, ge=1, le=200, description="Máximo de filas por sección")
+):
+    try:
+        return await crud.obtener_historial(cursor=cursor, limite=limite)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
 
 @app.get("/developer-info")
 async def developer_info(request: Request):
-    return templates.TemplateResponse("developer-info.html", {"request": request})
+    return _pagina_estatica(request, "developer-info.html")
 
 @app.get("/planning")
 async def planning(request: Request):
-    return templates.TemplateResponse("planning.html", {"request": request})
+    return _pagina_estatica(request, "planning.html")
 
 @app.get("/design")
 async def design(request: Request):
-    return templates.TemplateResponse("design.html", {"request": request})
+    return _pagina_estatica(request, "design.html")
 
 @app.get("/informacion-del-proyecto")
 async def informacion_del_proyecto(request: Request):
-    return templates.TemplateResponse("informacion-del-proyecto.html", {"request": request})
+    return _pagina_estatica(request, "informacion-del-proyecto.html")
 
 @app.get("/charts")
 async def charts(request: Request):
-    return templates.TemplateResponse("charts.html", {"request": request})
+    return _pagina_estatica(request, "charts.html")
 
 @app.get("/api/charts/sales-by-month")
 async def get_sales_by_month():
@@ -242,20 +510,24 @@ async def crear_categoria(
     activa: Optional[bool] = Form(True),
     imagen: Optional[UploadFile] = File(None)
 ):
-    imagen_url = None
-    if imagen and imagen.filename:
-        imagen_url = await upload_image_to_supabase(imagen)
-
+    # Se valida antes de subir o guardar la imagen en el spool
     categoria_data = CategoriaCreate(
         nombre=nombre,
         descripcion=descripcion,
         activa=activa,
-        media_url=imagen_url
     )
-    categoria_creada = await crud.crear_categoria(categoria_data)
+    imagen_url, trabajo_id = await _preparar_imagen(imagen)
+    categoria_data.media_url = imagen_url
+    try:
+        categoria_creada = await crud.crear_categoria(categoria_data, media_status="pending" if trabajo_id else None)
+    except BaseException:
+        _encolar_imagen(trabajo_id, imagen, "categoria", None)
+        raise
+    _encolar_imagen(trabajo_id, imagen, "categoria", categoria_creada)
     if not categoria_creada:
         error_message = "Categoría ya existe o error en la creación"
         return templates.TemplateResponse("categorias/create.html", {"request": request, "error_message": error_message})
+    _programar_variantes(Categoria, categoria_creada.id, imagen_url)
 
     return templates.TemplateResponse("categorias/create.html", {"request": request, "success": True, "categoria": categoria_creada})
 
@@ -287,8 +559,15 @@ async def obtener_categoria(id: int):
     return categoria
 
 @app.get("/categorias/{id}/productos", response_model=CategoriaConProductos)
-async def obtener_categoria_con_productos(id: int):
-    categoria = await crud.obtener_categoria_con_productos(id)
+async def obtener_categoria_con_productos(
+    id: int,
+    cursor: Optional[str] = Query(None, description="Cursor devuelto por la página anterior"),
+    limite: int = Query(50, ge=1, le=200, description="Máximo de productos por página")
+):
+    try:
+        categoria = await crud.obtener_categoria_con_productos(id, cursor=cursor, limite=limite)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
     if not categoria:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     return categoria
@@ -304,7 +583,7 @@ async def actualizar_categoria(
 ):
     imagen_url = None
     if imagen and imagen.filename:
-        imagen_url = await upload_image_to_supabase(imagen)
+        imagen_url = await storage.upload_image(imagen)
 
     categoria_update_data = CategoriaUpdate(
         nombre=nombre,
@@ -324,6 +603,7 @@ async def actualizar_categoria(
     categoria = await crud.actualizar_categoria(id, CategoriaUpdate(**categoria_update_data_filtered))
     if not categoria:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
+    _programar_variantes(Categoria, id, imagen_url)
 
     return categoria # Devuelve JSON
 
@@ -360,10 +640,7 @@ async def crear_producto(
 ):
     from sqlalchemy.exc import IntegrityError
 
-    imagen_url = None
-    if imagen and imagen.filename:
-        imagen_url = await upload_image_to_supabase(imagen)
-
+    # Se valida antes de subir o guardar la imagen en el spool
     producto_data = ProductoCreate(
         nombre=nombre,
         descripcion=descripcion,
@@ -371,14 +648,21 @@ async def crear_producto(
         stock=stock,
         activo=activo,
         categoria_id=categoria_id,
-        media_url=imagen_url
     )
+    imagen_url, trabajo_id = await _preparar_imagen(imagen)
+    producto_data.media_url = imagen_url
 
     try:
-        producto_creado = await crud.crear_producto(producto_data)
+        try:
+            producto_creado = await crud.crear_producto(producto_data, media_status="pending" if trabajo_id else None)
+        except BaseException:
+            _encolar_imagen(trabajo_id, imagen, "producto", None)
+            raise
+        _encolar_imagen(trabajo_id, imagen, "producto", producto_creado)
         if not producto_creado:
             error_message = "Error en la creación del producto"
             return templates.TemplateResponse("productos/create.html", {"request": request, "error_message": error_message})
+        _programar_variantes(Producto, producto_creado.id, imagen_url)
 
         return templates.TemplateResponse("productos/create.html", {"request": request, "success": True, "producto": producto_creado})
     except IntegrityError as e:
@@ -400,8 +684,10 @@ async def obtener_productos(
     stock: Optional[str] = Query(None),
     stock_min: Optional[str] = Query(None),
     stock_max: Optional[str] = Query(None),
-    activo: Optional[str] = Query(None)
+    activo: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma (e.g. 'id,nombre,precio,stock')")
 ):
+    campos = _parsear_campos(fields, CAMPOS_PRODUCTO)
     # Convertir parámetros de str a tipos apropiados
     id_int = int(id) if id and id.isdigit() else None
     precio_float = float(precio) if precio else None
@@ -419,7 +705,7 @@ async def obtener_productos(
             activo_bool = False
         # Si está vacío o no reconocido, dejar como None
 
-    return await crud.obtener_productos(
+    productos = await crud.obtener_productos(
         id=id_int,
         nombre=nombre,
         precio=precio_float,
@@ -429,10 +715,68 @@ async def obtener_productos(
         stock=stock_int,
         stock_min=stock_min_int,
         stock_max=stock_max_int,
-        activo=activo_bool
+        activo=activo_bool,
+        campos=campos
     )
+    if campos is not None:
+        # Respuesta parcial: no se valida contra el esquema completo
+        return JSONResponse(content=jsonable_encoder(productos))
+    return productos
 
 # === RUTA ESPECÍFICA DEBE IR ANTES DE LA RUTA DINÁMICA ===
+@app.get("/productos/batch", response_model=ProductoBatchResponse)
+async def obtener_productos_batch(ids: str = Query(..., description="IDs separados por coma (e.g. '1,2,3')")):
+    return await crud.obtener_productos_por_ids(_parsear_ids(ids))
+
+@app.patch("/productos/bulk", response_model=ResultadoMasivo)
+async def actualizar_productos_masivo(datos: ProductoBulkUpdate):
+    """
+    Actualiza muchos productos en una sola sentencia: por lista de cambios
+    por id (`patches`) o por filtro con una expresión (e.g. precio * 1.08
+    para categoria_id = 3).
+    """
+    try:
+        if datos.patches is not None:
+            actualizados = await crud.actualizar_productos_masivo(
+                [p.model_dump(exclude_unset=True) for p in datos.patches]
+            )
+        else:
+            cambios = datos.model_dump(include={"precio", "stock", "activo", "categoria_id"}, exclude_none=True)
+            actualizados = await crud.actualizar_productos_por_filtro(
+                datos.filtro.model_dump(exclude_none=True), cambios
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"actualizados": actualizados}
+
+@app.post("/productos/bulk/eliminar", response_model=ResultadoIds)
+async def eliminar_productos_masivo(seleccion: ProductoSeleccion):
+    filtro = seleccion.filtro.model_dump(exclude_none=True) if seleccion.filtro else None
+    return {"ids": await crud.eliminar_productos_masivo(ids=seleccion.ids, filtro=filtro)}
+
+@app.patch("/productos/bulk/desactivar", response_model=ResultadoIds)
+async def desactivar_productos_masivo(seleccion: ProductoSeleccion):
+    filtro = seleccion.filtro.model_dump(exclude_none=True) if seleccion.filtro else None
+    return {"ids": await crud.desactivar_productos_masivo(ids=seleccion.ids, filtro=filtro)}
+
+@app.post("/productos/inventario", response_model=ResultadoInventario)
+async def importar_inventario(
+    archivo: UploadFile = File(..., description="CSV con 'producto_id,stock' o 'producto_id,delta'"),
+    modo: Optional[str] = Form(None, description="'absoluto' o 'relativo' (por defecto según la cabecera)")
+):
+    """
+    Importa un conteo de inventario. El archivo queda en el archivo temporal
+    de la subida y se aplica por lotes, con un UPDATE por lote, en una sola
+    transacción.
+    """
+    lineas = io.TextIOWrapper(archivo.file, encoding="utf-8-sig", newline="")
+    try:
+        # La cabecera se lee en un hilo; el resto, por lotes dentro de importar_inventario
+        modo, filas = await asyncio.to_thread(crud.leer_csv_inventario, lineas, modo or None)
+        return await crud.importar_inventario(filas, modo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/productos/eliminados", response_model=list[ProductoEliminado])
 async def obtener_productos_eliminados():
     return await crud.obtener_productos_eliminados()
@@ -467,7 +811,7 @@ async def actualizar_producto(
 ):
     imagen_url = None
     if imagen and imagen.filename: 
-        imagen_url = await upload_image_to_supabase(imagen)
+        imagen_url = await storage.upload_image(imagen)
 
     producto_update_data = ProductoUpdate(
         nombre=nombre,
@@ -489,6 +833,7 @@ async def actualizar_producto(
     producto_actualizado = await crud.actualizar_producto(id, ProductoUpdate(**producto_update_data_filtered))
     if not producto_actualizado:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
+    _programar_variantes(Producto, id, imagen_url)
     return producto_actualizado
 
 @app.patch("/productos/{id}/desactivar", response_model=Producto)
@@ -523,35 +868,52 @@ async def crear_cliente(
     canal: str = Form(...),
     imagen: Optional[UploadFile] = File(None)
 ):
-    imagen_url = None
-    if imagen and imagen.filename:
-        imagen_url = await upload_image_to_supabase(imagen) 
-
+    # Se valida antes de subir o guardar la imagen en el spool
     cliente_data = ClienteCreate(
         nombre=nombre,
         ciudad=ciudad,
         canal=canal,
-        media_url=imagen_url
     )
-    cliente_creado = await crud.crear_cliente(cliente_data)
+    imagen_url, trabajo_id = await _preparar_imagen(imagen)
+    cliente_data.media_url = imagen_url
+    try:
+        cliente_creado = await crud.crear_cliente(cliente_data, media_status="pending" if trabajo_id else None)
+    except BaseException:
+        _encolar_imagen(trabajo_id, imagen, "cliente", None)
+        raise
+    _encolar_imagen(trabajo_id, imagen, "cliente", cliente_creado)
     if not cliente_creado:
         raise HTTPException(status_code=400, detail="Error en la creación del cliente")
+    _programar_variantes(Cliente, cliente_creado.id, imagen_url)
     return cliente_creado
 
 @app.get("/clientes/", response_model=list[ClienteResponse])
 async def obtener_clientes(
     nombre: Optional[str] = Query(None, description="Filtrar por nombre parcial"),
     ciudad: Optional[str] = Query(None, description="Filtrar por ciudad parcial"),
-    canal: Optional[str] = Query(None, description="Filtrar por canal (e.g., 'web', 'tienda')")
+    canal: Optional[str] = Query(None, description="Filtrar por canal (e.g., 'web', 'tienda')"),
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma")
 ):
+    campos = _parsear_campos(fields, CAMPOS_CLIENTE)
     nombre_filter = nombre if nombre else None
     ciudad_filter = ciudad if ciudad else None
     canal_filter = canal if canal else None
 
-    clientes = await crud.obtener_clientes(nombre=nombre_filter, ciudad=ciudad_filter, canal=canal_filter)
+    clientes = await crud.obtener_clientes(nombre=nombre_filter, ciudad=ciudad_filter, canal=canal_filter, campos=campos)
+    if campos is not None:
+        return JSONResponse(content=jsonable_encoder(clientes))
     return clientes
 
 # === RUTA ESPECÍFICA DEBE IR ANTES DE LA RUTA DINÁMICA ===
+@app.get("/clientes/batch", response_model=ClienteBatchResponse)
+async def obtener_clientes_batch(ids: str = Query(..., description="IDs separados por coma (e.g. '1,2,3')")):
+    return await crud.obtener_clientes_por_ids(_parsear_ids(ids))
+
+@app.post("/clientes/bulk/eliminar", response_model=ResultadoIds)
+async def eliminar_clientes_masivo(seleccion: ClienteSeleccion):
+    filtro = seleccion.filtro.model_dump(exclude_none=True) if seleccion.filtro else None
+    return {"ids": await crud.eliminar_clientes_masivo(ids=seleccion.ids, filtro=filtro)}
+
 @app.get("/clientes/eliminados", response_model=list[ClienteResponse])
 async def obtener_clientes_eliminados():
     return await crud.obtener_clientes_eliminados()
@@ -574,7 +936,7 @@ async def actualizar_cliente(
 ):
     imagen_url = None
     if imagen and imagen.filename:
-        imagen_url = await upload_image_to_supabase(imagen)
+        imagen_url = await storage.upload_image(imagen)
 
     cliente_update_data = ClienteUpdate(
         nombre=nombre,
@@ -593,6 +955,7 @@ async def actualizar_cliente(
     cliente_actualizado = await crud.actualizar_cliente(id, ClienteUpdate(**cliente_update_data_filtered))
     if not cliente_actualizado:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    _programar_variantes(Cliente, id, imagen_url)
     return cliente_actualizado
 
 @app.delete("/clientes/{id}")
@@ -663,12 +1026,16 @@ async def crear_venta(request: Request):
     return templates.TemplateResponse("ventas/create.html", {"request": request, "success": True, "venta": venta_creada})
 
 @app.get("/ventas/", response_model=List[VentaResponse])
+# Listado sin paginar: puede ser grande y se repite mucho entre ventas
+@compression_middleware.niveles(br=5)
 async def obtener_ventas(
     cliente_id: Optional[str] = Query(None, description="Filtrar por ID de cliente"),
     canal: Optional[str] = Query(None, description="Filtrar por canal de venta ('presencial' o 'virtual')"),
     fecha_inicio: Optional[str] = Query(None, description="Fecha de inicio (ISO 8601)"),
-    fecha_fin: Optional[str] = Query(None, description="Fecha de fin (ISO 8601)")
+    fecha_fin: Optional[str] = Query(None, description="Fecha de fin (ISO 8601)"),
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma (e.g. 'id,total,cliente,detalles.producto')")
 ):
+    campos = _parsear_campos(fields, CAMPOS_VENTA)
     # Convertir parámetros de string a tipos apropiados, manejando strings vacías
     cliente_id_int = int(cliente_id) if cliente_id and cliente_id.isdigit() else None
     canal_str = canal if canal else None
@@ -696,13 +1063,295 @@ async def obtener_ventas(
         cliente_id=cliente_id_int,
         canal_venta=canal_str,
         fecha_inicio=fecha_inicio_dt,
-        fecha_fin=fecha_fin_dt
+        fecha_fin=fecha_fin_dt,
+        campos=campos
     )
+    if campos is not None:
+        return JSONResponse(content=jsonable_encoder(ventas))
     return ventas
 
 @app.get("/ventas/{id}", response_model=VentaResponse)
-async def obtener_venta(id: int):
-    venta = await crud.obtener_venta(id)
-    if not venta:
-        raise HTTPException(status_code=404, detail="Venta no encontrada")
-    return venta
\ No newline at end of file
+async def obtener_venta(
+    id: int,
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma")
+):
+    """
+    Una venta no cambia después de creada: se responde con caché inmutable y
+    el JSON completo se serializa una sola vez (ventas_cache).
+    """
+    campos = _parsear_campos(fields, CAMPOS_VENTA)
+    if campos is not None:
+        venta = await crud.obtener_venta(id, campos=campos)
+        if not venta:
+            raise HTTPException(status_code=404, detail="Venta no encontrada")
+        return JSONResponse(content=jsonable_encoder(venta), headers={"Cache-Control": CACHE_INMUTABLE})
+
+    cuerpo = ventas_cache.obtener("json", id)
+    if cuerpo is None:
+        venta = await crud.obtener_venta(id)
+        if not venta:
+            raise HTTPException(status_code=404, detail="Venta no encontrada")
+        cuerpo = venta.model_dump_json().encode()
+        ventas_cache.guardar("json", id, cuerpo)
+    return Response(cuerpo, media_type="application/json", headers={"Cache-Control": CACHE_INMUTABLE})
+
+
+# -----------------------------------------------------------------------
+#                       ENDPOINTS DE COMPRAS 📥
+# -----------------------------------------------------------------------
+
+@app.post("/compras/", response_model=ResultadoCompras)
+async def registrar_compras(compra: CompraLote):
+    """
+    Registra un lote de compras (hasta 10.000 líneas) y suma las cantidades
+    al stock de los productos, todo en una sola transacción.
+    """
+    lineas = (linea.model_dump(exclude_none=True) for linea in compra.lineas)
+    try:
+        return await crud.registrar_compras(lineas, cliente_id=compra.cliente_id, fecha=compra.fecha)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/compras/csv", response_model=ResultadoCompras)
+async def registrar_compras_csv(
+    archivo: UploadFile = File(..., description="CSV con cabecera 'producto_id,cantidad,precio_unitario[,cliente_id]'"),
+    cliente_id: Optional[int] = Form(None)
+):
+    """Igual que POST /compras/ pero leyendo las líneas de un CSV por lotes."""
+    lineas = io.TextIOWrapper(archivo.file, encoding="utf-8-sig", newline="")
+    try:
+        return await crud.registrar_compras(crud.leer_csv_compras(lineas), cliente_id=cliente_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# -----------------------------------------------------------------------
+#                 SUBIDAS REANUDABLES (protocolo estilo TUS)
+# -----------------------------------------------------------------------
+
+TUS_HEADERS = {"Tus-Resumable": "1.0.0"}
+
+def _parsear_upload_metadata(valor: Optional[str]) -> dict:
+    """Decodifica el header Upload-Metadata: 'clave base64,clave2 base64'."""
+    metadata = {}
+    for par in (valor or "").split(","):
+        partes = par.strip().split(" ")
+        if not partes[0]:
+            continue
+        try:
+            metadata[partes[0]] = base64.b64decode(partes[1]).decode() if len(partes) > 1 else ""
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPException(status_code=400, detail="Upload-Metadata inválido")
+    return metadata
+
+async def _asociar_media(entidad: Optional[str], id: Optional[str], media_url: str):
+    """
+    Guarda media_url en la categoría, producto o cliente indicado. Devuelve
+    el registro actualizado, o None si la entidad o el id no son válidos.
+    """
+    actualizaciones = {
+        "categoria": (crud.actualizar_categoria, CategoriaUpdate, Categoria),
+        "producto": (crud.actualizar_producto, ProductoUpdate, Producto),
+        "cliente": (crud.actualizar_cliente, ClienteUpdate, Cliente),
+    }
+    if entidad not in actualizaciones or not id or not id.isdigit():
+        return None
+    actualizar, esquema, modelo = actualizaciones[entidad]
+    registro = await actualizar(int(id), esquema(media_url=media_url))
+    if registro:
+        _programar_variantes(modelo, int(id), media_url)
+    return registro
+
+@app.options("/uploads/")
+async def opciones_subida():
+    return Response(status_code=204, headers={
+        **TUS_HEADERS,
+        "Tus-Version": "1.0.0",
+        "Tus-Extension": "creation",
+        "Tus-Max-Size": str(resumable_uploads.MAX_RESUMABLE_SIZE),
+    })
+
+@app.post("/uploads/", status_code=201)
+async def crear_subida(request: Request):
+    """
+    Crea una subida reanudable. Headers: Upload-Length y Upload-Metadata
+    (filename, filetype y opcionalmente entidad + id para asociar la imagen
+    a una categoría, producto o cliente al terminar).
+    """
+    try:
+        longitud = int(request.headers.get("Upload-Length", ""))
+        upload_id = resumable_uploads.crear_subida(
+            longitud, _parsear_upload_metadata(request.headers.get("Upload-Metadata"))
+        )
+    except ValueError as e:
+        if isinstance(e, UploadTooLargeError):
+            raise
+        raise HTTPException(status_code=400, detail="Upload-Length inválido")
+    return Response(status_code=201, headers={**TUS_HEADERS, "Location": f"/uploads/{upload_id}"})
+
+@app.head("/uploads/{upload_id}")
+async def estado_subida(upload_id: str):
+    try:
+        estado = resumable_uploads.estado_subida(upload_id)
+    except resumable_uploads.UploadNotFoundError:
+        raise HTTPException(status_code=404, detail="Subida no encontrada")
+    headers = {
+        **TUS_HEADERS,
+        "Upload-Offset": str(estado["offset"]),
+        "Upload-Length": str(estado["longitud"]),
+        "Cache-Control": "no-store",
+    }
+    if estado["media_url"]:
+        headers["X-Media-Url"] = estado["media_url"]
+    return Response(status_code=200, headers=headers)
+
+@app.patch("/uploads/{upload_id}")
+async def anexar_subida(upload_id: str, request: Request):
+    """Recibe el siguiente tramo del archivo a partir de Upload-Offset."""
+    if request.headers.get("Content-Type") != "application/offset+octet-stream":
+        raise HTTPException(status_code=415, detail="Content-Type debe ser application/offset+octet-stream")
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Upload-Offset inválido")
+
+    try:
+        estado = await resumable_uploads.anexar(upload_id, offset, request.stream())
+    except resumable_uploads.UploadNotFoundError:
+        raise HTTPException(status_code=404, detail="Subida no encontrada")
+    except resumable_uploads.OffsetMismatchError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Upload-Offset": str(e.offset)})
+
+    headers = {**TUS_HEADERS, "Upload-Offset": str(estado["offset"])}
+    if estado["media_url"]:
+        headers["X-Media-Url"] = estado["media_url"]
+        metadata = estado["metadata"]
+        await _asociar_media(metadata.get("entidad"), metadata.get("id"), estado["media_url"])
+    return Response(status_code=204, headers=headers)
+
+
+# -----------------------------------------------------------------------
+#        SUBIDAS DIRECTAS AL ALMACENAMIENTO (URL firmada + finalizar)
+# -----------------------------------------------------------------------
+
+@app.post("/media/firmar", response_model=SubidaFirmadaResponse)
+async def firmar_subida(datos: SubidaFirmadaCreate):
+    """
+    Devuelve una URL firmada para que el navegador suba la imagen directo al
+    almacenamiento. Luego se llama a POST /media/finalizar con la `key`.
+    """
+    key = storage.nueva_clave(datos.filename)
+    try:
+        firmada = await storage.get_storage().create_signed_upload(key, datos.content_type)
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return SubidaFirmadaResponse(key=key, upload_url=firmada["url"], method=firmada["method"],
+                                 headers=firmada["headers"], token=storage.firmar_clave(key, datos.entidad))
+
+@app.post("/media/finalizar", response_model=SubidaFinalizada)
+async def finalizar_subida(datos: SubidaFinalizar):
+    """
+    Verifica que la key sea una de las entregadas por POST /media/firmar para
+    esa entidad, que el objeto exista y no supere MAX_UPLOAD_SIZE, y lo
+    asocia al registro.
+    """
+    if not storage.clave_valida(datos.key):
+        raise HTTPException(status_code=400, detail="key inválida")
+    if not storage.verificar_clave(datos.key, datos.entidad, datos.token):
+        raise HTTPException(status_code=403, detail="token inválido para esta key")
+    backend = storage.get_storage()
+    try:
+        tamano = await backend.size(datos.key)
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    if tamano is None:
+        raise HTTPException(status_code=404, detail="El archivo no fue subido")
+    if tamano > MAX_UPLOAD_SIZE:
+        await backend.delete([datos.key])
+        raise UploadTooLargeError(MAX_UPLOAD_SIZE)
+
+    media_url = backend.public_url(datos.key)
+    if await _asociar_media(datos.entidad, str(datos.id), media_url) is None:
+        raise HTTPException(status_code=404, detail=f"{datos.entidad.capitalize()} no encontrado")
+    return SubidaFinalizada(media_url=media_url)
+
+@app.put("/media/local/upload/{key}", status_code=204)
+async def subir_local(key: str, request: Request, expira: int = Query(...), token: str = Query(...)):
+    """
+    Destino de las URLs firmadas cuando STORAGE_BACKEND=local. Cada URL sirve
+    para una sola subida: un objeto ya subido se sirve con caché inmutable y
+    no se puede reemplazar.
+    """
+    backend = storage.get_storage()
+    if not isinstance(backend, storage.LocalStorage):
+        raise HTTPException(status_code=404, detail="No encontrado")
+    if not storage.clave_valida(key) or not backend.verificar_firma(key, expira, token):
+        raise HTTPException(status_code=403, detail="Firma inválida o vencida")
+    try:
+        await backend.upload(key, storage.limit_size(request.stream(), MAX_UPLOAD_SIZE), reemplazar=False)
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail="El archivo ya fue subido")
+    return Response(status_code=204)
+
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+
+def _no_modificado(request: Request, etag: str) -> bool:
+    """Indica si el If-None-Match del cliente ya incluye `etag`."""
+    enviados = [e.strip().removeprefix("W/") for e in request.headers.get("If-None-Match", "").split(",")]
+    return etag in enviados or "*" in enviados
+
+@app.get("/media/local/{key}")
+async def servir_local(key: str, request: Request):
+    backend = storage.get_storage()
+    if not isinstance(backend, storage.LocalStorage) or not storage.clave_valida(key):
+        raise HTTPException(status_code=404, detail="No encontrado")
+    ruta = backend.path(key)
+    if not os.path.exists(ruta):
+        raise HTTPException(status_code=404, detail="No encontrado")
+    etag = storage.etag(key)
+    if _no_modificado(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_INMUTABLE})
+    return FileResponse(ruta, headers={"ETag": etag, "Cache-Control": CACHE_INMUTABLE})
+
+async def _leer_abierto(archivo) -> AsyncIterator[bytes]:
+    """Lee un archivo ya abierto por bloques sin bloquear el event loop y lo cierra al terminar."""
+    try:
+        while chunk := await asyncio.to_thread(archivo.read, UPLOAD_CHUNK_SIZE):
+            yield chunk
+    finally:
+        archivo.close()
+
+@app.get("/media/{key}")
+async def imagen_redimensionada(
+    key: str,
+    request: Request,
+    w: int = Query(0, ge=0, le=media_cache.MAX_DIMENSION, description="Ancho máximo en px (0 = sin límite)"),
+    h: int = Query(0, ge=0, le=media_cache.MAX_DIMENSION, description="Alto máximo en px (0 = sin límite)"),
+    fmt: str = Query("webp", description="webp, jpeg o png"),
+):
+    """
+    Devuelve la imagen `key` reducida a w x h en el formato pedido. Las
+    variantes se guardan en una caché LRU en disco y, como las claves nunca
+    cambian de contenido, se sirven con caché inmutable.
+    """
+    if not storage.clave_valida(key):
+        raise HTTPException(status_code=404, detail="No encontrado")
+    if fmt not in media_cache.FORMATOS:
+        raise HTTPException(status_code=400, detail=f"fmt debe ser uno de: {', '.join(media_cache.FORMATOS)}")
+    if not image_variants.disponible():
+        raise HTTPException(status_code=501, detail="Redimensionado no disponible (Pillow no instalado)")
+    # La clave identifica el contenido, así que el ETag no depende del render
+    etag = f'"{key.rsplit(".", 1)[0]}.{w}x{h}.{fmt}"'
+    if _no_modificado(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_INMUTABLE})
+    try:
+        archivo = await media_cache.obtener_variante(key, w, h, fmt)
+    except media_cache.OriginalNotFoundError:
+        raise HTTPException(status_code=404, detail="No encontrado")
+    except image_variants.UnidentifiedImageError:
+        raise HTTPException(status_code=415, detail="El archivo no es una imagen")
+    tamano = archivo.seek(0, os.SEEK_END)
+    archivo.seek(0)
+    return StreamingResponse(_leer_abierto(archivo), media_type=media_cache.FORMATOS[fmt], headers={
+        "ETag": etag, "Cache-Control": CACHE_INMUTABLE, "Content-Length": str(tamano),
+    })
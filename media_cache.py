@@ -0,0 +1,126 @@
+import asyncio
+import io
+import os
+import tempfile
+import uuid
+from typing import BinaryIO, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso en desarrollo, no hace falta bloqueo
+    fcntl = None
+
+import image_variants
+import storage
+
+# Directorio de las variantes redimensionadas bajo demanda
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tienda_media_cache"))
+# Espacio máximo en disco del directorio (entre todos los workers); al superarlo
+# se borran las variantes usadas hace más tiempo
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Lado máximo (px) que se puede pedir a GET /media/{key}
+MAX_DIMENSION = int(os.getenv("MEDIA_MAX_DIMENSION", "2000"))
+FORMATOS = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+
+class OriginalNotFoundError(LookupError):
+    """El objeto original no existe en el almacenamiento."""
+
+
+# Renders en curso: las peticiones simultáneas de la misma variante esperan la misma tarea
+_en_curso: dict = {}
+
+
+def _abrir(ruta: str) -> Optional[BinaryIO]:
+    """Abre una variante y la marca como recién usada, o None si no está en disco."""
+    try:
+        archivo = open(ruta, "rb")
+    except FileNotFoundError:
+        return None
+    try:
+        # El mtime es el orden LRU que comparten todos los workers (y sobrevive a reinicios)
+        os.utime(ruta)
+    except OSError:
+        # Otro worker la acaba de desalojar; el descriptor abierto sigue siendo válido
+        pass
+    return archivo
+
+
+def _recortar():
+    """
+    Borra las variantes usadas hace más tiempo hasta que MEDIA_CACHE_DIR vuelve
+    a MEDIA_CACHE_MAX_BYTES. El directorio lo comparten todos los workers, así
+    que se recorre entero bajo un flock en lugar de llevar la cuenta en memoria.
+    Las respuestas que ya abrieron un archivo borrado lo siguen leyendo.
+    """
+    with open(os.path.join(MEDIA_CACHE_DIR, ".lock"), "a") as candado:
+        if fcntl is not None:
+            fcntl.flock(candado, fcntl.LOCK_EX)
+        archivos = []
+        for entrada in os.scandir(MEDIA_CACHE_DIR):
+            if entrada.name.startswith(".") or entrada.name.endswith(".tmp"):
+                continue
+            try:
+                info = entrada.stat()
+            except OSError:
+                continue
+            archivos.append((info.st_mtime, entrada.name, info.st_size))
+        total = sum(tamano for _, _, tamano in archivos)
+        # La más reciente se conserva aunque sola supere el límite
+        for _, nombre, tamano in sorted(archivos)[:-1]:
+            if total <= MEDIA_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(os.path.join(MEDIA_CACHE_DIR, nombre))
+            except OSError:
+                pass
+            total -= tamano
+
+
+async def _renderizar(key: str, ancho: int, alto: int, formato: str, nombre: str):
+    try:
+        original = await storage.descargar_temporal(key)
+    except (FileNotFoundError, RuntimeError):
+        raise OriginalNotFoundError(key)
+    try:
+        loop = asyncio.get_running_loop()
+        datos = await loop.run_in_executor(
+            storage.get_image_executor(), image_variants.renderizar, original, ancho, alto, formato
+        )
+    finally:
+        os.remove(original)
+
+    os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
+    ruta = os.path.join(MEDIA_CACHE_DIR, nombre)
+    temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+    with open(temporal, "wb") as f:
+        await asyncio.to_thread(f.write, datos)
+    os.replace(temporal, ruta)
+    await asyncio.to_thread(_recortar)
+    return datos
+
+
+async def obtener_variante(key: str, ancho: int = 0, alto: int = 0, formato: str = "webp") -> BinaryIO:
+    """
+    Devuelve `key` reducida a ancho x alto (0 = sin límite) en `formato`,
+    abierta para leer (el llamador la cierra). Si no está en la caché se
+    genera una sola vez aunque lleguen varias peticiones a la vez.
+
+    Como se devuelve ya abierta, que otro worker la desaloje después no
+    afecta a esta respuesta.
+    """
+    nombre = f"{key.rsplit('.', 1)[0]}.{ancho}x{alto}.{formato}"
+    ruta = os.path.join(MEDIA_CACHE_DIR, nombre)
+    archivo = _abrir(ruta)
+    if archivo is not None:
+        return archivo
+
+    tarea = _en_curso.get(nombre)
+    if tarea is None:
+        tarea = asyncio.ensure_future(_renderizar(key, ancho, alto, formato, nombre))
+        _en_curso[nombre] = tarea
+        tarea.add_done_callback(lambda _: _en_curso.pop(nombre, None))
+    # shield: si una petición se cancela, las demás siguen esperando el render
+    datos = await asyncio.shield(tarea)
+    # Si otro worker ya la desalojó, se sirve lo que se acaba de generar
+    return _abrir(ruta) or io.BytesIO(datos)
@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import crud
+import storage
+
+# Cada cuánto (segundos) corre la recolección dentro de la aplicación; 0 la desactiva
+MEDIA_GC_INTERVAL = float(os.getenv("MEDIA_GC_INTERVAL", str(24 * 3600)))
+# Solo se borran objetos sin cambios durante este tiempo (subidas en curso, URLs firmadas sin finalizar)
+MEDIA_GC_GRACE = float(os.getenv("MEDIA_GC_GRACE", str(24 * 3600)))
+# Las imágenes de registros eliminados (soft delete) se conservan estos días
+MEDIA_GC_RETENCION_DIAS = int(os.getenv("MEDIA_GC_RETENCION_DIAS", "30"))
+TAMANO_PAGINA_GC = int(os.getenv("MEDIA_GC_PAGE_SIZE", "1000"))
+TAMANO_LOTE_GC = int(os.getenv("MEDIA_GC_BATCH_SIZE", "100"))
+
+_tarea = None
+
+
+def _raiz(key: str) -> str:
+    """Parte común de un original y sus variantes: `{hash}.png` y `{hash}.w150.webp` -> `{hash}`."""
+    return key.split(".", 1)[0]
+
+
+def _es_variante(key: str) -> bool:
+    return key.count(".") > 1
+
+
+def _urls_originales(grupos: list) -> dict:
+    """URL pública -> raíz de cada original de los grupos (incluida la forma con "?" final)."""
+    backend = storage.get_storage()
+    urls = {}
+    for objetos in grupos:
+        for o in objetos:
+            if not _es_variante(o["key"]):
+                url = backend.public_url(o["key"])
+                urls[url] = urls[url + "?"] = _raiz(o["key"])
+    return urls
+
+
+async def _raices_vivas(grupos: list, eliminados_desde: datetime) -> set:
+    urls = _urls_originales(grupos)
+    return {urls[url] for url in await crud.media_referenciadas(list(urls), eliminados_desde)}
+
+
+async def _borrar(grupos: list, eliminados_desde: datetime) -> list:
+    """
+    Borra un lote de grupos. Primero se vuelven a comprobar las referencias,
+    por si alguno se asoció mientras se recorría el listado; solo los que
+    siguen sin usarse se quitan del índice por contenido (para que una subida
+    idéntica no los reutilice) y se borran. Devuelve los objetos borrados.
+    """
+    vivas = await _raices_vivas(grupos, eliminados_desde)
+    grupos = [g for g in grupos if _raiz(g[0]["key"]) not in vivas]
+    await crud.olvidar_media([o["key"] for g in grupos for o in g])
+    # Una subida idéntica pudo reutilizar alguno justo antes de quitarlo del índice.
+    # Ese se conserva; sin fila en el índice, la próxima subida igual lo vuelve a
+    # escribir con la misma clave y lo registra de nuevo
+    vivas = await _raices_vivas(grupos, eliminados_desde)
+    objetos = [o for g in grupos if _raiz(g[0]["key"]) not in vivas for o in g]
+    await storage.get_storage().delete([o["key"] for o in objetos])
+    return objetos
+
+
+async def recolectar(simulacro: bool = False, gracia: float = None) -> dict:
+    """
+    Recorre el almacenamiento por páginas y borra, por lotes, los objetos que
+    ningún registro usa. Un original y sus variantes se tratan como grupo:
+    se conservan mientras algún registro use el original. Solo se mantiene
+    en memoria una página del listado y el lote en curso. Con
+    `simulacro=True` solo informa qué se borraría.
+    """
+    ahora = datetime.now(timezone.utc)
+    limite_gracia = ahora - timedelta(seconds=MEDIA_GC_GRACE if gracia is None else gracia)
+    # deleted_at se guarda como hora local sin zona
+    eliminados_desde = datetime.now() - timedelta(days=MEDIA_GC_RETENCION_DIAS)
+    backend = storage.get_storage()
+    reporte = {"revisados": 0, "eliminados": 0, "bytes_liberados": 0}
+
+    offset = 0
+    arrastre = {}
+    while True:
+        pagina = await backend.listar(TAMANO_PAGINA_GC, offset)
+        ultima = len(pagina) < TAMANO_PAGINA_GC
+        reporte["revisados"] += len(pagina)
+
+        grupos = arrastre
+        for objeto in pagina:
+            if storage.clave_valida(objeto["key"]):
+                grupos.setdefault(_raiz(objeto["key"]), []).append(objeto)
+        # El último grupo puede seguir en la página siguiente (el listado va por nombre)
+        arrastre = {}
+        if not ultima and pagina and _raiz(pagina[-1]["key"]) in grupos:
+            raiz = _raiz(pagina[-1]["key"])
+            arrastre[raiz] = grupos.pop(raiz)
+
+        vivas = await _raices_vivas(grupos.values(), eliminados_desde)
+        candidatos = [
+            objetos for raiz, objetos in grupos.items()
+            if raiz not in vivas and all(o["actualizado"] < limite_gracia for o in objetos)
+        ]
+
+        borrados = 0
+        lote, en_lote = [], 0
+        for i, objetos in enumerate(candidatos):
+            lote.append(objetos)
+            en_lote += len(objetos)
+            if en_lote < TAMANO_LOTE_GC and i < len(candidatos) - 1:
+                continue
+            eliminados = [o for g in lote for o in g] if simulacro else await _borrar(lote, eliminados_desde)
+            reporte["eliminados"] += len(eliminados)
+            reporte["bytes_liberados"] += sum(o["tamano"] for o in eliminados)
+            borrados += 0 if simulacro else len(eliminados)
+            lote, en_lote = [], 0
+
+        if ultima:
+            break
+        # Todo lo borrado ya estaba listado: la página siguiente se corre hacia atrás
+        offset += len(pagina) - borrados
+    return reporte
+
+
+async def _periodico():
+    while True:
+        await asyncio.sleep(MEDIA_GC_INTERVAL)
+        try:
+            reporte = await recolectar()
+            print(f"GC de media: {reporte}")
+        except Exception as e:
+            print(f"Error en GC de media: {e}")
+
+
+def iniciar():
+    """Programa la recolección periódica (si MEDIA_GC_INTERVAL > 0)."""
+    global _tarea
+    if MEDIA_GC_INTERVAL > 0 and _tarea is None:
+        _tarea = asyncio.create_task(_periodico())
+
+
+async def detener():
+    global _tarea
+    if _tarea is not None:
+        _tarea.cancel()
+        await asyncio.gather(_tarea, return_exceptions=True)
+        _tarea = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Borra del almacenamiento las imágenes que ningún registro usa.")
+    parser.add_argument("--simulacro", action="store_true", help="Solo informa lo que se borraría")
+    parser.add_argument("--gracia", type=float, default=None,
+                        help=f"Segundos de gracia (por defecto {MEDIA_GC_GRACE:g})")
+    args = parser.parse_args()
+
+    reporte = asyncio.run(recolectar(args.simulacro, args.gracia))
+    print(f"Objetos revisados: {reporte['revisados']}")
+    print(f"Objetos {'a eliminar' if args.simulacro else 'eliminados'}: {reporte['eliminados']}")
+    print(f"Bytes liberados: {reporte['bytes_liberados']}")
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import os
+import tempfile
+import uuid
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso en desarrollo, no hace falta bloqueo
+    fcntl = None
+
+from fastapi import UploadFile
+
+import crud
+import storage
+from models import Categoria, Producto, Cliente
+from supabase_utils import MAX_UPLOAD_SIZE, UploadTooLargeError, iter_upload_file, limit_size
+
+# Modo diferido: los formularios de alta responden sin esperar la subida al bucket
+DEFERRED_MEDIA_UPLOADS = os.getenv("DEFERRED_MEDIA_UPLOADS", "false").lower() in ("1", "true", "yes")
+# Directorio donde esperan los archivos hasta que el worker los sube
+MEDIA_SPOOL_DIR = os.getenv("MEDIA_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "tienda_media_spool"))
+MEDIA_UPLOAD_WORKERS = int(os.getenv("MEDIA_UPLOAD_WORKERS", "2"))
+# Intentos por archivo antes de marcarlo como fallido; la espera entre intentos se duplica
+MEDIA_UPLOAD_RETRIES = int(os.getenv("MEDIA_UPLOAD_RETRIES", "5"))
+MEDIA_RETRY_MAX_DELAY = float(os.getenv("MEDIA_RETRY_MAX_DELAY", "300"))
+
+MODELOS = {"categoria": Categoria, "producto": Producto, "cliente": Cliente}
+
+_cola: Optional[asyncio.Queue] = None
+_workers: list = []
+_reintentos: set = set()
+# trabajo_id -> descriptor del .lock bloqueado por este proceso mientras el trabajo es suyo.
+# Con varios workers de uvicorn compartiendo MEDIA_SPOOL_DIR, cada trabajo lo procesa solo
+# el proceso que tiene el bloqueo (se suelta mientras espera un reintento y se vuelve a
+# pedir al procesarlo); si muere, el sistema lo libera y otro lo retoma al arrancar.
+_bloqueos: dict = {}
+# Se llama con (modelo, id, media_url) cuando un archivo queda asociado
+_al_completar: Optional[Callable[..., None]] = None
+
+
+def _ruta(trabajo_id: str, extension: str) -> str:
+    # trabajo_id siempre es un uuid generado por el servidor
+    return os.path.join(MEDIA_SPOOL_DIR, f"{uuid.UUID(trabajo_id)}.{extension}")
+
+
+def _leer_trabajo(trabajo_id: str) -> Optional[dict]:
+    try:
+        with open(_ruta(trabajo_id, "json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _guardar_trabajo(trabajo_id: str, trabajo: dict):
+    temporal = _ruta(trabajo_id, "json.tmp")
+    with open(temporal, "w") as f:
+        json.dump(trabajo, f)
+    os.replace(temporal, _ruta(trabajo_id, "json"))
+
+
+def _reclamar(trabajo_id: str) -> bool:
+    """Bloquea el trabajo para este proceso. False si ya lo tiene otro worker."""
+    if trabajo_id in _bloqueos:
+        return True
+    try:
+        fd = os.open(_ruta(trabajo_id, "lock"), os.O_CREAT | os.O_RDWR, 0o644)
+    except (OSError, ValueError):
+        return False
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+    _bloqueos[trabajo_id] = fd
+    return True
+
+
+def _liberar(trabajo_id: str):
+    fd = _bloqueos.pop(trabajo_id, None)
+    if fd is not None:
+        os.close(fd)
+
+
+def _borrar_trabajo(trabajo_id: str):
+    # El .lock se borra el último y se suelta después: quien lo bloquee luego ya no encuentra el .json
+    for extension in ("json", "bin", "lock"):
+        try:
+            os.remove(_ruta(trabajo_id, extension))
+        except OSError:
+            pass
+    _liberar(trabajo_id)
+
+
+def usar_diferido() -> bool:
+    """Indica si las imágenes de los formularios de alta se deben subir en segundo plano."""
+    return DEFERRED_MEDIA_UPLOADS or storage.circuito.abierto()
+
+
+async def guardar_en_spool(file: UploadFile) -> str:
+    """
+    Copia la imagen del formulario al directorio de spool y devuelve el id
+    del trabajo. Lanza UploadTooLargeError si supera MAX_UPLOAD_SIZE.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise UploadTooLargeError(MAX_UPLOAD_SIZE)
+    os.makedirs(MEDIA_SPOOL_DIR, exist_ok=True)
+    trabajo_id = str(uuid.uuid4())
+    try:
+        with open(_ruta(trabajo_id, "bin"), "wb") as f:
+            async for chunk in limit_size(iter_upload_file(file), MAX_UPLOAD_SIZE):
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        _borrar_trabajo(trabajo_id)
+        raise
+    return trabajo_id
+
+
+def descartar(trabajo_id: str):
+    """Borra un archivo en spool que no llegó a encolarse (p. ej. falló el alta)."""
+    _borrar_trabajo(trabajo_id)
+
+
+def encolar(trabajo_id: str, entidad: str, id: int, filename: Optional[str], content_type: Optional[str]):
+    """Registra el trabajo en disco (sobrevive a reinicios) y lo pone en la cola."""
+    # Se bloquea antes de escribir el .json para que otro worker que arranque no lo tome
+    _reclamar(trabajo_id)
+    _guardar_trabajo(trabajo_id, {
+        "entidad": entidad,
+        "id": id,
+        "filename": filename,
+        "content_type": content_type,
+        "intentos": 0,
+    })
+    if _cola is not None:
+        _cola.put_nowait(trabajo_id)
+
+
+def _reencolar_despues(trabajo_id: str, demora: float):
+    async def esperar():
+        await asyncio.sleep(demora)
+        if _cola is not None:
+            _cola.put_nowait(trabajo_id)
+
+    tarea = asyncio.create_task(esperar())
+    _reintentos.add(tarea)
+    tarea.add_done_callback(_reintentos.discard)
+
+
+def _reintentar(trabajo_id: str, trabajo: dict, demora: float):
+    """Guarda los intentos, suelta el trabajo y lo vuelve a encolar después de `demora` segundos."""
+    _guardar_trabajo(trabajo_id, trabajo)
+    _liberar(trabajo_id)
+    _reencolar_despues(trabajo_id, demora)
+
+
+async def _procesar(trabajo_id: str):
+    # Al reintentar se vuelve a reclamar: mientras esperaba, otro worker pudo tomarlo
+    if not _reclamar(trabajo_id):
+        return
+    trabajo = _leer_trabajo(trabajo_id)
+    if trabajo is None:
+        # Otro worker lo terminó entre el listado del spool y el bloqueo
+        _borrar_trabajo(trabajo_id)
+        return
+    modelo = MODELOS[trabajo["entidad"]]
+
+    # Con el circuito abierto no se gasta un intento: se espera a que se pueda probar de nuevo
+    if storage.circuito.abierto():
+        _reintentar(trabajo_id, trabajo, storage.circuito.segundos_para_probar())
+        return
+
+    try:
+        media_url = await storage.upload_file(_ruta(trabajo_id, "bin"), trabajo["filename"], trabajo["content_type"])
+        completado = await crud.completar_media(modelo, trabajo["id"], media_url)
+    except Exception as e:
+        # Almacenamiento o base de datos: mismo reintento con espera exponencial
+        trabajo["intentos"] += 1
+        if trabajo["intentos"] < MEDIA_UPLOAD_RETRIES:
+            _reintentar(trabajo_id, trabajo, min(MEDIA_RETRY_MAX_DELAY, 2 ** trabajo["intentos"]))
+            return
+        print(f"Subida diferida {trabajo_id} falló definitivamente: {e}")
+        try:
+            await crud.marcar_media_fallida(modelo, trabajo["id"])
+        except Exception as e:
+            # Sin marcarlo el registro quedaría "pending" para siempre
+            print(f"No se pudo marcar la subida {trabajo_id} como fallida: {e}")
+            _reintentar(trabajo_id, trabajo, MEDIA_RETRY_MAX_DELAY)
+            return
+        _borrar_trabajo(trabajo_id)
+        return
+
+    _borrar_trabajo(trabajo_id)
+    if completado and _al_completar:
+        _al_completar(modelo, trabajo["id"], media_url)
+
+
+async def _worker():
+    while True:
+        trabajo_id = await _cola.get()
+        try:
+            await _procesar(trabajo_id)
+        except Exception as e:
+            print(f"Error en subida diferida {trabajo_id}: {e}")
+        finally:
+            _cola.task_done()
+
+
+def iniciar(al_completar: Optional[Callable[..., None]] = None):
+    """
+    Arranca los workers y vuelve a encolar los trabajos que quedaron en el
+    spool (por ejemplo, tras un reinicio) y que no tiene bloqueados otro proceso.
+    """
+    global _cola, _al_completar
+    _al_completar = al_completar
+    _cola = asyncio.Queue()
+    os.makedirs(MEDIA_SPOOL_DIR, exist_ok=True)
+    for nombre in sorted(os.listdir(MEDIA_SPOOL_DIR)):
+        if nombre.endswith(".json") and _reclamar(nombre[:-len(".json")]):
+            _cola.put_nowait(nombre[:-len(".json")])
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(MEDIA_UPLOAD_WORKERS))
+
+
+async def detener():
+    """Cancela los workers; los trabajos pendientes siguen en disco para el próximo arranque."""
+    global _cola
+    for tarea in [*_workers, *_reintentos]:
+        tarea.cancel()
+    await asyncio.gather(*_workers, *_reintentos, return_exceptions=True)
+    _workers.clear()
+    for trabajo_id in list(_bloqueos):
+        _liberar(trabajo_id)
+    _cola = None
@@ -1,4 +1,6 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Column, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from typing import Optional, List
 from datetime import datetime
 
@@ -11,7 +13,11 @@ class Categoria(SQLModel, table=True):
     descripcion: Optional[str] = None
     activa: bool = Field(default=True)
     media_url: Optional[str] = None
-    deleted_at: Optional[datetime] = None
+    # Miniaturas WebP de media_url: {"150": url, "400": url, "1200": url, "placeholder": data_uri}
+    media_variantes: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    # "pending" mientras la imagen se sube en segundo plano, "failed" si no se pudo subir
+    media_status: Optional[str] = None
+    deleted_at: Optional[datetime] = Field(default=None, index=True)
 
     # CORRECCIÓN: Usar "Producto" como string
     productos: List["Producto"] = Relationship(back_populates="categoria")
@@ -34,8 +40,10 @@ class Cliente(SQLModel, table=True):
     ciudad: str
     canal: str
     media_url: Optional[str] = None
+    media_variantes: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    media_status: Optional[str] = None
     creado_en: Optional[datetime] = None
-    deleted_at: Optional[datetime] = None
+    deleted_at: Optional[datetime] = Field(default=None, index=True)
 
     # CORRECCIÓN: Usar "Venta" como string
     ventas: List["Venta"] = Relationship(back_populates="cliente")
@@ -54,10 +62,12 @@ class Producto(SQLModel, table=True):
     precio: float
     stock: int
     activo: bool = Field(default=True) 
-    deleted_at: Optional[datetime] = None
+    deleted_at: Optional[datetime] = Field(default=None, index=True)
     media_url: Optional[str] = None
+    media_variantes: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    media_status: Optional[str] = None
 
-    categoria_id: int = Field(foreign_key="categoria.id")
+    categoria_id: int = Field(foreign_key="categoria.id", index=True)
     
     # CORRECCIÓN DE TU ERROR: Usar "Categoria" como string
     categoria: Optional["Categoria"] = Relationship(back_populates="productos")
@@ -97,7 +107,7 @@ class Compras(SQLModel, table=True):
 
 class Venta(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    fecha_venta: datetime = Field(default_factory=datetime.now)
+    fecha_venta: datetime = Field(default_factory=datetime.now, index=True)
     total: float
     canal_venta: str = Field(default="presencial", description="Tipo de venta: 'presencial' o 'virtual'")
 
@@ -107,3 +117,22 @@ class Venta(SQLModel, table=True):
 
     # CORRECCIÓN: Usar strings
     detalles: List["DetalleVenta"] = Relationship(back_populates="venta")
+
+    # VentaResponse completa (cliente, detalles, productos y categorías) tal
+    # como era al crear la venta; None en ventas anteriores a esta columna
+    snapshot: Optional[dict] = Field(
+        default=None, sa_column=Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"))
+    )
+
+
+# --- Índice de archivos subidos ---
+
+class MediaObjeto(SQLModel, table=True):
+    """Objeto del almacenamiento indexado por el SHA-256 de su contenido"""
+    sha256: str = Field(primary_key=True, max_length=64)
+    key: str = Field(index=True, unique=True)
+    tamano: int
+    content_type: Optional[str] = None
+    # Variantes ya generadas para este contenido (mismo formato que media_variantes)
+    variantes: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    creado_en: datetime = Field(default_factory=datetime.now)
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+from typing import AsyncIterator, Optional
+
+import storage
+from supabase_utils import UploadTooLargeError
+
+# Directorio local donde se guardan las partes de las subidas reanudables
+UPLOADS_DIR = os.getenv("RESUMABLE_UPLOADS_DIR", os.path.join(tempfile.gettempdir(), "tienda_uploads"))
+# Tamaño máximo de un archivo subido por el protocolo reanudable
+MAX_RESUMABLE_SIZE = int(os.getenv("MAX_RESUMABLE_SIZE", str(200 * 1024 * 1024)))
+# Las subidas sin actividad durante este tiempo (segundos) se descartan
+RESUMABLE_EXPIRATION = int(os.getenv("RESUMABLE_EXPIRATION", str(24 * 3600)))
+
+
+class UploadNotFoundError(LookupError):
+    """La subida no existe o ya venció."""
+
+
+class OffsetMismatchError(ValueError):
+    """El Upload-Offset enviado no coincide con lo recibido hasta ahora."""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Upload-Offset no coincide; el servidor tiene {offset} bytes")
+        self.offset = offset
+
+
+# Evita que dos PATCH sobre la misma subida escriban a la vez.
+# upload_id -> [lock, PATCH que lo tienen o lo esperan]; se borra cuando llega a 0
+_locks: dict = {}
+
+
+def _ruta(upload_id: str, extension: str) -> str:
+    # upload_id siempre es un uuid generado por el servidor
+    return os.path.join(UPLOADS_DIR, f"{uuid.UUID(upload_id)}.{extension}")
+
+
+def _leer_meta(upload_id: str) -> dict:
+    try:
+        with open(_ruta(upload_id, "json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        raise UploadNotFoundError(upload_id)
+
+
+def _guardar_meta(upload_id: str, meta: dict):
+    with open(_ruta(upload_id, "json"), "w") as f:
+        json.dump(meta, f)
+
+
+def crear_subida(longitud: int, metadata: Optional[dict] = None) -> str:
+    """
+    Registra una nueva subida reanudable de `longitud` bytes y devuelve su id.
+    `metadata` admite filename, filetype y, opcionalmente, entidad/id para
+    asociar la imagen a un registro al terminar.
+    """
+    if longitud < 0:
+        raise ValueError("Upload-Length inválido")
+    if longitud > MAX_RESUMABLE_SIZE:
+        raise UploadTooLargeError(MAX_RESUMABLE_SIZE)
+
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    limpiar_subidas_vencidas()
+
+    upload_id = str(uuid.uuid4())
+    open(_ruta(upload_id, "part"), "wb").close()
+    _guardar_meta(upload_id, {
+        "longitud": longitud,
+        "metadata": metadata or {},
+        "media_url": None,
+        "actualizado": time.time(),
+    })
+    return upload_id
+
+
+def estado_subida(upload_id: str) -> dict:
+    """Devuelve longitud, offset actual y media_url (si ya terminó) de una subida."""
+    meta = _leer_meta(upload_id)
+    if meta["media_url"] is not None:
+        offset = meta["longitud"]
+    else:
+        offset = os.path.getsize(_ruta(upload_id, "part"))
+    return {"longitud": meta["longitud"], "offset": offset, "media_url": meta["media_url"],
+            "metadata": meta["metadata"]}
+
+
+async def anexar(upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> dict:
+    """
+    Agrega al final de la subida los bytes recibidos a partir de `offset`.
+    Cuando se completa la longitud declarada, el archivo se envía al almacenamiento
+    por bloques y se borra la copia local. Devuelve el estado de la subida.
+    """
+    entrada = _locks.setdefault(upload_id, [asyncio.Lock(), 0])
+    entrada[1] += 1
+    try:
+        async with entrada[0]:
+            await _anexar(upload_id, offset, chunks)
+    finally:
+        # Mientras alguien espere el lock, el siguiente PATCH debe usar el mismo
+        entrada[1] -= 1
+        if entrada[1] == 0:
+            _locks.pop(upload_id, None)
+    return estado_subida(upload_id)
+
+
+async def _anexar(upload_id: str, offset: int, chunks: AsyncIterator[bytes]):
+    meta = _leer_meta(upload_id)
+    ruta = _ruta(upload_id, "part")
+    actual = os.path.getsize(ruta)
+    if meta["media_url"] is not None or offset != actual:
+        raise OffsetMismatchError(actual)
+
+    with open(ruta, "ab") as f:
+        async for chunk in chunks:
+            actual += len(chunk)
+            if actual > meta["longitud"]:
+                raise UploadTooLargeError(meta["longitud"])
+            await asyncio.to_thread(f.write, chunk)
+
+    meta["actualizado"] = time.time()
+    if actual == meta["longitud"]:
+        metadata = meta["metadata"]
+        meta["media_url"] = await storage.upload_file(
+            ruta,
+            metadata.get("filename") or "archivo.bin",
+            metadata.get("filetype"),
+            max_size=meta["longitud"],
+        )
+        os.remove(ruta)
+    _guardar_meta(upload_id, meta)
+
+
+def limpiar_subidas_vencidas():
+    """Borra las subidas sin actividad durante más de RESUMABLE_EXPIRATION segundos."""
+    limite = time.time() - RESUMABLE_EXPIRATION
+    try:
+        nombres = os.listdir(UPLOADS_DIR)
+    except FileNotFoundError:
+        return
+    for nombre in nombres:
+        if not nombre.endswith(".json"):
+            continue
+        upload_id = nombre[:-len(".json")]
+        try:
+            if _leer_meta(upload_id)["actualizado"] >= limite:
+                continue
+        except (UploadNotFoundError, ValueError, KeyError):
+            pass
+        for extension in ("json", "part"):
+            try:
+                os.remove(os.path.join(UPLOADS_DIR, f"{upload_id}.{extension}"))
+            except OSError:
+                pass
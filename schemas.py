@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, conint, constr
-from typing import Optional, List
+from pydantic import BaseModel, Field, conint, constr, model_validator
+from typing import Optional, List, Literal
 from datetime import datetime
 
 # =======================================================================
@@ -27,6 +27,10 @@ class CategoriaResponse(CategoriaBase):
     """Esquema de respuesta que incluye ID"""
     id: int
     media_url: Optional[str] = None
+    # Miniaturas WebP: {"150": url, "400": url, "1200": url, "placeholder": data_uri}
+    media_variantes: Optional[dict] = None
+    # "pending" mientras la imagen se sube en segundo plano
+    media_status: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -65,6 +69,8 @@ class ProductoResponse(ProductoBase):
     """Esquema de respuesta de producto con ID y categoría"""
     id: int
     categoria: Optional[CategoriaResponse] = None
+    media_variantes: Optional[dict] = None
+    media_status: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -93,6 +99,8 @@ class ClienteUpdate(BaseModel):
 class ClienteResponse(ClienteBase):
     """Esquema de respuesta de cliente"""
     id: int
+    media_variantes: Optional[dict] = None
+    media_status: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -144,13 +152,49 @@ class VentaResponse(VentaBase):
     class Config:
         from_attributes = True
 
+# =======================================================================
+# Esquemas de Compras (reabastecimiento)
+# =======================================================================
+
+class CompraLinea(BaseModel):
+    """Línea de una orden de compra"""
+    producto_id: int
+    cantidad: conint(gt=0)
+    # Si no se indica se usa el precio actual del producto
+    precio_unitario: Optional[float] = Field(None, gt=0)
+    cliente_id: Optional[int] = None
+
+class CompraLote(BaseModel):
+    """Lote de líneas de compra que se registra en una sola transacción"""
+    cliente_id: Optional[int] = None
+    fecha: Optional[datetime] = None
+    lineas: List[CompraLinea] = Field(min_length=1, max_length=10000)
+
+class ResultadoCompras(BaseModel):
+    """Resumen de un lote de compras registrado"""
+    lineas: int
+    total: float
+    productos_actualizados: int
+
 # =======================================================================
 # Esquemas de Respuesta Agregados / Eliminados
 # =======================================================================
 
+class ProductoEnCategoria(ProductoBase):
+    """Producto dentro de una categoría (sin repetir la categoría)"""
+    id: int
+    media_thumb: Optional[str] = None
+    media_placeholder: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
 class CategoriaConProductos(CategoriaResponse):
-    """Devuelve la categoría con todos sus productos"""
-    productos: List[ProductoResponse] = []
+    """Devuelve la categoría con una página de sus productos"""
+    productos: List[ProductoEnCategoria] = []
+    # Cursor opaco para pedir la siguiente página; None si no hay más
+    next_cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -166,11 +210,183 @@ class ProductoListResponse(BaseModel):
     categoria_id: int
     categoria: str # Nombre de la categoría
     media_url: Optional[str] = None # Añadido para consistencia
+    # Miniatura de 150 px y placeholder borroso (None hasta que se generan)
+    media_thumb: Optional[str] = None
+    media_placeholder: Optional[str] = None
+    media_status: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class ProductoBatchResponse(BaseModel):
+    """Productos en el orden pedido; None donde el id no existe"""
+    productos: List[Optional[ProductoListResponse]] = []
+    no_encontrados: List[int] = []
+
+
+class ClienteBatchResponse(BaseModel):
+    """Clientes en el orden pedido; None donde el id no existe"""
+    clientes: List[Optional[ClienteResponse]] = []
+    no_encontrados: List[int] = []
+
+
+class ProductoPatch(ProductoUpdate):
+    """Cambio de un producto dentro de una actualización masiva"""
+    id: int
+
+
+class ExpresionNumerica(BaseModel):
+    """Nuevo valor de una columna numérica: fijo, multiplicado o sumado"""
+    op: constr(pattern=r"^(set|multiplicar|sumar)$") = "set"
+    valor: float
+
+
+class ProductoFiltro(BaseModel):
+    """Filtros de productos (los mismos de GET /productos/)"""
+    id: Optional[int] = None
+    nombre: Optional[str] = None
+    precio: Optional[float] = None
+    precio_min: Optional[float] = None
+    precio_max: Optional[float] = None
+    categoria_id: Optional[int] = None
+    stock: Optional[int] = None
+    stock_min: Optional[int] = None
+    stock_max: Optional[int] = None
+    activo: Optional[bool] = None
+
+
+MAX_PATCHES_MASIVOS = 5000
+
+class ProductoBulkUpdate(BaseModel):
+    """
+    Actualización masiva de productos. Se usa `patches` (cambios por id) o
+    `filtro` junto con los cambios a aplicar a todos los que coincidan.
+    """
+    patches: Optional[List[ProductoPatch]] = None
+    filtro: Optional[ProductoFiltro] = None
+    precio: Optional[ExpresionNumerica] = None
+    stock: Optional[ExpresionNumerica] = None
+    activo: Optional[bool] = None
+    categoria_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def validar_modo(self):
+        cambios = (self.precio, self.stock, self.activo, self.categoria_id)
+        if (self.patches is None) == (self.filtro is None):
+            raise ValueError("Debe indicar 'patches' o 'filtro', pero no ambos")
+        if self.patches is not None:
+            if any(c is not None for c in cambios):
+                raise ValueError("Con 'patches' los cambios van dentro de cada patch")
+            if len(self.patches) > MAX_PATCHES_MASIVOS:
+                raise ValueError(f"Máximo {MAX_PATCHES_MASIVOS} patches por petición")
+            return self
+        if not self.filtro.model_dump(exclude_none=True):
+            raise ValueError("El filtro no puede estar vacío")
+        if all(c is None for c in cambios):
+            raise ValueError("Debe indicar al menos un cambio")
+        if self.precio is not None:
+            if self.precio.op in ("set", "multiplicar") and self.precio.valor <= 0:
+                raise ValueError("El precio resultante debe ser mayor que 0")
+        if self.stock is not None:
+            if self.stock.op != "multiplicar" and not float(self.stock.valor).is_integer():
+                raise ValueError("El stock debe ser un número entero")
+            if self.stock.op in ("set", "multiplicar") and self.stock.valor < 0:
+                raise ValueError("El stock no puede ser negativo")
+        return self
+
+
+class ResultadoMasivo(BaseModel):
+    """Resultado de una operación masiva"""
+    actualizados: int
+
+
+class ResultadoInventario(BaseModel):
+    """Reporte de una importación de conteo de inventario"""
+    modo: str
+    actualizados: int
+    no_encontrados: List[int] = []
+    eliminados: List[int] = []
+    # Ajustes relativos que dejarían el stock en negativo (no se aplican)
+    stock_negativo: List[int] = []
+
+
+MAX_IDS_MASIVOS = 5000
+
+def _validar_seleccion(ids: Optional[List[int]], filtro: Optional[BaseModel]):
+    if (ids is None) == (filtro is None):
+        raise ValueError("Debe indicar 'ids' o 'filtro', pero no ambos")
+    if ids is not None and not ids:
+        raise ValueError("La lista de ids no puede estar vacía")
+    if ids is not None and len(ids) > MAX_IDS_MASIVOS:
+        raise ValueError(f"Máximo {MAX_IDS_MASIVOS} ids por petición")
+    if filtro is not None and not filtro.model_dump(exclude_none=True):
+        raise ValueError("El filtro no puede estar vacío")
+
+
+class ProductoSeleccion(BaseModel):
+    """Productos sobre los que aplicar una operación masiva: por ids o por filtro"""
+    ids: Optional[List[int]] = None
+    filtro: Optional[ProductoFiltro] = None
+
+    @model_validator(mode="after")
+    def validar_seleccion(self):
+        _validar_seleccion(self.ids, self.filtro)
+        return self
+
+
+class ClienteFiltro(BaseModel):
+    """Filtros de clientes (los mismos de GET /clientes/)"""
+    nombre: Optional[str] = None
+    ciudad: Optional[str] = None
+    canal: Optional[str] = None
+
+
+class ClienteSeleccion(BaseModel):
+    """Clientes sobre los que aplicar una operación masiva: por ids o por filtro"""
+    ids: Optional[List[int]] = None
+    filtro: Optional[ClienteFiltro] = None
+
+    @model_validator(mode="after")
+    def validar_seleccion(self):
+        _validar_seleccion(self.ids, self.filtro)
+        return self
+
+
+class ResultadoIds(BaseModel):
+    """Ids afectados por una operación masiva"""
+    ids: List[int]
+
+
+EntidadMedia = Literal["categoria", "producto", "cliente"]
+
+class SubidaFirmadaCreate(BaseModel):
+    """Pide una URL firmada para subir una imagen directo al almacenamiento"""
+    entidad: EntidadMedia
+    filename: constr(min_length=1, max_length=255)
+    content_type: Optional[str] = None
+
+class SubidaFirmadaResponse(BaseModel):
+    key: str
+    upload_url: str
+    method: str = "PUT"
+    # Headers que el cliente debe enviar junto con el archivo
+    headers: dict = {}
+    # Se devuelve tal cual en POST /media/finalizar
+    token: str
+
+class SubidaFinalizar(BaseModel):
+    """Asocia al registro la imagen ya subida con la URL firmada"""
+    entidad: EntidadMedia
+    id: int
+    key: str
+    # El token que devolvió POST /media/firmar para esta key
+    token: str
+
+class SubidaFinalizada(BaseModel):
+    media_url: str
+
+
 class RestarStock(BaseModel):
     cantidad: conint(gt=0)
 
@@ -194,4 +410,18 @@ class ProductoEliminado(BaseModel):
     media_url: Optional[str] = None # Añadido para consistencia
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ClienteEliminado(ClienteResponse):
+    deleted_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class HistorialResponse(BaseModel):
+    """Página combinada del historial de eliminados"""
+    categorias: List[CategoriaEliminada] = []
+    productos: List[ProductoEliminado] = []
+    clientes: List[ClienteEliminado] = []
+    # Cursor opaco para pedir la siguiente página; None si no hay más
+    next_cursor: Optional[str] = None
@@ -30,10 +30,14 @@ document.addEventListener("DOMContentLoaded", () => {
         productos.forEach(producto => {
             const productoDiv = document.createElement('div');
             productoDiv.classList.add('result-item');
+            // Placeholder borroso mientras carga la miniatura
+            const placeholder = producto.media_placeholder
+                ? ` background-image:url(${producto.media_placeholder}); background-size:cover;`
+                : '';
 
             productoDiv.innerHTML = `
                 <h3>${producto.nombre} ${producto.activo ? '' : '(Inactivo)'} (ID: ${producto.id})</h3>
-                <img src="${producto.media_url || '/static/img/no-image.png'}" alt="${producto.nombre}" style="max-width:150px; max-height:150px;" />
+                <img src="${producto.media_thumb || producto.media_url || '/static/img/no-image.png'}" alt="${producto.nombre}" loading="lazy" style="max-width:150px; max-height:150px;${placeholder}" />
                 <p><strong>Descripción:</strong> ${producto.descripcion || 'N/A'}</p>
                 <p><strong>Precio:</strong> $${producto.precio.toFixed(2)}</p>
                 <p><strong>Stock:</strong> ${producto.stock}</p>
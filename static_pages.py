@@ -0,0 +1,62 @@
+"""
+Páginas HTML sin datos dinámicos. Se renderizan una vez al arrancar y se
+sirven desde memoria, con ETag y el cuerpo ya comprimido en gzip/brotli.
+"""
+import hashlib
+from typing import Optional
+
+import compression
+
+# Plantillas que se renderizan sin contexto (los formularios POST siguen
+# usando create.html con mensajes, pero la página GET es siempre la misma)
+PAGINAS = (
+    "index.html",
+    "developer-info.html",
+    "planning.html",
+    "design.html",
+    "informacion-del-proyecto.html",
+    "historial.html",
+    "charts.html",
+    "categorias/create.html",
+    "categorias/read.html",
+    "categorias/delete.html",
+    "productos/create.html",
+    "productos/read.html",
+    "productos/delete.html",
+    "clientes/create.html",
+    "clientes/read.html",
+    "clientes/delete.html",
+    "ventas/create.html",
+)
+
+# nombre -> {"etag": str, "identity": bytes, "gzip": bytes, "br": bytes}
+_paginas: dict = {}
+
+
+def _renderizar(templates, nombre: str) -> dict:
+    html = templates.get_template(nombre).render().encode()
+    return {
+        "etag": f'"{hashlib.sha256(html).hexdigest()[:32]}"',
+        "identity": html,
+        **compression.precomprimir(html),
+    }
+
+
+def renderizar_todas(templates):
+    """Renderiza y comprime todas las PAGINAS (se llama al arrancar)."""
+    for nombre in PAGINAS:
+        _paginas[nombre] = _renderizar(templates, nombre)
+
+
+def obtener(templates, nombre: str) -> dict:
+    """Página ya renderizada; si aún no lo está (p. ej. antes del arranque) se renderiza ahora."""
+    pagina = _paginas.get(nombre)
+    if pagina is None:
+        pagina = _paginas[nombre] = _renderizar(templates, nombre)
+    return pagina
+
+
+def cuerpo(pagina: dict, accept_encoding: Optional[str]) -> tuple:
+    """(codificación o None, bytes) según lo que acepta el cliente."""
+    codificacion = compression.elegir(accept_encoding, [c for c in pagina if c not in ("etag", "identity")])
+    return codificacion, pagina[codificacion or "identity"]
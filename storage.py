@@ -0,0 +1,504 @@
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
+import os
+import re
+import secrets
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from urllib.parse import quote, unquote
+
+from fastapi import UploadFile
+
+import crud
+import image_variants
+import supabase_utils
+from supabase_utils import MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE, UploadTooLargeError, iter_upload_file, limit_size
+
+# "supabase" (por defecto) o "local" para guardar los archivos en un directorio
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+BUCKET_NAME = os.getenv("STORAGE_BUCKET", "Tienda")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "media")
+# Vigencia (segundos) de las URLs firmadas de subida
+SIGNED_UPLOAD_EXPIRATION = int(os.getenv("SIGNED_UPLOAD_EXPIRATION", "600"))
+# Firma las claves entregadas por POST /media/firmar (y las URLs de LocalStorage).
+# Con varios workers debe estar definida: si no, cada proceso genera la suya
+SIGNING_SECRET = (os.getenv("STORAGE_SIGNING_SECRET") or secrets.token_hex(32)).encode()
+# Fallos seguidos del almacenamiento que abren el circuito, y segundos que permanece abierto
+STORAGE_FAILURE_THRESHOLD = int(os.getenv("STORAGE_FAILURE_THRESHOLD", "5"))
+STORAGE_RESET_TIMEOUT = float(os.getenv("STORAGE_RESET_TIMEOUT", "30"))
+# Tiempo máximo (segundos) de una subida al almacenamiento
+STORAGE_UPLOAD_TIMEOUT = float(os.getenv("STORAGE_UPLOAD_TIMEOUT", "60"))
+# Procesos dedicados a generar variantes de imagen
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Claves generadas por el servidor: uuid (subidas firmadas) o SHA-256 del
+# contenido, más la extensión; las variantes agregan .w{ancho}
+_KEY_RE = re.compile(
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{64})"
+    r"(\.w[0-9]{1,4})?\.[A-Za-z0-9]{1,10}$"
+)
+
+
+class StorageUnavailableError(RuntimeError):
+    """El circuito está abierto: el almacenamiento falló varias veces seguidas."""
+
+
+class CircuitBreaker:
+    """
+    Corta las llamadas al almacenamiento después de `umbral` fallos seguidos
+    durante `espera` segundos; luego deja pasar una llamada de prueba
+    (semiabierto) y, si funciona, vuelve a cerrarse.
+    """
+
+    def __init__(self, umbral: int = STORAGE_FAILURE_THRESHOLD, espera: float = STORAGE_RESET_TIMEOUT):
+        self.umbral = umbral
+        self.espera = espera
+        self.fallos = 0
+        self.abierto_desde: Optional[float] = None
+        self._probando = False
+
+    def abierto(self) -> bool:
+        """True mientras no se aceptan llamadas (ni siquiera la de prueba)."""
+        if self.abierto_desde is None:
+            return False
+        return self._probando or time.monotonic() - self.abierto_desde < self.espera
+
+    def segundos_para_probar(self) -> float:
+        if self.abierto_desde is None:
+            return 0.0
+        return max(1.0, self.espera - (time.monotonic() - self.abierto_desde))
+
+    async def llamar(self, funcion: Callable[[], Awaitable]):
+        """Ejecuta `funcion()` registrando el resultado. Lanza StorageUnavailableError si está abierto."""
+        if self.abierto():
+            raise StorageUnavailableError("Almacenamiento no disponible, intente más tarde")
+        self._probando = self.abierto_desde is not None
+        try:
+            resultado = await funcion()
+        except UploadTooLargeError:
+            # Error del cliente, no del almacenamiento
+            self._probando = False
+            raise
+        except Exception:
+            self.fallos += 1
+            if self._probando or self.fallos >= self.umbral:
+                self.abierto_desde = time.monotonic()
+            self._probando = False
+            raise
+        self.fallos = 0
+        self.abierto_desde = None
+        self._probando = False
+        return resultado
+
+
+circuito = CircuitBreaker()
+
+
+def _extension(filename: Optional[str]) -> str:
+    extension = filename.rsplit(".", 1)[-1] if filename and "." in filename else "bin"
+    return (re.sub(r"[^A-Za-z0-9]", "", extension)[:10] or "bin").lower()
+
+
+def nueva_clave(filename: Optional[str]) -> str:
+    """Genera una clave única para un objeto conservando la extensión del archivo."""
+    return f"{uuid.uuid4()}.{_extension(filename)}"
+
+
+def clave_contenido(sha256: str, filename: Optional[str]) -> str:
+    """Clave de un objeto direccionado por contenido: el mismo archivo siempre tiene la misma clave."""
+    return f"{sha256}.{_extension(filename)}"
+
+
+def clave_valida(key: str) -> bool:
+    """Indica si `key` tiene el formato de las claves generadas por el servidor."""
+    return bool(_KEY_RE.match(key or ""))
+
+
+def firmar_clave(key: str, entidad: str) -> str:
+    """Token que POST /media/finalizar exige para asociar `key` a un registro de `entidad`."""
+    return hmac.new(SIGNING_SECRET, f"finalizar:{entidad}:{key}".encode(), hashlib.sha256).hexdigest()
+
+
+def verificar_clave(key: str, entidad: str, token: str) -> bool:
+    """Indica si `token` es el que se entregó junto con `key` al firmar la subida."""
+    return hmac.compare_digest(firmar_clave(key, entidad), token or "")
+
+
+def etag(key: str) -> str:
+    """ETag de un objeto: su clave sin extensión, que es el hash del contenido (o un uuid inmutable)."""
+    return f'"{key.rsplit(".", 1)[0]}"'
+
+
+async def leer_archivo(ruta: str) -> AsyncIterator[bytes]:
+    """Lee un archivo local por bloques sin bloquear el event loop."""
+    with open(ruta, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE):
+            yield chunk
+
+
+class StorageBackend(ABC):
+    """Interfaz común de los almacenamientos de imágenes."""
+
+    @abstractmethod
+    async def upload(self, key: str, chunks: AsyncIterator[bytes], content_type: Optional[str] = None):
+        ...
+
+    @abstractmethod
+    def download(self, key: str) -> AsyncIterator[bytes]:
+        """Lee el contenido de un objeto por bloques."""
+
+    @abstractmethod
+    def public_url(self, key: str) -> str:
+        ...
+
+    def key_from_url(self, url: Optional[str]) -> Optional[str]:
+        """Clave del objeto al que apunta `url`, o None si no es de este almacenamiento."""
+        prefijo = self.public_url("")
+        if not url or not url.startswith(prefijo):
+            return None
+        # Las URLs guardadas por el cliente de supabase-py pueden terminar en "?"
+        key = unquote(url[len(prefijo):].split("?", 1)[0])
+        return key if clave_valida(key) else None
+
+    @abstractmethod
+    async def create_signed_upload(self, key: str, content_type: Optional[str] = None) -> dict:
+        """Devuelve {"url", "method", "headers"} para que el cliente suba el archivo directamente."""
+
+    @abstractmethod
+    async def size(self, key: str) -> Optional[int]:
+        """Tamaño del objeto en bytes, o None si no existe."""
+
+    @abstractmethod
+    async def delete(self, keys: list):
+        ...
+
+    @abstractmethod
+    async def listar(self, limite: int, offset: int = 0) -> list:
+        """
+        Una página de objetos ordenados por clave:
+        [{"key": str, "tamano": int, "actualizado": datetime (UTC)}, ...]
+        """
+
+
+class SupabaseStorage(StorageBackend):
+    """Bucket de Supabase Storage accedido por su API REST."""
+
+    def __init__(self, bucket: str = BUCKET_NAME):
+        self.bucket = bucket
+
+    async def upload(self, key, chunks, content_type=None):
+        await supabase_utils.put_object(key, chunks, content_type, self.bucket)
+
+    def download(self, key):
+        return supabase_utils.get_object(key, self.bucket)
+
+    def public_url(self, key):
+        return supabase_utils.get_public_url(key, self.bucket)
+
+    async def create_signed_upload(self, key, content_type=None):
+        url = await supabase_utils.create_signed_upload_url(key, self.bucket)
+        return {"url": url, "method": "PUT",
+                "headers": {"Content-Type": content_type or "application/octet-stream"}}
+
+    async def size(self, key):
+        return await supabase_utils.object_size(key, self.bucket)
+
+    async def delete(self, keys):
+        if keys:
+            await supabase_utils.delete_objects(keys, self.bucket)
+
+    async def listar(self, limite, offset=0):
+        objetos = []
+        for item in await supabase_utils.list_objects(limite, offset, self.bucket):
+            if item.get("id") is None:
+                # Las "carpetas" no tienen id
+                continue
+            actualizado = item.get("updated_at") or item.get("created_at")
+            fecha = datetime.fromisoformat(actualizado.replace("Z", "+00:00")) if actualizado else None
+            objetos.append({
+                "key": item["name"],
+                "tamano": int((item.get("metadata") or {}).get("size") or 0),
+                # Sin fecha se asume recién creado, así nunca se borra por error
+                "actualizado": (fecha.replace(tzinfo=fecha.tzinfo or timezone.utc) if fecha
+                                else datetime.now(timezone.utc)),
+            })
+        return objetos
+
+
+class LocalStorage(StorageBackend):
+    """
+    Directorio local que reemplaza al bucket (desarrollo y pruebas). Los
+    archivos se sirven en /media/local/ y las subidas firmadas llegan a
+    PUT /media/local/upload/{key} con un token HMAC.
+    """
+
+    def __init__(self, directory: str = LOCAL_STORAGE_DIR, secret: Optional[str] = None):
+        self.directory = directory
+        self.secret = secret.encode() if secret else SIGNING_SECRET
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        if not clave_valida(key):
+            raise ValueError("Clave de objeto inválida")
+        return os.path.join(self.directory, key)
+
+    async def upload(self, key, chunks, content_type=None, reemplazar: bool = True):
+        """Con reemplazar=False lanza FileExistsError si `key` ya existe (no la sobrescribe)."""
+        ruta = self.path(key)
+        if not reemplazar and os.path.exists(ruta):
+            raise FileExistsError(key)
+        temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temporal, "wb") as f:
+                async for chunk in chunks:
+                    await asyncio.to_thread(f.write, chunk)
+            if reemplazar:
+                os.replace(temporal, ruta)
+            else:
+                # link falla si ya existe: de dos subidas simultáneas solo gana una
+                os.link(temporal, ruta)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def download(self, key):
+        return leer_archivo(self.path(key))
+
+    def public_url(self, key):
+        return f"/media/local/{quote(key)}"
+
+    def firmar(self, key: str, expira: int) -> str:
+        return hmac.new(self.secret, f"{key}:{expira}".encode(), hashlib.sha256).hexdigest()
+
+    def verificar_firma(self, key: str, expira: int, token: str) -> bool:
+        return expira >= time.time() and hmac.compare_digest(self.firmar(key, expira), token or "")
+
+    async def create_signed_upload(self, key, content_type=None):
+        expira = int(time.time()) + SIGNED_UPLOAD_EXPIRATION
+        url = f"/media/local/upload/{quote(key)}?expira={expira}&token={self.firmar(key, expira)}"
+        return {"url": url, "method": "PUT",
+                "headers": {"Content-Type": content_type or "application/octet-stream"}}
+
+    async def size(self, key):
+        try:
+            return os.path.getsize(self.path(key))
+        except (OSError, ValueError):
+            return None
+
+    async def delete(self, keys):
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except (OSError, ValueError):
+                pass
+
+    async def listar(self, limite, offset=0):
+        def leer():
+            nombres = sorted(n for n in os.listdir(self.directory) if not n.endswith(".tmp"))
+            objetos = []
+            for nombre in nombres[offset:offset + limite]:
+                try:
+                    info = os.stat(os.path.join(self.directory, nombre))
+                except OSError:
+                    continue
+                objetos.append({"key": nombre, "tamano": info.st_size,
+                                "actualizado": datetime.fromtimestamp(info.st_mtime, timezone.utc)})
+            return objetos
+        return await asyncio.to_thread(leer)
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """Devuelve el almacenamiento configurado con STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        _storage = LocalStorage() if STORAGE_BACKEND == "local" else SupabaseStorage()
+    return _storage
+
+
+def set_storage(backend: StorageBackend):
+    """Reemplaza el almacenamiento en uso (por ejemplo, un LocalStorage en pruebas)."""
+    global _storage
+    _storage = backend
+
+
+async def _hash_contenido(chunks: AsyncIterator[bytes], max_size: int, destino=None):
+    """SHA-256 y tamaño de un flujo; si se indica `destino`, también copia los bytes ahí."""
+    sha = hashlib.sha256()
+    tamano = 0
+    async for chunk in limit_size(chunks, max_size):
+        sha.update(chunk)
+        tamano += len(chunk)
+        if destino is not None:
+            await asyncio.to_thread(destino.write, chunk)
+    return sha.hexdigest(), tamano
+
+
+async def _subir_contenido(
+    abrir: Callable[[], AsyncIterator[bytes]],
+    sha256: str,
+    tamano: int,
+    filename: Optional[str],
+    content_type: Optional[str],
+) -> str:
+    """
+    Sube el contenido con clave `{sha256}.ext` salvo que ya exista un objeto
+    con el mismo hash, en cuyo caso se reutiliza sin volver a subirlo.
+    `abrir()` devuelve un iterador nuevo sobre los bytes ya verificados.
+    """
+    storage = get_storage()
+    existente = await crud.obtener_media_por_hash(sha256)
+    if existente is not None:
+        return storage.public_url(existente.key)
+
+    key = clave_contenido(sha256, filename)
+    try:
+        await circuito.llamar(
+            lambda: asyncio.wait_for(storage.upload(key, abrir(), content_type), STORAGE_UPLOAD_TIMEOUT)
+        )
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"La subida de {key} superó {STORAGE_UPLOAD_TIMEOUT:g} s")
+    await crud.registrar_media(sha256, key, tamano, content_type)
+    return storage.public_url(key)
+
+
+async def upload_file(
+    ruta: str,
+    filename: Optional[str],
+    content_type: Optional[str] = None,
+    max_size: int = MAX_UPLOAD_SIZE,
+) -> str:
+    """Sube un archivo local (deduplicado por contenido) y devuelve su URL pública."""
+    sha256, tamano = await _hash_contenido(leer_archivo(ruta), max_size)
+    return await _subir_contenido(lambda: leer_archivo(ruta), sha256, tamano, filename, content_type)
+
+
+async def upload_stream(
+    chunks: AsyncIterator[bytes],
+    filename: Optional[str],
+    content_type: Optional[str] = None,
+    max_size: int = MAX_UPLOAD_SIZE,
+) -> str:
+    """
+    Sube un flujo de bytes y devuelve su URL pública. El flujo se copia a un
+    archivo temporal mientras se calcula su hash, y solo se sube si el
+    contenido no está ya en el almacenamiento.
+    """
+    fd, ruta = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            sha256, tamano = await _hash_contenido(chunks, max_size, destino=f)
+        return await _subir_contenido(lambda: leer_archivo(ruta), sha256, tamano, filename, content_type)
+    finally:
+        os.remove(ruta)
+
+
+async def upload_image(file: UploadFile) -> str:
+    """
+    Sube la imagen de un formulario por bloques y devuelve su URL pública.
+    Si ya se subió una imagen idéntica, se reutiliza. Lanza
+    UploadTooLargeError si supera MAX_UPLOAD_SIZE.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise UploadTooLargeError(MAX_UPLOAD_SIZE)
+
+    # El formulario ya está en un archivo temporal: se lee una vez para el
+    # hash y otra, solo si hace falta, para subirlo
+    async def abrir():
+        await file.seek(0)
+        async for chunk in iter_upload_file(file):
+            yield chunk
+
+    sha256, tamano = await _hash_contenido(abrir(), MAX_UPLOAD_SIZE)
+    return await _subir_contenido(abrir, sha256, tamano, file.filename, file.content_type)
+
+
+# -----------------------------------------------------------------------
+#                 Variantes de imagen (miniaturas WebP)
+# -----------------------------------------------------------------------
+
+_image_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    """
+    Pool de procesos para el trabajo de Pillow. Usa "spawn" para que los hijos
+    no hereden los hilos ni las conexiones abiertas del proceso principal.
+    """
+    global _image_executor
+    if _image_executor is None:
+        _image_executor = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _image_executor
+
+
+def close_image_executor():
+    """Detiene el pool de procesos (al apagar la aplicación)."""
+    global _image_executor
+    if _image_executor is not None:
+        _image_executor.shutdown(wait=False, cancel_futures=True)
+        _image_executor = None
+
+
+async def _un_bloque(datos: bytes) -> AsyncIterator[bytes]:
+    yield datos
+
+
+async def descargar_temporal(key: str) -> str:
+    """Copia un objeto a un archivo temporal y devuelve su ruta (el llamador lo borra)."""
+    fd, ruta = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in get_storage().download(key):
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        os.remove(ruta)
+        raise
+    return ruta
+
+
+async def generar_variantes(media_url: Optional[str]) -> Optional[dict]:
+    """
+    Genera y sube las variantes WebP de la imagen en `media_url`. Devuelve
+    {"150": url, "400": url, "1200": url, "placeholder": data_uri}, o None si
+    Pillow no está instalado o la URL no pertenece al almacenamiento.
+    """
+    storage = get_storage()
+    key = storage.key_from_url(media_url)
+    if key is None or not image_variants.disponible():
+        return None
+    indexado = await crud.obtener_media_por_key(key)
+    if indexado is not None and indexado.variantes:
+        return indexado.variantes
+
+    ruta = await descargar_temporal(key)
+    try:
+        loop = asyncio.get_running_loop()
+        resultado = await loop.run_in_executor(get_image_executor(), image_variants.generar, ruta)
+    finally:
+        os.remove(ruta)
+
+    base = key.rsplit(".", 1)[0]
+    urls = {}
+    for ancho, datos in resultado["variantes"].items():
+        variante = f"{base}.w{ancho}.webp"
+        await storage.upload(variante, _un_bloque(datos), "image/webp")
+        urls[str(ancho)] = storage.public_url(variante)
+    # Anchos mayores que el original usan la variante más grande generada
+    mayor = urls[str(max(resultado["variantes"]))]
+    for ancho in image_variants.VARIANT_WIDTHS:
+        urls.setdefault(str(ancho), mayor)
+    urls["placeholder"] = resultado["placeholder"]
+    if indexado is not None:
+        await crud.guardar_variantes_media(key, urls)
+    return urls
@@ -1,42 +1,204 @@
+import asyncio
 import os
-from supabase import create_client, Client
 from fastapi import UploadFile
-import uuid
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+
+# supabase and httpx are imported on first use: importing this module (and
+# therefore the app) stays cheap and works without credentials.
+if TYPE_CHECKING:
+    import httpx
+    from supabase import Client
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Maximum number of uploads in flight per worker. Extra uploads wait for a slot
+# instead of opening more connections to the bucket.
+MAX_CONCURRENT_UPLOADS = int(os.getenv("MAX_CONCURRENT_UPLOADS", "8"))
+
+# Uploads are streamed to the bucket in chunks of this size, so a single
+# upload never holds more than one chunk in memory.
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+# Maximum accepted size of an image sent through the form endpoints.
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))
+
+_upload_semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+_http_client: Optional["httpx.AsyncClient"] = None
+_supabase_client: Optional["Client"] = None
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload goes over the configured maximum size."""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File exceeds the maximum allowed size of {max_size} bytes")
+        self.max_size = max_size
+
+
+def get_supabase_client() -> "Client":
+    """Returns the supabase-py client, created on first use."""
+    global _supabase_client
+    if _supabase_client is None:
+        _check_configured()
+        from supabase import create_client
+        _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase_client
+
 
-# --------------------------------------------------------------------------
-# ¡CAMBIO AQUÍ! bucket_name ahora es "tienda"
-# --------------------------------------------------------------------------
-async def upload_image_to_supabase(file: UploadFile, bucket_name: str = "Tienda") -> str:
+def __getattr__(name: str):
+    # `supabase_utils.supabase` keeps working, but the client is built lazily
+    if name == "supabase":
+        return get_supabase_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_http_client() -> "httpx.AsyncClient":
     """
-    Uploads an image file to the Supabase storage bucket and returns the public URL.
+    Returns the shared async HTTP client for the Supabase Storage API.
+    Created on first use so every upload reuses the same keep-alive pool.
     """
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.AsyncClient(
+            base_url=f"{SUPABASE_URL}/storage/v1",
+            headers={"Authorization": f"Bearer {SUPABASE_KEY}", "apikey": SUPABASE_KEY},
+            limits=httpx.Limits(
+                max_connections=MAX_CONCURRENT_UPLOADS,
+                max_keepalive_connections=MAX_CONCURRENT_UPLOADS,
+            ),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Closes the shared HTTP client (called on application shutdown)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _check_configured():
     if not SUPABASE_URL or not SUPABASE_KEY:
         # Aunque esto es una buena práctica, asumo que ya lo revisaste
         raise ValueError("Supabase URL or Key not configured in environment variables")
 
-    file_extension = file.filename.split(".")[-1]
-    # Generate unique filename using UUID
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
 
-    # Read file content
-    file_content = await file.read()
+def get_public_url(path: str, bucket_name: str = "Tienda") -> str:
+    """Builds the public URL of an object locally, without calling the API."""
+    return f"{SUPABASE_URL}/storage/v1/object/public/{bucket_name}/{path}"
+
+
+async def limit_size(chunks: AsyncIterator[bytes], max_size: int) -> AsyncIterator[bytes]:
+    """Passes chunks through, raising UploadTooLargeError as soon as max_size is exceeded."""
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+        if total > max_size:
+            raise UploadTooLargeError(max_size)
+        yield chunk
+
 
-    # Upload file to Supabase bucket
+async def iter_upload_file(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Reads an UploadFile in chunks of chunk_size bytes."""
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+async def put_object(
+    path: str,
+    chunks: AsyncIterator[bytes],
+    content_type: Optional[str] = None,
+    bucket_name: str = "Tienda",
+):
+    """
+    Streams chunks to `path` in the bucket with chunked transfer encoding.
+    At most MAX_CONCURRENT_UPLOADS run at the same time per worker.
+    """
+    _check_configured()
+    import httpx
+    async with _upload_semaphore:
+        try:
+            response = await get_http_client().post(
+                f"/object/{bucket_name}/{path}",
+                content=chunks,
+                # Content-addressed keys may already exist: overwrite with the same bytes
+                headers={"Content-Type": content_type or "application/octet-stream", "x-upsert": "true"},
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Failed to upload file to Supabase: {e}")
+
+
+async def create_signed_upload_url(path: str, bucket_name: str = "Tienda") -> str:
+    """
+    Asks Storage for a signed URL that lets a client PUT `path` directly into
+    the bucket, without the bytes going through the API.
+    """
+    _check_configured()
+    import httpx
     try:
-        response = supabase.storage.from_(bucket_name).upload(unique_filename, file_content)
-    except Exception as e:
-        raise RuntimeError(f"Failed to upload file to Supabase: {e}")
+        response = await get_http_client().post(f"/object/upload/sign/{bucket_name}/{path}")
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"Failed to create signed upload URL: {e}")
+    return f"{SUPABASE_URL}/storage/v1{response.json()['url']}"
 
-    # No need to check for error in response since upload raises exceptions on failure
 
-    # Get public URL (returns string)
-    public_url = supabase.storage.from_(bucket_name).get_public_url(unique_filename)
-    if not public_url:
-        raise RuntimeError("Failed to get public URL after upload")
+async def object_size(path: str, bucket_name: str = "Tienda") -> Optional[int]:
+    """Returns the size in bytes of an object, or None if it does not exist."""
+    _check_configured()
+    import httpx
+    try:
+        response = await get_http_client().head(f"/object/{bucket_name}/{path}")
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"Failed to stat object in Supabase: {e}")
+    if response.status_code in (400, 404):
+        return None
+    response.raise_for_status()
+    return int(response.headers.get("Content-Length", 0))
 
-    return public_url
+
+async def delete_objects(paths: list, bucket_name: str = "Tienda"):
+    """Deletes several objects from the bucket in one request."""
+    _check_configured()
+    import httpx
+    try:
+        response = await get_http_client().request(
+            "DELETE", f"/object/{bucket_name}", json={"prefixes": paths}
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"Failed to delete objects from Supabase: {e}")
+
+
+async def get_object(path: str, bucket_name: str = "Tienda") -> AsyncIterator[bytes]:
+    """Streams the content of an object from the bucket in chunks."""
+    _check_configured()
+    import httpx
+    try:
+        async with get_http_client().stream("GET", f"/object/{bucket_name}/{path}") as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(UPLOAD_CHUNK_SIZE):
+                yield chunk
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"Failed to download object from Supabase: {e}")
+
+
+async def list_objects(limit: int, offset: int = 0, bucket_name: str = "Tienda") -> list:
+    """Lists one page of objects at the root of the bucket, sorted by name."""
+    _check_configured()
+    import httpx
+    try:
+        response = await get_http_client().post(f"/object/list/{bucket_name}", json={
+            "prefix": "",
+            "limit": limit,
+            "offset": offset,
+            "sortBy": {"column": "name", "order": "asc"},
+        })
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"Failed to list objects in Supabase: {e}")
+    return response.json()
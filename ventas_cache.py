@@ -0,0 +1,36 @@
+"""
+Caché en memoria de ventas ya serializadas. Una venta no cambia después de
+creada (crud.py no tiene ninguna forma de modificarla), así que su bloque
+HTML de /ventas/read y su JSON de GET /ventas/{id} se generan una sola vez.
+Es una LRU por worker limitada en bytes.
+"""
+import os
+from collections import OrderedDict
+from typing import Optional
+
+# Bytes máximos de fragmentos guardados; al superarlos se descartan los usados hace más tiempo
+VENTAS_CACHE_MAX_BYTES = int(os.getenv("VENTAS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# (tipo, id de venta) -> bytes, del usado hace más tiempo al más reciente
+_lru: "OrderedDict[tuple, bytes]" = OrderedDict()
+_total = 0
+
+
+def obtener(tipo: str, id: int) -> Optional[bytes]:
+    """Fragmento `tipo` ("html" o "json") de la venta `id`, o None si no está."""
+    datos = _lru.get((tipo, id))
+    if datos is not None:
+        _lru.move_to_end((tipo, id))
+    return datos
+
+
+def guardar(tipo: str, id: int, datos: bytes):
+    """Guarda un fragmento y descarta los más antiguos si se supera el límite."""
+    global _total
+    if len(datos) > VENTAS_CACHE_MAX_BYTES:
+        return
+    _total += len(datos) - len(_lru.pop((tipo, id), b""))
+    _lru[(tipo, id)] = datos
+    while _total > VENTAS_CACHE_MAX_BYTES:
+        _, viejo = _lru.popitem(last=False)
+        _total -= len(viejo)
@@ -0,0 +1,82 @@
+"""
+Precalentamiento de cada worker al arrancar: abre las DB_POOL_SIZE
+conexiones del pool, compila y prepara en ellas las consultas más usadas
+(crud.precalentar) y carga las plantillas Jinja. Corre en segundo plano y
+GET /ready responde 503 hasta que termina, para que el balanceador no envíe
+tráfico a un worker en frío durante un despliegue.
+"""
+import asyncio
+import os
+import time
+from contextlib import AsyncExitStack
+from typing import Optional
+
+import crud
+from database import async_engine
+
+# Espera (segundos) antes de reintentar si la base de datos no responde
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", "5"))
+
+_tarea: Optional[asyncio.Task] = None
+_listo = False
+_duracion: Optional[float] = None
+_error: Optional[str] = None
+
+
+def listo() -> bool:
+    return _listo
+
+
+def estado() -> dict:
+    """Estado para el endpoint de readiness."""
+    return {
+        "status": "ready" if _listo else "warming",
+        "duracion_ms": None if _duracion is None else round(_duracion * 1000, 1),
+        "error": _error,
+    }
+
+
+def _cargar_plantillas(templates):
+    # get_template compila la plantilla y la deja en la caché del Environment
+    for nombre in templates.env.list_templates():
+        templates.env.get_template(nombre)
+
+
+async def _abrir_pool():
+    """Abre a la vez todas las conexiones del pool y precalienta cada una."""
+    tamano = async_engine.pool.size() if hasattr(async_engine.pool, "size") else 1
+    async with AsyncExitStack() as pila:
+        conexiones = [await pila.enter_async_context(async_engine.connect()) for _ in range(tamano)]
+        await asyncio.gather(*(crud.precalentar(conn) for conn in conexiones))
+
+
+async def _precalentar(templates):
+    global _listo, _duracion, _error
+    inicio = time.perf_counter()
+    await asyncio.to_thread(_cargar_plantillas, templates)
+    while True:
+        try:
+            await _abrir_pool()
+            break
+        except Exception as e:
+            _error = str(e)
+            print(f"Error precalentando la base de datos, reintento en {WARMUP_RETRY_DELAY:g}s: {e}")
+            await asyncio.sleep(WARMUP_RETRY_DELAY)
+    _duracion = time.perf_counter() - inicio
+    _error = None
+    _listo = True
+
+
+def iniciar(templates):
+    """Lanza el precalentamiento en segundo plano."""
+    global _tarea
+    if _tarea is None:
+        _tarea = asyncio.create_task(_precalentar(templates))
+
+
+async def detener():
+    global _tarea
+    if _tarea is not None:
+        _tarea.cancel()
+        await asyncio.gather(_tarea, return_exceptions=True)
+        _tarea = None